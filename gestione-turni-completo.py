@@ -56,6 +56,14 @@ class GestioneTurni:
             if os.path.exists('dati_turni.json'):
                 with open('dati_turni.json', 'r') as f:
                     dati = json.load(f)
+                    if 'formato' in dati or os.path.exists('dati_turni.giornale'):
+                        # Ferie a intervalli e giornale delle modifiche: file gestito solo da
+                        # gestione-turni-modificato.py. Leggerlo (e poi riscriverlo) qui perderebbe dati.
+                        messagebox.showerror("Formato Non Supportato",
+                                             "dati_turni.json è stato salvato da gestione-turni-modificato.py "
+                                             "in un formato che questa versione non supporta.\n"
+                                             "Usare gestione-turni-modificato.py.")
+                        raise SystemExit(1)
                     self.addetti = dati.get('addetti', {})
                     self.turni_disponibili = dati.get('turni', [])
         except Exception as e:
@@ -1,22 +1,180 @@
+import time
+# Istante di avvio del modulo: riferimento per la diagnostica dei tempi di avvio
+INIZIO_AVVIO = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import calendar
 # import random # Non più usato direttamente nella nuova logica, ma potrebbe servire altrove
 import json
 import os
-import openpyxl
-from openpyxl.styles import PatternFill, Alignment, Font, Border, Side
-from openpyxl.utils import get_column_letter
+import csv
+import bisect
+from array import array
+import sqlite3
+import importlib
+import importlib.util
 import traceback # Import aggiunto per debug dettagliato
+import sys
+import subprocess
+import threading
+import queue
+import copy
+import contextlib
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Secondi entro cui la finestra principale deve essere pronta (verificato con --diagnostica-avvio)
+BUDGET_AVVIO_S = 1.5
+# Secondi spesi nelle importazioni rinviate, per modulo (compilato da _ModuloPigro)
+TEMPI_IMPORTAZIONE_PIGRA = {}
+
+
+class _ModuloPigro:
+    """
+    Modulo importato alla prima lettura di un suo attributo, non all'avvio: pandas, numpy,
+    openpyxl e pyarrow servono solo per statistiche, importazioni ed esportazioni e da soli
+    pesano più di metà del tempo di avvio. `sottomoduli` vengono importati insieme al modulo.
+    """
+    def __init__(self, nome, sottomoduli=()):
+        self._nome = nome
+        self._sottomoduli = sottomoduli
+        self._modulo = None
+
+    def __getattr__(self, attributo):
+        if self._modulo is None:
+            inizio = time.perf_counter()
+            modulo = importlib.import_module(self._nome)
+            for sottomodulo in self._sottomoduli:
+                importlib.import_module(f"{self._nome}.{sottomodulo}")
+            TEMPI_IMPORTAZIONE_PIGRA[self._nome] = time.perf_counter() - inizio
+            self._modulo = modulo
+        return getattr(self._modulo, attributo)
+
+
+pd = _ModuloPigro('pandas')
+np = _ModuloPigro('numpy')
+openpyxl = _ModuloPigro('openpyxl', sottomoduli=('styles', 'cell', 'utils', 'formatting.rule'))
+# Opzionale: necessario solo per l'esportazione in formato Parquet
+PYARROW_DISPONIBILE = importlib.util.find_spec('pyarrow') is not None
+pa = _ModuloPigro('pyarrow')
+pq = _ModuloPigro('pyarrow.parquet')
+
+
+# Colonne del formato "lungo" usato dagli esportatori tabellari (CSV, JSON Lines, Parquet)
+COLONNE_FORMATO_LUNGO = ('data', 'addetto', 'stato', 'inizio_min', 'fine_min', 'ore')
+
+
+def _schema_parquet_formato_lungo():
+    """Schema Parquet del formato "lungo" (costruito alla prima esportazione: pyarrow è importato solo allora)."""
+    return pa.schema([
+        ('data', pa.date32()), ('addetto', pa.string()), ('stato', pa.string()),
+        ('inizio_min', pa.int16()), ('fine_min', pa.int16()), ('ore', pa.float64())])
+
+# Ampiezza delle fasce della matrice di copertura (heatmap)
+MINUTI_FASCIA_COPERTURA = 15
+
+# Cartella dei dati dell'applicazione: quella dello script, non la cartella di lavoro corrente
+CARTELLA_DATI = os.path.dirname(os.path.abspath(__file__))
+
+# Attesa dopo l'ultima modifica prima di riscrivere dati_turni.json: più modifiche ravvicinate = una scrittura
+RITARDO_SALVATAGGIO_MS = 500
+# Giornale delle modifiche: voci oltre le quali si compatta in una nuova istantanea, livelli di annulla
+SOGLIA_COMPATTAZIONE_GIORNALE = 50
+MAX_ANNULLAMENTI = 50
+# Formato di dati_turni.json: ferie come intervalli [inizio, fine], istantanea da completare con
+# le voci di dati_turni.giornale successive a 'sequenza_giornale'. I file senza 'formato' sono del
+# formato precedente (ferie come singole date, nessun giornale) e vengono convertiti al caricamento.
+FORMATO_DATI = 'dati-turni-v2'
+
+# Importazione da CSV/Excel: colonne riconosciute per ogni tipo di tabella (intestazioni senza
+# distinzione di maiuscole, spazi come '_'), nell'ordine in cui le tabelle vengono applicate
+COLONNE_IMPORTAZIONE = {
+    'addetti': {'nome': ('nome', 'addetto', 'dipendente'), 'ore_contratto': ('ore_contratto',),
+                'ore_max': ('ore_max', 'ore_massime'), 'straordinario': ('straordinario',),
+                'giorni_riposo': ('giorni_riposo', 'riposi', 'riposo')},
+    'turni': {'inizio': ('inizio', 'ora_inizio'), 'fine': ('fine', 'ora_fine')},
+    'ferie': {'nome': ('nome', 'addetto', 'dipendente'), 'dal': ('dal', 'data_inizio', 'data'),
+              'al': ('al', 'data_fine')},
+}
+COLONNE_OBBLIGATORIE_IMPORTAZIONE = {'addetti': ('nome', 'ore_contratto', 'ore_max'),
+                                     'turni': ('inizio', 'fine'), 'ferie': ('nome', 'dal')}
+
+
+class GenerazioneAnnullata(Exception):
+    """Sollevata quando l'utente annulla una generazione in corso."""
+    pass
+
+
+class ConflittoArchivio(Exception):
+    """Sollevata quando l'archivio SQLite è stato modificato da un'altra istanza dall'ultima lettura."""
+    pass
+
 
 class GestioneTurni:
     def __init__(self):
         """Inizializzazione dell'applicazione"""
+        # Tempi delle fasi di avvio in secondi (vedi --diagnostica-avvio)
+        self.tempi_avvio = {'moduli': time.perf_counter() - INIZIO_AVVIO}
+        self._inizializza_parametri()
+
+        # Carica i dati se esistono
+        inizio = time.perf_counter()
+        self.carica_dati()
+        self.tempi_avvio['dati'] = time.perf_counter() - inizio
+
+        # Creazione della finestra principale
+        inizio = time.perf_counter()
+        self.root = tk.Tk()
+        self.root.title("Gestione Turni Supermercato")
+        self.root.geometry("800x600") # Dimensione iniziale
+        self.root.protocol("WM_DELETE_WINDOW", self.chiudi_applicazione)
+
+        # Creazione del menu principale
+        self.crea_menu_principale()
+        self.tempi_avvio['finestra'] = time.perf_counter() - inizio
+
+    @classmethod
+    def motore_senza_interfaccia(cls, configurazione):
+        """
+        Crea un'istanza senza finestra Tk, usata come motore di calcolo nei processi
+        di lavoro. `configurazione` è un dizionario semplice (serializzabile) con
+        'addetti', 'turni' e, opzionalmente, 'orario_apertura', 'orario_chiusura',
+        'giorni_festivi', 'riposo_minimo_ore', 'indisponibilita', 'turni_altrove' e
+        'ferie_archiviate' ({anno: {addetto: intervalli}} degli anni archiviati).
+        """
+        motore = cls.__new__(cls)
+        motore._inizializza_parametri()
+        motore.root = None
+        motore.addetti = copy.deepcopy(configurazione.get('addetti', {}))
+        motore.turni_disponibili = copy.deepcopy(configurazione.get('turni', []))
+        motore.orario_apertura = configurazione.get('orario_apertura', motore.orario_apertura)
+        motore.orario_chiusura = configurazione.get('orario_chiusura', motore.orario_chiusura)
+        motore.giorni_festivi = list(configurazione.get('giorni_festivi', motore.giorni_festivi))
+        motore.riposo_minimo_ore = configurazione.get('riposo_minimo_ore', motore.riposo_minimo_ore)
+        motore.indisponibilita = {nome: set(date) for nome, date in configurazione.get('indisponibilita', {}).items()}
+        motore.turni_altrove = copy.deepcopy(configurazione.get('turni_altrove', {}))
+        motore.cartella_archivio_ferie = None
+        motore._cache_ferie_archiviate = copy.deepcopy(configurazione.get('ferie_archiviate', {}))
+        return motore
+
+    def _inizializza_parametri(self):
+        """Imposta i parametri di default (dati vuoti, festività, orari, colori)"""
         # Inizializzazione delle variabili principali
         self.addetti = {}  # Dizionario per memorizzare i dati degli addetti
         self.turni_disponibili = []  # Lista dei turni disponibili
+        # Negozi (opzionale): {nome: {'orario_apertura', 'orario_chiusura', 'turni', 'addetti': [nomi]}}
+        # Se vuoto si usa un unico negozio con gli orari e i turni qui sopra.
+        self.negozi = {}
+        # Date (YYYY-MM-DD) in cui un addetto non è disponibile per motivi esterni
+        # (es. già impegnato in un altro negozio): {nome: set(date)}
+        self.indisponibilita = {}
+        # Turni già svolti in altri negozi, per il riposo minimo: {nome: {data: [inizio, fine]}}
+        self.turni_altrove = {}
+        # Versione dei dati: incrementata a ogni salvataggio, invalida le cache derivate
+        self._versione_dati = 0
+        self._cache_indice_copertura = {}
         # Lista festività - potrebbe essere resa configurabile
         self.giorni_festivi = [
             "01-01",  # Capodanno
@@ -37,6 +195,9 @@ class GestioneTurni:
         self.orario_apertura = "08:00"
         self.orario_chiusura = "21:00"
 
+        # Ore minime di riposo tra la fine di un turno e l'inizio del successivo
+        self.riposo_minimo_ore = 11
+
         # Colori per Excel
         self.colori = {
             'header': 'CCE5FF',     # Azzurro chiaro per header
@@ -46,50 +207,816 @@ class GestioneTurni:
             'riposo': 'F2F2F2',     # Grigio chiaro per riposi
             'ferie': 'FFFF99',      # Giallo chiaro per ferie
             'festivo': 'FF9999',    # Rosso chiaro per festivi
-            'errore': 'FF0000'      # Rosso per errori/copertura incompleta
+            'errore': 'FF0000',     # Rosso per errori/copertura incompleta
+            'modificato': 'FFC000'  # Ambra per celle cambiate nel confronto tra pianificazioni
         }
 
-        # Carica i dati se esistono
-        self.carica_dati()
-
-        # Creazione della finestra principale
-        self.root = tk.Tk()
-        self.root.title("Gestione Turni Supermercato")
-        self.root.geometry("800x600") # Dimensione iniziale
-
-        # Creazione del menu principale
-        self.crea_menu_principale()
+        # File dei dati: JSON (predefinito) oppure archivio SQLite, se il file .db esiste
+        self.cartella_dati = CARTELLA_DATI
+        self.file_dati = os.path.join(self.cartella_dati, 'dati_turni.json')
+        self.file_database = os.path.join(self.cartella_dati, 'dati_turni.db')
+        self.archivio = None
+        self.root = None
+        # Giornale append-only delle modifiche (con il JSON; con SQLite è una tabella dell'archivio).
+        # _registrato: i dati com'erano all'ultima voce registrata, per calcolare la modifica successiva.
+        self.file_giornale = os.path.join(self.cartella_dati, 'dati_turni.giornale')
+        self._giornale = None
+        self._registrato = {'addetti': {}, 'turni': [], 'negozi': {}}
+        self._sequenza_giornale = 0   # Ultima voce scritta nel giornale su file
+        self._sequenza_istantanea = 0 # Ultima voce già compresa in dati_turni.json
+        self._pila_annulla = []
+        self._pila_ripristina = []
+        self._osservatori_dati = []   # Funzioni di aggiornamento delle finestre aperte (dopo annulla/ripristina)
+        # Compattazione differita del JSON: timer Tk in attesa e thread di scrittura (creato alla prima)
+        self._salvataggio_programmato = None
+        self._scrittore_dati = None
+        self._sequenza_in_scrittura = 0
+
+        # Ferie degli anni passati archiviate in file separati (uno per anno), letti solo se servono
+        self.cartella_archivio_ferie = os.path.join(self.cartella_dati, 'archivio_ferie')
+        self._cache_ferie_archiviate = {}
+
+        # Modello Excel personalizzabile (se il file non esiste si usa quello predefinito)
+        self.file_modello_excel = os.path.join(self.cartella_dati, 'modello_turni.xlsx')
+        self._cache_modello_excel = None
+
+        # Indice persistente dei riepiloghi dei file turni salvati (statistiche)
+        self.file_indice_statistiche = os.path.join(self.cartella_dati, 'indice_statistiche.json')
+        self._indice_statistiche = None
 
     def carica_dati(self):
-        """Carica i dati salvati se esistono"""
+        """
+        Carica i dati salvati se esistono: dall'archivio SQLite se presente, altrimenti
+        dall'ultima istantanea dati_turni.json più le modifiche successive del giornale.
+        """
         try:
-            if os.path.exists('dati_turni.json'):
-                with open('dati_turni.json', 'r', encoding='utf-8') as f:
-                    dati = json.load(f)
-                    self.addetti = dati.get('addetti', {})
-                    # Assicura che ferie e riposi siano liste
-                    for nome, info in self.addetti.items():
-                         info['ferie'] = info.get('ferie', [])
-                         info['giorni_riposo'] = info.get('giorni_riposo', [])
-                    self.turni_disponibili = dati.get('turni', [])
+            voci_giornale = []
+            if os.path.exists(self.file_database):
+                self.archivio = ArchivioSQLite(self.file_database)
+                self.addetti, self.turni_disponibili, self.negozi = self.archivio.carica()
+                voci_giornale = self.archivio.leggi_giornale(4 * MAX_ANNULLAMENTI)
+            else:
+                file_dati = self.file_dati
+                if not os.path.exists(file_dati) and os.path.exists('dati_turni.json'):
+                    # Compatibilità: dati salvati nella cartella di lavoro dalle versioni precedenti
+                    file_dati = os.path.abspath('dati_turni.json')
+                if os.path.exists(file_dati):
+                    with open(file_dati, 'r', encoding='utf-8') as f:
+                        dati = json.load(f)
+                        if dati.get('formato', FORMATO_DATI) != FORMATO_DATI:
+                            raise ValueError(f"formato '{dati['formato']}' non riconosciuto (creato da una versione più recente?)")
+                        self.addetti = dati.get('addetti', {})
+                        self.turni_disponibili = dati.get('turni', [])
+                        self.negozi = dati.get('negozi', {})
+                        self._sequenza_istantanea = dati.get('sequenza_giornale', 0)
+                # Riapplica le modifiche registrate dopo l'istantanea
+                self._giornale = GiornaleModifiche(self.file_giornale)
+                voci_giornale = self._giornale.leggi()
+                for voce in voci_giornale:
+                    if voce['seq'] > self._sequenza_istantanea:
+                        self._applica_modifiche(voce['modifiche'], 'dopo')
+                self._sequenza_giornale = max([self._sequenza_istantanea] + [voce['seq'] for voce in voci_giornale])
+                if self._giornale.righe_scartate: # Riga troncata da un'interruzione: riscrive il giornale pulito
+                    print(f"Avviso: {self._giornale.righe_scartate} righe illeggibili ignorate nel giornale delle modifiche")
+                    self._giornale.compatta(0)
+            # Ferie come intervalli ordinati (converte anche il vecchio formato a date singole), riposi come lista
+            for nome, info in self.addetti.items():
+                 info['ferie'] = self._intervalli_ferie(info.get('ferie', []))
+                 info['giorni_riposo'] = info.get('giorni_riposo', [])
+            for nome_negozio, negozio in self.negozi.items():
+                negozio['addetti'] = [n for n in negozio.get('addetti', []) if n in self.addetti]
+            self._registrato = self._copia_dati_registrabili()
+            self._ricostruisci_pile_annulla(voci_giornale)
             print("Dati caricati con successo.")
         except Exception as e:
             print(f"Errore nel caricamento dei dati: {e}")
-            messagebox.showerror("Errore Caricamento", f"Impossibile caricare i dati da dati_turni.json.\n{e}")
+            origine = self.file_database if self.archivio is not None else self.file_dati
+            messagebox.showerror("Errore Caricamento", f"Impossibile caricare i dati da {origine}.\n{e}")
+
+    def salva_dati(self, cambiati=None):
+        """
+        Salva le modifiche fatte ai dati dall'ultimo salvataggio, registrandole come una voce
+        del giornale (annullabile). `cambiati` elenca gli elementi modificati, come coppie
+        ('addetto', nome), ('negozio', nome) o ('turni', None): vengono confrontati e copiati
+        solo quelli, quindi il costo dipende dalla modifica e non dalla quantità di dati.
+        Senza `cambiati` si confrontano tutti gli elementi.
+        Con l'archivio SQLite la voce e le righe cambiate vanno in un'unica transazione; con il
+        JSON la voce viene aggiunta al giornale e dati_turni.json viene riscritto solo ogni
+        SOGLIA_COMPATTAZIONE_GIORNALE voci, in background (compattazione).
+        """
+        self._registra_modifiche('modifica', cambiati=cambiati)
 
-    def salva_dati(self):
-        """Salva i dati su file"""
+    def _copia_dati_registrabili(self):
+        """Copia profonda dei dati tracciati dal giornale (addetti, turni, negozi)."""
+        return {'addetti': copy.deepcopy(self.addetti),
+                'turni': [list(turno) for turno in self.turni_disponibili],
+                'negozi': copy.deepcopy(self.negozi)}
+
+    @staticmethod
+    def _chiavi_modifiche(modifiche):
+        """Elementi ('tipo', nome) toccati da una lista di modifiche (vedi _modifiche_dal_registrato)."""
+        return [(modifica['tipo'], modifica['nome']) for modifica in modifiche]
+
+    def _modifiche_dal_registrato(self, cambiati=None):
+        """
+        Elementi cambiati rispetto all'ultima voce registrata, come lista di
+        {'tipo': 'addetto'|'negozio'|'turni', 'nome', 'prima', 'dopo'} (None = assente).
+        Con `cambiati` (coppie ('tipo', nome)) si confrontano solo quegli elementi.
+        """
+        if cambiati is None:
+            cambiati = ([('addetto', nome) for nome in sorted(self._registrato['addetti'].keys() | self.addetti.keys())]
+                        + [('negozio', nome) for nome in sorted(self._registrato['negozi'].keys() | self.negozi.keys())]
+                        + [('turni', None)])
+        modifiche = []
+        for tipo, nome in dict.fromkeys(cambiati): # Senza ripetizioni, nell'ordine dato
+            if tipo == 'turni':
+                turni = [list(turno) for turno in self.turni_disponibili]
+                if turni != self._registrato['turni']:
+                    modifiche.append({'tipo': 'turni', 'nome': None, 'prima': copy.deepcopy(self._registrato['turni']), 'dopo': turni})
+                continue
+            registrati, correnti = ((self._registrato['addetti'], self.addetti) if tipo == 'addetto'
+                                    else (self._registrato['negozi'], self.negozi))
+            prima, dopo = registrati.get(nome), correnti.get(nome)
+            if prima != dopo:
+                modifiche.append({'tipo': tipo, 'nome': nome, 'prima': copy.deepcopy(prima), 'dopo': copy.deepcopy(dopo)})
+        return modifiche
+
+    def _aggiorna_registrato(self, modifiche):
+        """Porta la copia dei dati registrati al valore 'dopo' delle sole modifiche appena registrate."""
+        for modifica in modifiche:
+            valore = copy.deepcopy(modifica['dopo'])
+            if modifica['tipo'] == 'turni':
+                self._registrato['turni'] = valore
+                continue
+            registrati = self._registrato['addetti' if modifica['tipo'] == 'addetto' else 'negozi']
+            if valore is None:
+                registrati.pop(modifica['nome'], None)
+            else:
+                registrati[modifica['nome']] = valore
+
+    def _applica_modifiche(self, modifiche, lato):
+        """Porta i dati al valore `lato` ('prima' o 'dopo') di ciascuna modifica."""
+        for modifica in modifiche:
+            valore = copy.deepcopy(modifica[lato])
+            if modifica['tipo'] == 'turni':
+                self.turni_disponibili = valore
+                continue
+            dati = self.addetti if modifica['tipo'] == 'addetto' else self.negozi
+            if valore is None:
+                dati.pop(modifica['nome'], None)
+            else:
+                dati[modifica['nome']] = valore
+
+    def _registra_modifiche(self, azione, riferimento=None, cambiati=None):
+        """
+        Registra nel giornale le modifiche correnti come voce `azione` ('modifica', 'annulla'
+        o 'ripristina' della voce `riferimento`, 'archiviazione' delle ferie: non annullabile).
+        `cambiati` limita il confronto agli elementi indicati (vedi salva_dati).
+        Restituisce la voce, o None se non c'era nulla da registrare o la scrittura è fallita
+        (le modifiche restano da salvare).
+        """
+        self._versione_dati += 1 # I dati sono cambiati: le cache derivate vanno ricalcolate
+        modifiche = self._modifiche_dal_registrato(cambiati)
+        if not modifiche:
+            return None
+        voce = {'seq': None, 'ora': datetime.now().isoformat(timespec='seconds'), 'azione': azione, 'modifiche': modifiche}
+        if riferimento is not None:
+            voce['rif'] = riferimento
+        destinazione = self.file_database if self.archivio is not None else self.file_giornale
         try:
-            dati = {
-                'addetti': self.addetti,
-                'turni': self.turni_disponibili
-            }
-            with open('dati_turni.json', 'w', encoding='utf-8') as f:
-                json.dump(dati, f, indent=4) # indent=4 per leggibilità
+            if self.archivio is not None:
+                try:
+                    self.archivio.sincronizza(self.addetti, self.turni_disponibili, self.negozi, voce,
+                                              self._chiavi_modifiche(modifiche))
+                except ConflittoArchivio as e:
+                    print(f"Conflitto nel salvataggio dei dati: {e}")
+                    self._ricarica_archivio()
+                    messagebox.showwarning("Dati Modificati Altrove",
+                                           f"{e}\n\nI dati sono stati ricaricati dall'archivio e la modifica "
+                                           f"({self._descrizione_voce(voce)}) non è stata salvata: ripeterla se serve.")
+                    return None
+            else:
+                if self._giornale is None:
+                    self._giornale = GiornaleModifiche(self.file_giornale)
+                voce['seq'] = self._sequenza_giornale + 1
+                self._giornale.aggiungi(voce)
+                self._sequenza_giornale = voce['seq']
             print("Dati salvati con successo.")
         except Exception as e:
             print(f"Errore nel salvataggio dei dati: {e}")
-            messagebox.showerror("Errore Salvataggio", f"Impossibile salvare i dati su dati_turni.json.\n{e}")
+            messagebox.showerror("Errore Salvataggio", f"Impossibile salvare i dati su {destinazione}.\n{e}")
+            return None
+        self._aggiorna_registrato(modifiche)
+        if azione == 'modifica':
+            self._pila_annulla = (self._pila_annulla + [voce])[-MAX_ANNULLAMENTI:]
+            self._pila_ripristina = []
+        elif azione == 'archiviazione':
+            self._pila_annulla, self._pila_ripristina = [], []
+        if self.archivio is not None:
+            if voce['seq'] % SOGLIA_COMPATTAZIONE_GIORNALE == 0:
+                self.archivio.compatta_giornale(4 * MAX_ANNULLAMENTI)
+        elif self._sequenza_giornale - self._sequenza_istantanea >= SOGLIA_COMPATTAZIONE_GIORNALE:
+            self._programma_compattazione()
+        self._aggiorna_comandi_annulla()
+        return voce
+
+    def _ricarica_archivio(self):
+        """
+        Rilegge i dati dall'archivio SQLite dopo un conflitto con un'altra istanza:
+        le modifiche non salvate vengono scartate e le finestre aperte aggiornate.
+        """
+        self.addetti, self.turni_disponibili, self.negozi = self.archivio.carica()
+        for negozio in self.negozi.values():
+            negozio['addetti'] = [n for n in negozio.get('addetti', []) if n in self.addetti]
+        self._registrato = self._copia_dati_registrabili()
+        self._ricostruisci_pile_annulla(self.archivio.leggi_giornale(4 * MAX_ANNULLAMENTI))
+        self._aggiorna_comandi_annulla()
+        self._notifica_dati_cambiati()
+
+    def _ricostruisci_pile_annulla(self, voci):
+        """Ricostruisce le pile annulla/ripristina ripercorrendo le voci del giornale."""
+        self._pila_annulla, self._pila_ripristina = [], []
+        for voce in voci:
+            if voce['azione'] == 'modifica':
+                self._pila_annulla.append(voce)
+                self._pila_ripristina = []
+            elif voce['azione'] == 'archiviazione':
+                self._pila_annulla, self._pila_ripristina = [], []
+            elif voce['azione'] == 'annulla' and self._pila_annulla and self._pila_annulla[-1]['seq'] == voce.get('rif'):
+                self._pila_ripristina.append(self._pila_annulla.pop())
+            elif voce['azione'] == 'ripristina' and self._pila_ripristina and self._pila_ripristina[-1]['seq'] == voce.get('rif'):
+                self._pila_annulla.append(self._pila_ripristina.pop())
+        self._pila_annulla = self._pila_annulla[-MAX_ANNULLAMENTI:]
+
+    def annulla_modifica(self, event=None):
+        """Annulla l'ultima modifica salvata (riporta gli elementi cambiati al valore precedente)."""
+        if not self._pila_annulla:
+            return
+        voce = self._pila_annulla.pop()
+        self._applica_modifiche(voce['modifiche'], 'prima')
+        cambiati = self._chiavi_modifiche(voce['modifiche'])
+        if self._registra_modifiche('annulla', voce['seq'], cambiati) is not None:
+            self._pila_ripristina.append(voce)
+        elif self._modifiche_dal_registrato(cambiati):
+            # Scrittura fallita: si torna ai dati salvati e la voce resta da annullare
+            self._applica_modifiche(voce['modifiche'], 'dopo')
+            self._pila_annulla.append(voce)
+        # Altrimenti non c'era nulla da annullare, o i dati e le pile sono stati ricaricati dall'archivio
+        self._aggiorna_comandi_annulla()
+        self._notifica_dati_cambiati()
+
+    def ripristina_modifica(self, event=None):
+        """Ripete l'ultima modifica annullata."""
+        if not self._pila_ripristina:
+            return
+        voce = self._pila_ripristina.pop()
+        self._applica_modifiche(voce['modifiche'], 'dopo')
+        cambiati = self._chiavi_modifiche(voce['modifiche'])
+        if self._registra_modifiche('ripristina', voce['seq'], cambiati) is not None:
+            self._pila_annulla.append(voce)
+        elif self._modifiche_dal_registrato(cambiati):
+            # Scrittura fallita: si torna ai dati salvati e la voce resta da ripristinare
+            self._applica_modifiche(voce['modifiche'], 'prima')
+            self._pila_ripristina.append(voce)
+        # Altrimenti non c'era nulla da ripristinare, o i dati e le pile sono stati ricaricati dall'archivio
+        self._aggiorna_comandi_annulla()
+        self._notifica_dati_cambiati()
+
+    def _descrizione_voce(self, voce):
+        """Breve descrizione di una voce del giornale (per i bottoni Annulla/Ripristina)."""
+        parti = []
+        for modifica in voce['modifiche']:
+            nome, prima, dopo = modifica['nome'], modifica['prima'], modifica['dopo']
+            if modifica['tipo'] == 'turni':
+                parti.append("turni")
+            elif modifica['tipo'] == 'negozio':
+                parti.append(f"negozio {nome}")
+            elif prima is None:
+                parti.append(f"nuovo addetto {nome}")
+            elif dopo is None:
+                parti.append(f"eliminazione di {nome}")
+            else:
+                cambiati = {chiave for chiave in prima.keys() | dopo.keys() if prima.get(chiave) != dopo.get(chiave)}
+                parti.append({frozenset({'ferie'}): f"ferie di {nome}",
+                              frozenset({'giorni_riposo'}): f"riposi di {nome}"}.get(frozenset(cambiati), f"dati di {nome}"))
+        descrizione = ", ".join(parti[:2])
+        if len(parti) > 2:
+            descrizione += f" e altre {len(parti) - 2}"
+        return descrizione
+
+    def _aggiorna_comandi_annulla(self):
+        """Aggiorna testo e stato dei bottoni Annulla/Ripristina del menu principale."""
+        if getattr(self, '_btn_annulla', None) is None:
+            return
+        for bottone, pila, etichetta in ((self._btn_annulla, self._pila_annulla, "Annulla"),
+                                         (self._btn_ripristina, self._pila_ripristina, "Ripristina")):
+            if pila:
+                descrizione = self._descrizione_voce(pila[-1])
+                if len(descrizione) > 35:
+                    descrizione = descrizione[:34] + "…"
+                bottone.config(text=f"{etichetta}: {descrizione}", state='normal')
+            else:
+                bottone.config(text=etichetta, state='disabled')
+
+    def _osserva_dati(self, window, aggiorna):
+        """Registra la funzione che aggiorna `window` quando i dati cambiano per annulla/ripristina."""
+        self._osservatori_dati.append(aggiorna)
+        def rimuovi(event):
+            if event.widget is window and aggiorna in self._osservatori_dati:
+                self._osservatori_dati.remove(aggiorna)
+        window.bind('<Destroy>', rimuovi, add='+')
+
+    def _notifica_dati_cambiati(self):
+        for aggiorna in list(self._osservatori_dati):
+            aggiorna()
+
+    def _testo_dati_json(self):
+        """Contenuto di dati_turni.json (istantanea) per i dati correnti."""
+        dati = {
+            'formato': FORMATO_DATI,
+            'addetti': self.addetti,
+            'turni': self.turni_disponibili
+        }
+        if self.negozi:
+            dati['negozi'] = self.negozi
+        dati['sequenza_giornale'] = self._sequenza_giornale # Le voci fino a questa sono già comprese
+        return json.dumps(dati, indent=4) # indent=4 per leggibilità
+
+    @staticmethod
+    def _scrivi_file_atomico(percorso, testo, newline=None):
+        """
+        Scrive `testo` in `percorso` senza mai lasciare un file troncato: file temporaneo,
+        fsync, poi rinomina atomica sopra quello vecchio.
+        `newline` come in open(): '' scrive i fine riga così come sono (es. CRLF dei file .ics).
+        """
+        percorso_tmp = percorso + '.tmp'
+        with open(percorso_tmp, 'w', encoding='utf-8', newline=newline) as f:
+            f.write(testo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(percorso_tmp, percorso)
+        if hasattr(os, 'O_DIRECTORY'): # POSIX: rende persistente anche la rinomina
+            descrittore = os.open(os.path.dirname(os.path.abspath(percorso)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descrittore)
+            finally:
+                os.close(descrittore)
+
+    def _programma_compattazione(self):
+        """
+        Programma la riscrittura di dati_turni.json RITARDO_SALVATAGGIO_MS dopo l'ultima modifica
+        (più modifiche ravvicinate = una sola scrittura). Senza finestra si compatta subito.
+        """
+        if self.root is None:
+            self._scrivi_file_atomico(self.file_dati, self._testo_dati_json())
+            self._completa_compattazione(self._sequenza_giornale)
+            return
+        if self._salvataggio_programmato is not None:
+            self.root.after_cancel(self._salvataggio_programmato)
+        self._salvataggio_programmato = self.root.after(RITARDO_SALVATAGGIO_MS, self.compatta_giornale)
+
+    def compatta_giornale(self, attendi=False):
+        """
+        Scrive una nuova istantanea dati_turni.json con tutte le voci del giornale. I dati vengono
+        serializzati qui, nel thread della GUI (così non cambiano durante la scrittura); il file
+        viene scritto dal thread di scrittura, poi il giornale viene accorciato.
+        Con `attendi` aspetta che la scrittura sia completata.
+        """
+        if self._salvataggio_programmato is not None:
+            self.root.after_cancel(self._salvataggio_programmato)
+            self._salvataggio_programmato = None
+        if self._sequenza_giornale > self._sequenza_istantanea and self._sequenza_in_scrittura != self._sequenza_giornale:
+            if self._scrittore_dati is None:
+                self._scrittore_dati = ScrittoreDifferito(self.file_dati, self._scrivi_file_atomico)
+            self._sequenza_in_scrittura = self._sequenza_giornale
+            self._scrittore_dati.scrivi(self._testo_dati_json())
+            if not attendi:
+                self.root.after(100, self._controlla_scrittura_dati)
+        if attendi and self._scrittore_dati is not None:
+            self._scrittore_dati.attendi()
+            if self._scrittore_dati.errori.empty():
+                self._completa_compattazione(self._sequenza_in_scrittura)
+
+    def _completa_compattazione(self, sequenza):
+        """Istantanea scritta fino alla voce `sequenza`: il giornale tiene solo le voci utili ad annulla/ripristina."""
+        if sequenza <= self._sequenza_istantanea:
+            return
+        self._sequenza_istantanea = sequenza
+        self._giornale.compatta(min(sequenza + 1, self._sequenza_giornale - 4 * MAX_ANNULLAMENTI + 1))
+
+    def _controlla_scrittura_dati(self):
+        """Completa (nel thread della GUI) la compattazione e ne segnala gli errori."""
+        if not self._scrittore_dati.attendi(timeout=0):
+            self.root.after(100, self._controlla_scrittura_dati) # Ancora in corso
+            return
+        try:
+            errore = self._scrittore_dati.errori.get_nowait()
+        except queue.Empty:
+            try:
+                self._completa_compattazione(self._sequenza_in_scrittura)
+            except OSError as e:
+                print(f"Avviso: impossibile accorciare il giornale delle modifiche ({e})")
+            return
+        # Il giornale resta completo: i dati non sono persi, si riproverà alla compattazione successiva
+        self._sequenza_in_scrittura = self._sequenza_istantanea
+        print(f"Avviso: impossibile aggiornare {self.file_dati} ({errore})")
+
+    def chiudi_applicazione(self):
+        """Chiusura della finestra principale: compatta il giornale (se serve) prima di uscire."""
+        if self.archivio is None:
+            try:
+                self.compatta_giornale(attendi=True)
+            except OSError as e:
+                print(f"Avviso: impossibile accorciare il giornale delle modifiche ({e})")
+            if self._scrittore_dati is not None and not self._scrittore_dati.errori.empty():
+                # Non è una perdita di dati: le modifiche restano nel giornale e vengono riapplicate all'avvio
+                print(f"Avviso: impossibile aggiornare {self.file_dati} ({self._scrittore_dati.errori.get_nowait()})")
+        if self.archivio is not None:
+            self.archivio.chiudi()
+        self.root.destroy()
+
+    # --- Ferie: intervalli di date e archivio degli anni passati ---
+    @staticmethod
+    def _intervalli_ferie(ferie):
+        """
+        Normalizza le ferie di un addetto in intervalli [inizio, fine] ('YYYY-MM-DD', estremi inclusi)
+        ordinati, senza sovrapposizioni e con quelli contigui uniti. Accetta anche il vecchio
+        formato (lista di singole date) e liste miste.
+        """
+        intervalli = sorted([voce, voce] if isinstance(voce, str) else [voce[0], voce[1]] for voce in ferie)
+        uniti = []
+        for inizio, fine in intervalli:
+            if uniti and inizio <= GestioneTurni._giorno_dopo(uniti[-1][1]):
+                uniti[-1][1] = max(uniti[-1][1], fine)
+            else:
+                uniti.append([inizio, fine])
+        return uniti
+
+    @staticmethod
+    def _giorno_dopo(data_str, giorni=1):
+        """Data 'YYYY-MM-DD' spostata di `giorni` (anche negativi)."""
+        return (datetime.strptime(data_str, '%Y-%m-%d') + timedelta(days=giorni)).strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _in_ferie(intervalli, data_str):
+        """True se data_str ('YYYY-MM-DD') cade negli intervalli di ferie (ricerca binaria)."""
+        posizione = bisect.bisect_right(intervalli, data_str, key=lambda intervallo: intervallo[0]) - 1
+        return posizione >= 0 and intervalli[posizione][1] >= data_str
+
+    @staticmethod
+    def _date_ferie(intervalli, inizio=None, fine=None):
+        """Elenco delle singole date di ferie ('YYYY-MM-DD'), eventualmente limitate al periodo [inizio, fine]."""
+        date = []
+        for inizio_intervallo, fine_intervallo in intervalli:
+            if (fine is not None and inizio_intervallo > fine) or (inizio is not None and fine_intervallo < inizio):
+                continue
+            data = max(inizio_intervallo, inizio) if inizio is not None else inizio_intervallo
+            ultima = min(fine_intervallo, fine) if fine is not None else fine_intervallo
+            while data <= ultima:
+                date.append(data)
+                data = GestioneTurni._giorno_dopo(data)
+        return date
+
+    @staticmethod
+    def _togli_periodo_ferie(intervalli, inizio, fine):
+        """Intervalli di ferie senza i giorni del periodo [inizio, fine]."""
+        risultato = []
+        for inizio_intervallo, fine_intervallo in intervalli:
+            if fine_intervallo < inizio or inizio_intervallo > fine:
+                risultato.append([inizio_intervallo, fine_intervallo])
+                continue
+            if inizio_intervallo < inizio:
+                risultato.append([inizio_intervallo, GestioneTurni._giorno_dopo(inizio, -1)])
+            if fine_intervallo > fine:
+                risultato.append([GestioneTurni._giorno_dopo(fine), fine_intervallo])
+        return risultato
+
+    def _percorso_archivio_ferie(self, anno):
+        return os.path.join(self.cartella_archivio_ferie, f'ferie_{anno}.json')
+
+    def _carica_ferie_archiviate(self, anno):
+        """Ferie archiviate di un anno {addetto: intervalli}, o None se l'anno non è archiviato."""
+        if anno not in self._cache_ferie_archiviate:
+            ferie = None
+            # I motori dei processi di lavoro non leggono il disco: ricevono le ferie archiviate nella configurazione
+            percorso = self._percorso_archivio_ferie(anno) if self.cartella_archivio_ferie is not None else None
+            if percorso is not None and os.path.exists(percorso):
+                with open(percorso, 'r', encoding='utf-8') as f:
+                    ferie = {nome: self._intervalli_ferie(intervalli) for nome, intervalli in json.load(f)['ferie'].items()}
+            self._cache_ferie_archiviate[anno] = ferie
+        return self._cache_ferie_archiviate[anno]
+
+    def _salva_ferie_archiviate(self, anno, ferie):
+        """Scrive il file d'archivio delle ferie di un anno ({addetto: intervalli})."""
+        os.makedirs(self.cartella_archivio_ferie, exist_ok=True)
+        dati = {'formato': 'ferie-archivio-v1', 'anno': anno,
+                'ferie': {nome: intervalli for nome, intervalli in sorted(ferie.items()) if intervalli}}
+        self._scrivi_file_atomico(self._percorso_archivio_ferie(anno), json.dumps(dati, indent=4))
+        self._cache_ferie_archiviate[anno] = ferie
+        self._versione_dati += 1 # Ferie cambiate fuori dal giornale: anche qui le cache derivate vanno ricalcolate
+
+    def _ferie_archiviate_periodo(self, anno_inizio, anno_fine):
+        """Ferie degli anni archiviati tra anno_inizio e anno_fine {anno: {addetto: intervalli}}, per i processi di lavoro."""
+        ferie_archiviate = {}
+        for anno in range(anno_inizio, anno_fine + 1):
+            ferie = self._carica_ferie_archiviate(anno)
+            if ferie is not None:
+                ferie_archiviate[anno] = ferie
+        return ferie_archiviate
+
+    def _ferie_addetto(self, nome, anno):
+        """Intervalli di ferie di un addetto da usare per l'anno indicato (dall'archivio se l'anno è archiviato)."""
+        archiviate = self._carica_ferie_archiviate(anno)
+        if archiviate is not None:
+            return archiviate.get(nome, [])
+        return self.addetti.get(nome, {}).get('ferie', [])
+
+    def _imposta_ferie_mese(self, nome, anno, mese, giorni):
+        """Sostituisce le ferie di un addetto nel mese indicato con i `giorni` (numeri) dati e salva."""
+        primo, ultimo = self._limiti_mese_ferie(anno, mese)
+        self._imposta_ferie_periodo(nome, primo, ultimo, [[f"{anno:04d}-{mese:02d}-{giorno:02d}"] * 2 for giorno in giorni])
+
+    def _imposta_ferie_periodo(self, nome, dal, al, nuove):
+        """
+        Sostituisce le ferie di un addetto nel periodo [dal, al] con gli intervalli `nuove` e salva:
+        nei dati correnti o, per gli anni archiviati, nel file d'archivio (il periodo viene diviso per anno).
+        Le modifiche ai dati correnti vengono salvate insieme (una sola voce annullabile).
+        """
+        archivi = {}
+        modificati_correnti = self._sostituisci_ferie_periodo(nome, dal, al, nuove, archivi)
+        for anno, ferie in archivi.items():
+            self._salva_ferie_archiviate(anno, ferie)
+        if modificati_correnti:
+            self.salva_dati([('addetto', nome)])
+
+    def _sostituisci_ferie_periodo(self, nome, dal, al, nuove, archivi):
+        """
+        Come _imposta_ferie_periodo, ma senza scrivere nulla: le ferie degli anni archiviati vengono
+        cambiate nelle copie `archivi` {anno: {addetto: intervalli}} (create qui alla prima modifica,
+        da scrivere poi con _salva_ferie_archiviate), le altre nei dati correnti.
+        Restituisce True se ha cambiato i dati correnti.
+        """
+        modificati_correnti = False
+        for anno in range(int(dal[:4]), int(al[:4]) + 1):
+            inizio, fine = max(dal, f"{anno:04d}-01-01"), min(al, f"{anno:04d}-12-31")
+            nuove_anno = [[max(a, inizio), min(b, fine)] for a, b in nuove if a <= fine and b >= inizio]
+            archiviate = archivi.get(anno)
+            if archiviate is None and self._carica_ferie_archiviate(anno) is not None:
+                archiviate = archivi[anno] = dict(self._carica_ferie_archiviate(anno))
+            if archiviate is not None:
+                archiviate[nome] = self._intervalli_ferie(self._togli_periodo_ferie(archiviate.get(nome, []), inizio, fine) + nuove_anno)
+                continue
+            info = self.addetti[nome]
+            info['ferie'] = self._intervalli_ferie(self._togli_periodo_ferie(info.get('ferie', []), inizio, fine) + nuove_anno)
+            modificati_correnti = True
+        return modificati_correnti
+
+    @staticmethod
+    def _limiti_mese_ferie(anno, mese):
+        return f"{anno:04d}-{mese:02d}-01", f"{anno:04d}-{mese:02d}-{calendar.monthrange(anno, mese)[1]:02d}"
+
+    def archivia_ferie(self, anno_limite):
+        """
+        Sposta le ferie precedenti al 1° gennaio di `anno_limite` nei file d'archivio annuali
+        (un intervallo a cavallo di due anni viene diviso) e salva i dati correnti alleggeriti.
+        L'operazione non si può annullare: i file d'archivio sono fuori dal giornale, quindi la
+        voce non entra nella pila Annulla e svuota le pile (le voci precedenti riporterebbero
+        nei dati correnti le ferie ormai archiviate).
+        Restituisce {anno: giorni di ferie archiviati}.
+        """
+        limite = f"{anno_limite:04d}-01-01"
+        da_archiviare = {} # {anno: {addetto: intervalli}}
+        for nome, info in self.addetti.items():
+            for inizio, fine in info.get('ferie', []):
+                if inizio >= limite:
+                    break # Intervalli ordinati: i successivi sono tutti da tenere
+                for anno in range(int(inizio[:4]), int(min(fine, self._giorno_dopo(limite, -1))[:4]) + 1):
+                    parte = [max(inizio, f"{anno:04d}-01-01"), min(fine, f"{anno:04d}-12-31")]
+                    da_archiviare.setdefault(anno, {}).setdefault(nome, []).append(parte)
+        archiviati = {}
+        for anno, ferie in sorted(da_archiviare.items()):
+            esistenti = self._carica_ferie_archiviate(anno) or {}
+            unite = {nome: self._intervalli_ferie(esistenti.get(nome, []) + ferie.get(nome, []))
+                     for nome in set(esistenti) | set(ferie)}
+            self._salva_ferie_archiviate(anno, unite)
+            archiviati[anno] = sum(len(self._date_ferie(intervalli)) for intervalli in ferie.values())
+        if archiviati:
+            for info in self.addetti.values():
+                info['ferie'] = self._togli_periodo_ferie(info.get('ferie', []), '0000-01-01', self._giorno_dopo(limite, -1))
+            self._registra_modifiche('archiviazione')
+        return archiviati
+
+    # --- Importazione massiva da CSV/Excel ---
+    @staticmethod
+    def _testo_importazione(valore):
+        """Valore di una cella come testo: date 'YYYY-MM-DD', orari 'HH:MM', numeri interi senza decimali."""
+        if valore is None:
+            return ''
+        if isinstance(valore, datetime):
+            return valore.strftime('%Y-%m-%d') if (valore.hour, valore.minute) == (0, 0) else valore.strftime('%H:%M')
+        if hasattr(valore, 'strftime'): # datetime.date / datetime.time
+            return valore.strftime('%H:%M') if hasattr(valore, 'hour') else valore.strftime('%Y-%m-%d')
+        if isinstance(valore, float) and valore.is_integer():
+            return str(int(valore))
+        return str(valore).strip()
+
+    def _leggi_tabelle_importazione(self, percorso):
+        """
+        Legge un file CSV (separatore riconosciuto automaticamente) o Excel (ogni foglio) riga per riga.
+        Restituisce [(foglio, intestazione, DataFrame di testi con la colonna 'riga' = numero di riga nel file)].
+        """
+        tabelle = []
+        if percorso.lower().endswith(('.xlsx', '.xlsm')):
+            wb = openpyxl.load_workbook(percorso, read_only=True, data_only=True)
+            try:
+                fogli = [(ws.title, ws.iter_rows(values_only=True)) for ws in wb.worksheets]
+                for titolo, righe in fogli:
+                    tabelle.append((titolo,) + self._tabella_importazione(
+                        [self._testo_importazione(valore) for valore in riga] for riga in righe))
+            finally:
+                wb.close()
+        else:
+            with open(percorso, 'r', encoding='utf-8-sig', newline='') as f:
+                try:
+                    dialetto = csv.Sniffer().sniff(f.read(4096), delimiters=',;\t')
+                except csv.Error:
+                    dialetto = csv.excel
+                f.seek(0)
+                tabelle.append((None,) + self._tabella_importazione(csv.reader(f, dialetto)))
+        return [tabella for tabella in tabelle if tabella[1]]
+
+    @staticmethod
+    def _tabella_importazione(righe):
+        """(intestazione normalizzata, DataFrame) da un iteratore di righe di testi; salta le righe vuote."""
+        intestazione = []
+        dati, numeri = [], []
+        for numero, riga in enumerate(righe, start=1):
+            if not any(str(valore).strip() for valore in riga):
+                continue
+            if not intestazione:
+                intestazione = [str(valore).strip().lower().replace(' ', '_') for valore in riga]
+                continue
+            valori = [str(valore).strip() for valore in riga][:len(intestazione)]
+            dati.append(valori + [''] * (len(intestazione) - len(valori)))
+            numeri.append(numero)
+        df = pd.DataFrame(dati, columns=intestazione, dtype=object)
+        df['riga'] = numeri
+        return intestazione, df
+
+    @staticmethod
+    def _tipo_tabella_importazione(intestazione):
+        """Riconosce il tipo di tabella ('addetti', 'turni', 'ferie') dalle colonne; None se sconosciuto."""
+        for tipo in ('ferie', 'addetti', 'turni'):
+            colonne = COLONNE_IMPORTAZIONE[tipo]
+            if all(any(alias in intestazione for alias in colonne[obbligatoria])
+                   for obbligatoria in COLONNE_OBBLIGATORIE_IMPORTAZIONE[tipo]):
+                return tipo
+        return None
+
+    def _prepara_importazione(self, percorsi):
+        """
+        Legge e valida tutti i file prima di toccare i dati. Ogni tabella viene controllata con
+        operazioni vettoriali su tutte le righe insieme, raccogliendo tutti gli errori.
+        Restituisce (tabelle, errori): tabelle [(tipo, DataFrame con i valori convertiti)],
+        errori [(file, foglio, riga, colonna, messaggio)].
+        """
+        tabelle, errori = [], []
+        for percorso in percorsi:
+            nome_file = os.path.basename(percorso)
+            for foglio, intestazione, df in self._leggi_tabelle_importazione(percorso):
+                tipo = self._tipo_tabella_importazione(intestazione)
+                if tipo is None:
+                    errori.append((nome_file, foglio, 1, '', "Colonne non riconosciute (servono ad es. Nome, Ore Contratto, "
+                                                            "Ore Max / Inizio, Fine / Nome, Dal, Al)"))
+                    continue
+                # Rinomina le colonne con il nome canonico
+                rinomina = {}
+                for colonna, alias in COLONNE_IMPORTAZIONE[tipo].items():
+                    presente = next((a for a in alias if a in intestazione), None)
+                    if presente is not None:
+                        rinomina[presente] = colonna
+                df = df.rename(columns=rinomina)[list(rinomina.values()) + ['riga']].copy()
+                tabelle.append((tipo, df, nome_file, foglio))
+        # Addetti prima di turni e ferie: le ferie possono riferirsi agli addetti importati
+        tabelle.sort(key=lambda tabella: list(COLONNE_IMPORTAZIONE).index(tabella[0]))
+        nomi_noti = set(self.addetti)
+        nomi_importati = set()
+        validate = []
+        for tipo, df, nome_file, foglio in tabelle:
+            errori_tabella = []
+            def segnala(maschera, colonna, messaggio):
+                errori_tabella.extend((nome_file, foglio, int(riga), colonna, messaggio)
+                                      for riga in df.loc[maschera, 'riga'])
+            if tipo == 'addetti':
+                segnala(df['nome'].isin(nomi_importati), 'Nome', "Addetto già presente in un altro file o foglio importato")
+            df = getattr(self, f'_valida_importazione_{tipo}')(df, segnala, nomi_noti)
+            if tipo == 'addetti':
+                nomi_importati |= set(df['nome'])
+                nomi_noti |= nomi_importati
+            errori.extend(errori_tabella)
+            validate.append((tipo, df))
+        errori.sort(key=lambda errore: (errore[0], errore[1] or '', errore[2]))
+        return validate, errori
+
+    def _valida_importazione_addetti(self, df, segnala, nomi_noti):
+        nome = df['nome']
+        segnala(nome == '', 'Nome', "Nome mancante")
+        segnala((nome != '') & nome.duplicated(keep=False), 'Nome', "Nome ripetuto nel file")
+        ore = {}
+        for colonna, etichetta in (('ore_contratto', 'Ore Contratto'), ('ore_max', 'Ore Max')):
+            ore[colonna] = pd.to_numeric(df[colonna].str.replace(',', '.', regex=False), errors='coerce')
+            segnala(ore[colonna].isna() | (ore[colonna] < 0) | (ore[colonna] > 168), etichetta,
+                    "Ore non valide (numero tra 0 e 168)")
+        segnala(ore['ore_contratto'] > ore['ore_max'], 'Ore Contratto', "Ore contratto maggiori delle ore massime")
+        risultato = pd.DataFrame({'nome': nome, 'ore_contratto': ore['ore_contratto'], 'ore_max': ore['ore_max']})
+        if 'straordinario' in df:
+            valori = df['straordinario'].str.lower().map({'si': True, 'sì': True, 's': True, 'x': True, '1': True,
+                                                         'true': True, 'vero': True, 'no': False, 'n': False,
+                                                         '0': False, 'false': False, 'falso': False, '': False})
+            segnala(valori.isna(), 'Straordinario', "Valore non valido (Sì/No)")
+            risultato['straordinario'] = valori
+        if 'giorni_riposo' in df:
+            # "Lun; Mer" -> [0, 2]: un giorno per elemento, riconosciuto dalle prime tre lettere
+            giorni = df['giorni_riposo'].str.lower().str.split(r'[\s;,/]+').explode()
+            giorni = giorni[giorni != '']
+            indici = giorni.str[:3].map({'lun': 0, 'mar': 1, 'mer': 2, 'gio': 3, 'ven': 4, 'sab': 5, 'dom': 6})
+            segnala(df.index.isin(indici[indici.isna()].index), 'Giorni Riposo',
+                    "Giorno non riconosciuto (usare Lun, Mar, Mer, Gio, Ven, Sab, Dom)")
+            risultato['giorni_riposo'] = (indici.dropna().astype(int).groupby(level=0).apply(lambda x: sorted(set(x)))
+                                          .reindex(df.index).apply(lambda x: x if isinstance(x, list) else []))
+        return risultato
+
+    def _valida_importazione_turni(self, df, segnala, nomi_noti):
+        minuti = {}
+        for colonna, etichetta in (('inizio', 'Inizio'), ('fine', 'Fine')):
+            validi = df[colonna].str.fullmatch(r'([01]?\d|2[0-3]):[0-5]\d')
+            segnala(~validi, etichetta, "Orario non valido (HH:MM)")
+            parti = df[colonna].where(validi, '0:0').str.split(':', expand=True).astype(int)
+            minuti[colonna] = (parti[0] * 60 + parti[1]).where(validi)
+            df[colonna] = (parti[0].map('{:02d}'.format) + ':' + parti[1].map('{:02d}'.format)).where(validi)
+        segnala(minuti['inizio'] >= minuti['fine'], 'Fine', "L'ora di fine deve seguire l'ora di inizio")
+        apertura_min = self._get_orario_in_minuti(self.orario_apertura)
+        chiusura_min = self._get_orario_in_minuti(self.orario_chiusura)
+        segnala((minuti['inizio'] < apertura_min) | (minuti['fine'] > chiusura_min), 'Inizio',
+                f"Turno fuori dall'orario di apertura ({self.orario_apertura} - {self.orario_chiusura})")
+        segnala(df['inizio'].notna() & df.duplicated(['inizio', 'fine'], keep='first'), 'Inizio', "Turno ripetuto nel file")
+        return df[['inizio', 'fine']]
+
+    def _valida_importazione_ferie(self, df, segnala, nomi_noti):
+        segnala(~df['nome'].isin(nomi_noti), 'Nome', "Addetto non esistente")
+        date = {}
+        for colonna, etichetta in (('dal', 'Dal'), ('al', 'Al')):
+            testo = df[colonna] if colonna in df else pd.Series('', index=df.index)
+            data = pd.to_datetime(testo, format='%Y-%m-%d', errors='coerce')
+            data = data.fillna(pd.to_datetime(testo, format='%d/%m/%Y', errors='coerce'))
+            if colonna == 'al': # "Al" vuoto = un solo giorno
+                data = data.where(testo != '', date['dal'])
+            segnala(data.isna() & ((testo != '') | (colonna == 'dal')), etichetta, "Data non valida (AAAA-MM-GG o GG/MM/AAAA)")
+            date[colonna] = data
+        segnala(date['al'] < date['dal'], 'Al', "La data di fine precede quella di inizio")
+        return pd.DataFrame({'nome': df['nome'], 'dal': date['dal'].dt.strftime('%Y-%m-%d'),
+                             'al': date['al'].dt.strftime('%Y-%m-%d')})
+
+    def _applica_importazione(self, tabelle):
+        """
+        Applica le tabelle validate ai dati e le salva con un solo salvataggio (una sola voce del
+        giornale, annullabile in blocco; con SQLite una sola transazione). Le ferie degli anni
+        archiviati vanno nei file d'archivio, scritti una volta per anno (fuori dal giornale:
+        Annulla non le toglie). Restituisce un riepilogo.
+        """
+        riepilogo = {'addetti_nuovi': 0, 'addetti_aggiornati': 0, 'turni': 0, 'periodi_ferie': 0}
+        cambiati = []
+        archivi = {} # {anno: ferie archiviate modificate}
+        for tipo, df in tabelle:
+            for riga in df.to_dict('records'):
+                if tipo == 'addetti':
+                    info = self.addetti.get(riga['nome'])
+                    if info is None:
+                        info = self.addetti[riga['nome']] = {'ore_contratto': 40, 'ore_max': 48, 'straordinario': False,
+                                                            'ferie': [], 'giorni_riposo': []}
+                        riepilogo['addetti_nuovi'] += 1
+                    else:
+                        riepilogo['addetti_aggiornati'] += 1
+                    cambiati.append(('addetto', riga['nome']))
+                    for chiave in ('ore_contratto', 'ore_max', 'straordinario', 'giorni_riposo'):
+                        if chiave in riga:
+                            valore = riga[chiave]
+                            info[chiave] = int(valore) if chiave.startswith('ore') and float(valore).is_integer() else valore
+                elif tipo == 'turni':
+                    turno = (riga['inizio'], riga['fine'])
+                    if not any(tuple(esistente) == turno for esistente in self.turni_disponibili):
+                        self.turni_disponibili.append(turno)
+                        cambiati.append(('turni', None))
+                        riepilogo['turni'] += 1
+                else:
+                    # Tutto il periodo diventa ferie: equivale ad aggiungerlo a quelle esistenti
+                    if self._sostituisci_ferie_periodo(riga['nome'], riga['dal'], riga['al'], [[riga['dal'], riga['al']]], archivi):
+                        cambiati.append(('addetto', riga['nome']))
+                    riepilogo['periodi_ferie'] += 1
+        for anno, ferie in archivi.items():
+            self._salva_ferie_archiviate(anno, ferie)
+        self.salva_dati(cambiati)
+        return riepilogo
 
     def crea_menu_principale(self):
         """Crea il menu principale dell'applicazione"""
@@ -110,6 +1037,33 @@ class GestioneTurni:
                    command=self.genera_pianificazione, style='TButton').pack(pady=10, fill=tk.X)
         ttk.Button(main_frame, text="Visualizza Statistiche",
                    command=self.visualizza_statistiche, style='TButton').pack(pady=10, fill=tk.X)
+        ttk.Button(main_frame, text="Confronta Scenari (What-If)",
+                   command=self.confronta_scenari, style='TButton').pack(pady=10, fill=tk.X)
+        ttk.Button(main_frame, text="Confronta Pianificazioni",
+                   command=self.confronta_pianificazioni, style='TButton').pack(pady=10, fill=tk.X)
+        ttk.Button(main_frame, text="Archivio Dati",
+                   command=self.gestione_archivio, style='TButton').pack(pady=10, fill=tk.X)
+
+        # Annulla/Ripristina delle modifiche ai dati (anche con Ctrl+Z / Ctrl+Y)
+        frame_annulla = ttk.Frame(main_frame)
+        frame_annulla.pack(pady=10, fill=tk.X)
+        frame_annulla.grid_columnconfigure((0, 1), weight=1, uniform='annulla')
+        self._btn_annulla = ttk.Button(frame_annulla, command=self.annulla_modifica)
+        self._btn_annulla.grid(row=0, column=0, padx=(0, 5), sticky='ew')
+        self._btn_ripristina = ttk.Button(frame_annulla, command=self.ripristina_modifica)
+        self._btn_ripristina.grid(row=0, column=1, padx=(5, 0), sticky='ew')
+        self._aggiorna_comandi_annulla()
+
+        def scorciatoia(comando):
+            def gestisci(event):
+                # In un campo di testo Ctrl+Z/Ctrl+Y riguardano il testo digitato:
+                # non devono annullare (in silenzio) una modifica già salvata
+                if isinstance(event.widget, (tk.Entry, tk.Spinbox, tk.Text, ttk.Entry)): # Combobox e ttk.Spinbox sono ttk.Entry
+                    return
+                comando()
+            return gestisci
+        self.root.bind_all('<Control-z>', scorciatoia(self.annulla_modifica))
+        self.root.bind_all('<Control-y>', scorciatoia(self.ripristina_modifica))
 
     def gestione_addetti(self):
         """Gestisce l'aggiunta e la modifica degli addetti"""
@@ -229,7 +1183,7 @@ class GestioneTurni:
                       lista_addetti.insert(tk.END, item)
                  messagebox.showinfo("Successo", f"Addetto {nome} aggiunto.")
 
-            self.salva_dati()
+            self.salva_dati([('addetto', nome)])
             carica_dati_selezionato() # Ricarica per mostrare i dati salvati
 
 
@@ -239,8 +1193,13 @@ class GestioneTurni:
                 nome = lista_addetti.get(selection[0])
                 if messagebox.askyesno("Conferma", f"Vuoi eliminare l'addetto '{nome}'? Verranno perse anche le sue ferie e riposi.", icon='warning'):
                     del self.addetti[nome]
+                    negozi_cambiati = []
+                    for nome_negozio, negozio in self.negozi.items(): # Rimuove l'addetto anche dai negozi
+                        if nome in negozio.get('addetti', []):
+                            negozio['addetti'].remove(nome)
+                            negozi_cambiati.append(('negozio', nome_negozio))
                     lista_addetti.delete(selection[0])
-                    self.salva_dati()
+                    self.salva_dati([('addetto', nome)] + negozi_cambiati)
                     # Pulisci form dopo eliminazione
                     nome_var.set("")
                     ore_var.set(40)
@@ -268,10 +1227,77 @@ class GestioneTurni:
         ttk.Button(frame_bottoni, text="Salva", command=salva_addetto).grid(row=0, column=0, padx=5)
         ttk.Button(frame_bottoni, text="Nuovo", command=nuovo_addetto).grid(row=0, column=1, padx=5)
         ttk.Button(frame_bottoni, text="Elimina Selezionato", command=elimina_addetto).grid(row=0, column=2, padx=5)
+        ttk.Button(frame_bottoni, text="Importa da File...",
+                   command=lambda: self.importa_dati(window)).grid(row=1, column=0, columnspan=3, pady=(10, 0))
 
         # Forza espansione colonna 1 del frame form
         frame_form.grid_columnconfigure(1, weight=1)
 
+        def aggiorna_dopo_annulla():
+            lista_addetti.delete(0, tk.END)
+            for addetto in sorted(self.addetti.keys()):
+                lista_addetti.insert(tk.END, addetto)
+            carica_dati_selezionato() # Nessuna selezione: pulisce il form
+        self._osserva_dati(window, aggiorna_dopo_annulla)
+
+
+    def importa_dati(self, parent=None):
+        """
+        Importa addetti, turni e ferie da file CSV o Excel (es. esportazioni del gestionale del personale).
+        Tutti i file vengono validati prima di applicare qualsiasi modifica: se ci sono errori
+        vengono mostrati tutti insieme e non viene importato nulla.
+        """
+        parent = parent or self.root
+        percorsi = filedialog.askopenfilenames(
+            parent=parent, title="Importa addetti, turni e ferie",
+            filetypes=[("CSV o Excel", "*.csv *.xlsx *.xlsm"), ("Tutti i file", "*.*")])
+        if not percorsi:
+            return
+        try:
+            tabelle, errori = self._prepara_importazione(percorsi)
+        except Exception as e:
+            print(f"Errore lettura file da importare: {e}")
+            traceback.print_exc()
+            messagebox.showerror("Errore Importazione", f"Impossibile leggere i file:\n{e}", parent=parent)
+            return
+
+        if errori:
+            window = tk.Toplevel(parent)
+            window.title("Errori di Importazione")
+            window.geometry("800x400")
+            ttk.Label(window, text=f"{len(errori)} errori trovati: non è stato importato nulla. "
+                                   "Correggere i file e ripetere l'importazione.", wraplength=760).pack(padx=10, pady=10)
+            colonne = (('file', "File", 160), ('foglio', "Foglio", 90), ('riga', "Riga", 50),
+                       ('colonna', "Colonna", 110), ('errore', "Errore", 360))
+            tabella = ttk.Treeview(window, columns=[c[0] for c in colonne], show='headings')
+            for chiave, titolo, larghezza in colonne:
+                tabella.heading(chiave, text=titolo)
+                tabella.column(chiave, width=larghezza, anchor='w' if chiave == 'errore' else 'center')
+            scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tabella.yview)
+            tabella.config(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill='y', pady=(0, 10))
+            tabella.pack(fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+            for nome_file, foglio, riga, colonna, messaggio in errori:
+                tabella.insert('', tk.END, values=(nome_file, foglio or '', riga, colonna, messaggio))
+            return
+
+        conteggi = {tipo: sum(len(df) for t, df in tabelle if t == tipo) for tipo in COLONNE_IMPORTAZIONE}
+        nuovi = sum(1 for tipo, df in tabelle if tipo == 'addetti' for nome in df['nome'] if nome not in self.addetti)
+        if not any(conteggi.values()):
+            messagebox.showinfo("Importazione", "Nessuna riga da importare nei file selezionati.", parent=parent)
+            return
+        if not messagebox.askyesno("Conferma Importazione",
+                                   f"Righe valide: {conteggi['addetti']} addetti ({nuovi} nuovi, gli altri verranno "
+                                   f"aggiornati), {conteggi['turni']} turni, {conteggi['ferie']} periodi di ferie.\n\n"
+                                   "Importare? (L'importazione si può annullare in blocco con Annulla, "
+                                   "tranne le ferie degli anni archiviati)", parent=parent):
+            return
+        riepilogo = self._applica_importazione(tabelle)
+        self._notifica_dati_cambiati() # Aggiorna le finestre aperte (elenco addetti, turni, ferie)
+        messagebox.showinfo("Importazione Completata",
+                            f"Addetti nuovi: {riepilogo['addetti_nuovi']}, aggiornati: {riepilogo['addetti_aggiornati']}\n"
+                            f"Turni aggiunti: {riepilogo['turni']}\nPeriodi di ferie: {riepilogo['periodi_ferie']}",
+                            parent=parent)
 
     def gestione_turni(self):
         """Gestisce la definizione dei turni disponibili"""
@@ -352,7 +1378,7 @@ class GestioneTurni:
 
             self.turni_disponibili.append(nuovo_turno)
             aggiorna_lista_turni() # Aggiorna la lista visualizzata
-            self.salva_dati()
+            self.salva_dati([('turni', None)])
             messagebox.showinfo("Successo", f"Turno {inizio}-{fine} aggiunto correttamente.")
             # Pulisci i campi dopo aggiunta
             inizio_var.set("08:00")
@@ -370,7 +1396,7 @@ class GestioneTurni:
                     try:
                         self.turni_disponibili.remove(turno_da_elim)
                         aggiorna_lista_turni()
-                        self.salva_dati()
+                        self.salva_dati([('turni', None)])
                         messagebox.showinfo("Eliminato", f"Turno {turno_str} eliminato.")
                     except ValueError:
                          messagebox.showerror("Errore", "Turno non trovato nei dati interni.") # Non dovrebbe succedere
@@ -384,6 +1410,7 @@ class GestioneTurni:
 
         ttk.Button(frame_bottoni, text="Aggiungi Turno", command=salva_turno).grid(row=0, column=0, padx=10)
         ttk.Button(frame_bottoni, text="Elimina Selezionato", command=elimina_turno).grid(row=0, column=1, padx=10)
+        self._osserva_dati(window, aggiorna_lista_turni)
 
 
     def gestione_ferie_riposi(self):
@@ -470,10 +1497,65 @@ class GestioneTurni:
         mese_anno_label.pack(side=tk.LEFT, padx=5, fill='x', expand=True)
         ttk.Button(frame_nav_calendario, text=">", command=next_month, width=3).pack(side=tk.LEFT, padx=5)
 
-        # Frame per i giorni del calendario
+        # Frame per i giorni del calendario: griglia fissa 6x7 di checkbutton creati una volta sola,
+        # a ogni cambio di mese/addetto se ne aggiornano solo testo, visibilità e valore
         frame_giorni_cal = ttk.Frame(frame_ferie)
         frame_giorni_cal.pack(pady=10, fill='both', expand=True)
-        giorni_checkbox_vars = {} # Dizionario {giorno_num: tk.BooleanVar}
+        giorni_checkbox_vars = {} # Dizionario {giorno_num: tk.BooleanVar} del mese visualizzato
+        for i, giorno_abbr in enumerate(["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]):
+            ttk.Label(frame_giorni_cal, text=giorno_abbr, width=5, anchor='center', relief="groove").grid(
+                row=0, column=i, padx=1, pady=1, sticky='nsew')
+            frame_giorni_cal.grid_columnconfigure(i, weight=1) # Colonne di uguale larghezza
+        celle_calendario = [] # [(checkbutton, variabile)] in ordine di riga
+        giorni_celle = [0] * 42 # Giorno mostrato in ogni cella (0 = cella vuota)
+        ttk.Style().configure('Periodo.TCheckbutton', foreground='blue')
+        for indice in range(42):
+            var = tk.BooleanVar()
+            cb = ttk.Checkbutton(frame_giorni_cal, variable=var, width=4,
+                                 command=lambda indice=indice: clic_giorno(indice))
+            cb.grid(row=indice // 7 + 1, column=indice % 7, padx=1, pady=1, sticky='nsew')
+            celle_calendario.append((cb, var))
+
+        # Selezione di un periodo: clic sul primo giorno e poi sull'ultimo, anche in un altro mese
+        periodo_var = tk.BooleanVar(value=False)
+        inizio_periodo = {'data': None, 'in_ferie': True} # Primo giorno scelto e se il periodo va aggiunto o tolto
+        periodo_label = ttk.Label(frame_ferie, text="", foreground='blue', wraplength=380)
+
+        def cambia_modalita_periodo():
+            inizio_periodo['data'] = None
+            periodo_label.config(text="Clic sul primo giorno del periodo." if periodo_var.get() else "")
+            aggiorna_calendario_ferie()
+
+        def clic_giorno(indice):
+            if not periodo_var.get() or not giorni_celle[indice]:
+                return # Modalità normale: la spunta viene salvata con "Salva Ferie per Mese Corrente"
+            addetto = addetto_var.get()
+            if addetto not in self.addetti:
+                return
+            data_str = f"{anno_var.get():04d}-{mese_var.get():02d}-{giorni_celle[indice]:02d}"
+            if inizio_periodo['data'] is None:
+                inizio_periodo['data'] = data_str
+                inizio_periodo['in_ferie'] = celle_calendario[indice][1].get()
+                celle_calendario[indice][0].config(style='Periodo.TCheckbutton')
+                azione = "aggiungere alle" if inizio_periodo['in_ferie'] else "togliere dalle"
+                periodo_label.config(text=f"Dal {datetime.strptime(data_str, '%Y-%m-%d').strftime('%d/%m/%Y')}: clic "
+                                          f"sull'ultimo giorno del periodo da {azione} ferie.")
+                return
+            dal, al = sorted((inizio_periodo['data'], data_str))
+            inizio_periodo['data'] = None
+            try:
+                self._imposta_ferie_periodo(addetto, dal, al, [[dal, al]] if inizio_periodo['in_ferie'] else [])
+            except (OSError, ValueError, KeyError) as e:
+                messagebox.showerror("Errore", f"Impossibile salvare le ferie nell'archivio.\n{e}")
+            giorni = len(self._date_ferie([[dal, al]]))
+            periodo_label.config(text=f"{giorni} giorni {'aggiunti alle' if inizio_periodo['in_ferie'] else 'tolti dalle'} "
+                                      f"ferie di {addetto}. Clic sul primo giorno del prossimo periodo.")
+            aggiorna_calendario_ferie()
+            aggiorna_lista_ferie_display()
+
+        ttk.Checkbutton(frame_ferie, text="Seleziona un periodo (salvataggio immediato)", variable=periodo_var,
+                        command=cambia_modalita_periodo).pack(anchor='w')
+        periodo_label.pack(anchor='w', fill='x')
 
         # ----- Lista Ferie Programmate (sotto calendario, sinistra) ------
         frame_lista_ferie = ttk.LabelFrame(frame_sx, text="Ferie Programmate per Addetto", padding=10)
@@ -487,59 +1569,40 @@ class GestioneTurni:
 
 
         def aggiorna_calendario_ferie():
-            """Aggiorna la visualizzazione del calendario delle ferie."""
-            # Pulisci frame giorni calendario
-            for widget in frame_giorni_cal.winfo_children():
-                widget.destroy()
+            """Aggiorna la griglia del calendario delle ferie per il mese e l'addetto selezionati."""
             giorni_checkbox_vars.clear()
-
             try:
                 anno = anno_var.get()
                 mese = mese_var.get()
+                # Giorni del mese disposti nelle 42 celle (settimane x giorni, 0 = fuori dal mese)
+                giorni = [giorno for settimana in calendar.monthcalendar(anno, mese) for giorno in settimana]
             except (tk.TclError, ValueError):
                 messagebox.showerror("Errore", "Anno o mese non valido.")
                 return
+            giorni += [0] * (42 - len(giorni))
 
-            # Crea intestazioni giorni settimana
-            giorni_settimana_short = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
-            for i, giorno_abbr in enumerate(giorni_settimana_short):
-                lbl = ttk.Label(frame_giorni_cal, text=giorno_abbr, width=5, anchor='center', relief="groove")
-                lbl.grid(row=0, column=i, padx=1, pady=1, sticky='nsew')
-
-            # Ottieni il calendario del mese (matrice settimane x giorni)
-            try:
-                cal = calendar.monthcalendar(anno, mese)
-            except ValueError:
-                 messagebox.showerror("Errore", f"Data non valida: {mese}/{anno}")
-                 return
-
-            # Crea checkbutton per ogni giorno del mese selezionato
             addetto_selezionato = addetto_var.get()
             ferie_addetto = set() # Usiamo un set per controlli veloci
             if addetto_selezionato and addetto_selezionato in self.addetti:
-                 ferie_addetto = set(self.addetti[addetto_selezionato].get('ferie', []))
-
-            for riga, settimana in enumerate(cal):
-                for col, giorno_num in enumerate(settimana):
-                    if giorno_num != 0:
-                        data_corrente = datetime(anno, mese, giorno_num)
-                        data_str = data_corrente.strftime('%Y-%m-%d')
-
-                        var = tk.BooleanVar()
-                        # Seleziona la checkbox se il giorno è nelle ferie dell'addetto
-                        var.set(data_str in ferie_addetto)
-
-                        giorni_checkbox_vars[giorno_num] = var
-                        cb = ttk.Checkbutton(frame_giorni_cal, text=str(giorno_num),
-                                           variable=var, width=4) # style='Toolbutton' potrebbe essere carino
-                        cb.grid(row=riga + 1, column=col, padx=1, pady=1, sticky='nsew')
-                    else:
-                         # Cella vuota per giorni fuori dal mese
-                         ttk.Label(frame_giorni_cal, text="").grid(row=riga + 1, column=col, padx=1, pady=1)
-
-            # Configura le colonne del grid per avere uguale larghezza
-            for i in range(7):
-                frame_giorni_cal.grid_columnconfigure(i, weight=1)
+                 try:
+                     intervalli = self._ferie_addetto(addetto_selezionato, anno) # Anni passati: dall'archivio
+                 except (OSError, ValueError, KeyError) as e:
+                     messagebox.showerror("Errore", f"Impossibile leggere l'archivio ferie del {anno}.\n{e}")
+                     intervalli = []
+                 ferie_addetto = set(self._date_ferie(intervalli, *self._limiti_mese_ferie(anno, mese)))
+
+            for indice, (cb, var) in enumerate(celle_calendario):
+                giorno_num = giorni[indice]
+                giorni_celle[indice] = giorno_num
+                if giorno_num == 0:
+                    cb.grid_remove() # Cella vuota per giorni fuori dal mese
+                    continue
+                data_str = f"{anno:04d}-{mese:02d}-{giorno_num:02d}"
+                var.set(data_str in ferie_addetto) # Spuntato se il giorno è nelle ferie dell'addetto
+                stile = 'Periodo.TCheckbutton' if data_str == inizio_periodo['data'] else 'TCheckbutton'
+                cb.config(text=str(giorno_num), style=stile)
+                cb.grid()
+                giorni_checkbox_vars[giorno_num] = var
 
 
         def salva_ferie_selezionate():
@@ -556,27 +1619,60 @@ class GestioneTurni:
                  messagebox.showerror("Errore", "Anno o mese non valido per il salvataggio.")
                  return
 
-            # Prendi le ferie esistenti dell'addetto (anche di altri mesi/anni)
-            ferie_attuali = set(self.addetti[addetto].get('ferie', []))
+            # Sostituisce le ferie del mese corrente con i giorni selezionati (gli altri mesi restano invariati)
+            giorni_selezionati = [giorno for giorno, var in sorted(giorni_checkbox_vars.items()) if var.get()]
+            try:
+                self._imposta_ferie_mese(addetto, anno, mese, giorni_selezionati)
+            except (OSError, ValueError, KeyError) as e:
+                messagebox.showerror("Errore", f"Impossibile salvare le ferie nell'archivio del {anno}.\n{e}")
+                return
+            aggiorna_lista_ferie_display() # Aggiorna la listbox sotto
+            messagebox.showinfo("Successo", f"Ferie per {addetto} aggiornate correttamente.")
 
-            # Rimuovi le date del mese corrente dal set esistente
-            ferie_attuali = {data for data in ferie_attuali if not data.startswith(f"{anno:04d}-{mese:02d}-")}
 
-            # Aggiungi le date selezionate nel calendario corrente
-            for giorno, var in giorni_checkbox_vars.items():
-                if var.get():
-                    data_str = f"{anno:04d}-{mese:02d}-{giorno:02d}"
-                    ferie_attuali.add(data_str)
+        def verifica_fattibilita():
+            """Verifica se le ferie selezionate nel calendario lasciano l'orario copribile."""
+            addetto = addetto_var.get()
+            if not addetto:
+                messagebox.showerror("Errore", "Nessun addetto selezionato.")
+                return
+            try:
+                anno = anno_var.get()
+                mese = mese_var.get()
+            except (tk.TclError, ValueError):
+                 messagebox.showerror("Errore", "Anno o mese non valido.")
+                 return
 
-            # Aggiorna i dati dell'addetto e salva
-            self.addetti[addetto]['ferie'] = sorted(list(ferie_attuali)) # Salva come lista ordinata
-            self.salva_dati()
-            aggiorna_lista_ferie_display() # Aggiorna la listbox sotto
-            messagebox.showinfo("Successo", f"Ferie per {addetto} aggiornate correttamente.")
+            date_richieste = [f"{anno:04d}-{mese:02d}-{giorno:02d}"
+                              for giorno, var in sorted(giorni_checkbox_vars.items()) if var.get()]
+            if not date_richieste:
+                messagebox.showinfo("Fattibilità Ferie", "Selezionare nel calendario i giorni da verificare.")
+                return
 
+            esiti = self._verifica_fattibilita_ferie(addetto, date_richieste)
+            descrizioni = {'fattibile': "OK", 'a_rischio': "A RISCHIO (nessun margine)", 'non_fattibile': "NON FATTIBILE"}
+            righe = []
+            for data_str, (esito, margine) in esiti.items():
+                dettaglio = "negozio chiuso" if margine is None and esito == 'fattibile' else (
+                    f"margine {margine}" if margine is not None else "orario non copribile")
+                righe.append(f"{data_str}: {descrizioni[esito]} ({dettaglio})")
+            ore_disponibili, ore_richieste = self._capacita_ore_mese(addetto, anno, mese, date_richieste)
+            righe.append(f"\nOre nel mese (stima): disponibili {ore_disponibili:.0f}, necessarie {ore_richieste:.0f}"
+                         + (" - ORE INSUFFICIENTI" if ore_disponibili < ore_richieste - 0.01 else ""))
+            testo = f"Ferie di {addetto}:\n\n" + "\n".join(righe)
+            if any(esito == 'non_fattibile' for esito, _ in esiti.values()):
+                messagebox.showerror("Fattibilità Ferie", testo)
+            elif any(esito == 'a_rischio' for esito, _ in esiti.values()):
+                messagebox.showwarning("Fattibilità Ferie", testo)
+            else:
+                messagebox.showinfo("Fattibilità Ferie", testo)
 
-        ttk.Button(frame_ferie, text="Salva Ferie per Mese Corrente",
-                  command=salva_ferie_selezionate).pack(pady=10)
+        frame_bottoni_ferie = ttk.Frame(frame_ferie)
+        frame_bottoni_ferie.pack(pady=10)
+        ttk.Button(frame_bottoni_ferie, text="Salva Ferie per Mese Corrente",
+                  command=salva_ferie_selezionate).grid(row=0, column=0, padx=5)
+        ttk.Button(frame_bottoni_ferie, text="Verifica Fattibilità",
+                  command=verifica_fattibilita).grid(row=0, column=1, padx=5)
 
         # ---- Sezione Gestione Riposi (destra) ----
         frame_riposi = ttk.LabelFrame(frame_dx, text="Gestione Giorni di Riposo Settimanali Fissi", padding=10)
@@ -613,7 +1709,7 @@ class GestioneTurni:
                 # return
 
             self.addetti[addetto]['giorni_riposo'] = giorni_riposo_indices
-            self.salva_dati()
+            self.salva_dati([('addetto', addetto)])
             aggiorna_lista_riposi_display() # Aggiorna la listbox
             messagebox.showinfo("Successo", f"Giorni di riposo per {addetto} salvati.")
 
@@ -628,16 +1724,19 @@ class GestioneTurni:
             lista_ferie_display.delete(0, tk.END)
             addetto = addetto_var.get()
             if addetto and addetto in self.addetti:
-                # Mostra solo le ferie da oggi in poi, ordinate
+                # Mostra solo le ferie da oggi in poi, un periodo per riga
                 oggi_str = datetime.now().strftime('%Y-%m-%d')
-                ferie_future = sorted([d for d in self.addetti[addetto].get('ferie', []) if d >= oggi_str])
+                ferie_future = [intervallo for intervallo in self.addetti[addetto].get('ferie', []) if intervallo[1] >= oggi_str]
                 if ferie_future:
-                    for data_str in ferie_future:
+                    for inizio, fine in ferie_future:
                         try:
-                             data_dt = datetime.strptime(data_str, '%Y-%m-%d')
-                             lista_ferie_display.insert(tk.END, data_dt.strftime('%d %b %Y (%a)')) # Formato leggibile
+                             testo = datetime.strptime(inizio, '%Y-%m-%d').strftime('%d %b %Y (%a)') # Formato leggibile
+                             if fine != inizio:
+                                 giorni = len(self._date_ferie([[inizio, fine]]))
+                                 testo += f" - {datetime.strptime(fine, '%Y-%m-%d').strftime('%d %b %Y (%a)')} ({giorni} giorni)"
+                             lista_ferie_display.insert(tk.END, testo)
                         except ValueError:
-                             lista_ferie_display.insert(tk.END, data_str + " (Formato errato?)") # Fallback
+                             lista_ferie_display.insert(tk.END, f"{inizio} - {fine} (Formato errato?)") # Fallback
                 else:
                     lista_ferie_display.insert(tk.END, "Nessuna feria futura programmata.")
 
@@ -669,8 +1768,12 @@ class GestioneTurni:
                 # Aggiorna Lista Riposi Display
                 aggiorna_lista_riposi_display()
 
-                # Aggiorna Calendario Ferie (mostrando quelle dell'addetto)
-                aggiorna_calendario_ferie()
+                # Aggiorna Calendario Ferie (mostrando quelle dell'addetto); un periodo iniziato per
+                # un altro addetto viene abbandonato
+                if inizio_periodo['data'] is not None:
+                    cambia_modalita_periodo()
+                else:
+                    aggiorna_calendario_ferie()
 
                 # Aggiorna Lista Ferie Display
                 aggiorna_lista_ferie_display()
@@ -694,6 +1797,14 @@ class GestioneTurni:
              # Se non ci sono addetti, svuota/inizializza i campi
              on_select_addetto()
 
+        def aggiorna_dopo_annulla():
+            nomi = sorted(self.addetti.keys())
+            combo_addetti.config(values=nomi)
+            if addetto_var.get() not in self.addetti:
+                addetto_var.set(nomi[0] if nomi else "")
+            on_select_addetto()
+        self._osserva_dati(window, aggiorna_dopo_annulla)
+
 
     # ==========================================================================
     #               NUOVA LOGICA DI PIANIFICAZIONE REFACTORED
@@ -719,6 +1830,19 @@ class GestioneTurni:
         return f"{ore:02d}:{minuti:02d}"
 
     # --- Funzioni Helper per la Pianificazione Refactored ---
+    def _istantanea_dati(self):
+        """
+        Restituisce una copia dell'applicazione con addetti e turni copiati in profondità.
+        Usata dai thread di lavoro, così le modifiche fatte nel frattempo dalla GUI
+        non interferiscono con una generazione in corso.
+        """
+        motore = copy.copy(self)
+        motore.addetti = copy.deepcopy(self.addetti)
+        motore.turni_disponibili = copy.deepcopy(self.turni_disponibili)
+        motore.giorni_festivi = list(self.giorni_festivi)
+        motore.negozi = copy.deepcopy(self.negozi)
+        return motore
+
     # --- Funzione Helper per Calcolare Festività ---
     def _get_festivi_mese(self, anno, mese):
         """
@@ -761,8 +1885,12 @@ class GestioneTurni:
 
         for nome, info in self.addetti.items():
             # Controlla ferie
-            if data_str_ymd in info.get('ferie', []):
-                continue  # In ferie
+            if self._in_ferie(self._ferie_addetto(nome, data.year), data_str_ymd):
+                continue  # In ferie (dall'archivio se l'anno è archiviato)
+
+            # Controlla indisponibilità esterne (es. turno in un altro negozio)
+            if data_str_ymd in self.indisponibilita.get(nome, ()):
+                continue
 
             # Controlla giorni di riposo
             if giorno_settimana in info.get('giorni_riposo', []):
@@ -772,6 +1900,67 @@ class GestioneTurni:
 
         return addetti_disponibili
 
+    def _nuovo_stato_pianificazione(self):
+        """
+        Crea uno stato di pianificazione vuoto.
+        Lo stato è un dizionario compatto (serializzabile in JSON) che riassume
+        quanto serve alla generazione dei giorni successivi, così da poterlo
+        passare da un mese al successivo senza conservare i calendari completi:
+          - ore_mese / ore_totali: ore lavorate nel mese corrente / nell'intero periodo
+          - mattine / pomeriggi: contatori per l'alternanza dei turni
+          - domeniche: domeniche lavorate nel periodo
+          - recenti: ultimi 3 turni [data, 'HH:MM-HH:MM'] per addetto
+          - fine_ultimo_turno: fine dell'ultimo turno ('YYYY-MM-DDTHH:MM') per addetto
+        """
+        return {
+            'mese': None,
+            'ultimo_giorno': None,
+            'ore_mese': {},
+            'ore_totali': {},
+            'mattine': {},
+            'pomeriggi': {},
+            'domeniche': {},
+            'recenti': {},
+            'fine_ultimo_turno': {},
+        }
+
+    def _inizia_mese_stato(self, stato, anno, mese):
+        """Prepara lo stato per un nuovo mese: azzera solo il contatore delle ore mensili."""
+        stato['mese'] = f"{anno:04d}-{mese:02d}"
+        stato['ore_mese'] = {}
+
+    def _aggiorna_stato_pianificazione(self, stato, data, turni_giorno):
+        """Aggiorna lo stato con i turni assegnati in una giornata ormai definitiva."""
+        data_str_ymd = data.strftime('%Y-%m-%d')
+        inizio_pomeriggio_min = self._get_orario_in_minuti("13:00")
+        for addetto, turno_info in turni_giorno.items():
+            if not (isinstance(turno_info, (list, tuple)) and len(turno_info) == 2):
+                continue # FERIE, RIPOSO, FESTIVO, ERRORE...
+            inizio_min = self._get_orario_in_minuti(turno_info[0])
+            fine_min = self._get_orario_in_minuti(turno_info[1])
+            if inizio_min is None or fine_min is None:
+                continue
+            durata_min = fine_min - inizio_min
+            if durata_min < 0: durata_min += 24 * 60 # Gestione mezzanotte (improbabile)
+            ore_turno = durata_min / 60.0
+
+            stato['ore_mese'][addetto] = stato['ore_mese'].get(addetto, 0.0) + ore_turno
+            stato['ore_totali'][addetto] = stato['ore_totali'].get(addetto, 0.0) + ore_turno
+            if inizio_min < inizio_pomeriggio_min:
+                stato['mattine'][addetto] = stato['mattine'].get(addetto, 0) + 1
+            else:
+                stato['pomeriggi'][addetto] = stato['pomeriggi'].get(addetto, 0) + 1
+            if data.weekday() == 6: # Domenica
+                stato['domeniche'][addetto] = stato['domeniche'].get(addetto, 0) + 1
+
+            recenti = stato['recenti'].setdefault(addetto, [])
+            recenti.append([data_str_ymd, f"{turno_info[0]}-{turno_info[1]}"])
+            del recenti[:-3] # Teniamo solo gli ultimi 3 turni
+
+            fine_turno = datetime(data.year, data.month, data.day) + timedelta(minutes=inizio_min + durata_min)
+            stato['fine_ultimo_turno'][addetto] = fine_turno.strftime('%Y-%m-%dT%H:%M')
+        stato['ultimo_giorno'] = data_str_ymd
+
     def _calcola_ore_lavorate_mese(self, addetto, mese_calendario):
         """
         Calcola le ore totali lavorate da un addetto fino al giorno prima
@@ -793,9 +1982,11 @@ class GestioneTurni:
         return ore_totali
 
 
-    def _verifica_vincoli_turno(self, addetto, turno, data, ore_lavorate_mese_corrente):
+    def _verifica_vincoli_turno(self, addetto, turno, data, ore_lavorate_mese_corrente, stato=None):
         """
         Verifica i vincoli *rigidi* per assegnare un turno a un addetto in una data.
+        Se viene passato lo `stato` di pianificazione, controlla anche il riposo
+        minimo rispetto alla fine dell'ultimo turno (anche del mese precedente).
         Restituisce True se i vincoli sono rispettati, False altrimenti.
         """
         info_addetto = self.addetti[addetto]
@@ -819,17 +2010,53 @@ class GestioneTurni:
                 # print(f"Vincolo violato: {addetto} supererebbe ore max ({ore_lavorate_mese_corrente + ore_turno:.1f} > {ore_max})")
                 return False
 
-        # 2. Vincolo Riposo Minimo tra Turni (Esempio: almeno 11 ore)
-        #    TODO: Implementare questo controllo guardando il turno del giorno precedente
-        #    Per ora ritorna sempre True su questo vincolo
-
-        return True # Tutti i vincoli rigidi verificati (per ora)
-
-
-    def _calcola_punteggio_turno_refactored(self, addetto, turno, data, ore_lavorate_mese_corrente, mese_calendario):
+        # 2. Vincolo Riposo Minimo tra Turni (almeno self.riposo_minimo_ore ore)
+        #    La fine dell'ultimo turno è conservata nello stato, quindi il controllo
+        #    funziona anche a cavallo tra due mesi.
+        if stato is not None:
+            fine_precedente_str = stato['fine_ultimo_turno'].get(addetto)
+            if fine_precedente_str:
+                fine_precedente = datetime.strptime(fine_precedente_str, '%Y-%m-%dT%H:%M')
+                inizio_turno = datetime(data.year, data.month, data.day) + timedelta(minutes=inizio_min)
+                if inizio_turno - fine_precedente < timedelta(hours=self.riposo_minimo_ore):
+                    return False
+
+        # 3. Riposo minimo rispetto ai turni svolti in altri negozi il giorno prima e dopo
+        turni_altrove = self.turni_altrove.get(addetto)
+        if turni_altrove:
+            for scarto in (-1, 1):
+                giorno_vicino = data + timedelta(days=scarto)
+                turno_vicino = turni_altrove.get(giorno_vicino.strftime('%Y-%m-%d'))
+                if turno_vicino and not self._riposo_tra_turni_rispettato(data, turno, giorno_vicino, turno_vicino):
+                    return False
+
+        return True # Tutti i vincoli rigidi verificati
+
+    def _riposo_tra_turni_rispettato(self, data_a, turno_a, data_b, turno_b):
+        """
+        Verifica che tra due turni ('HH:MM', 'HH:MM') in due giorni diversi ci siano
+        almeno self.riposo_minimo_ore ore di riposo, in qualunque ordine cadano.
+        """
+        estremi = []
+        for data, turno in ((data_a, turno_a), (data_b, turno_b)):
+            inizio_min = self._get_orario_in_minuti(turno[0])
+            fine_min = self._get_orario_in_minuti(turno[1])
+            if inizio_min is None or fine_min is None:
+                return True # Turno non valido: nulla da verificare
+            durata_min = fine_min - inizio_min
+            if durata_min < 0: durata_min += 24 * 60 # Gestione mezzanotte (improbabile)
+            inizio = datetime(data.year, data.month, data.day) + timedelta(minutes=inizio_min)
+            estremi.append((inizio, inizio + timedelta(minutes=durata_min)))
+        (inizio_a, fine_a), (inizio_b, fine_b) = sorted(estremi)
+        return inizio_b - fine_a >= timedelta(hours=self.riposo_minimo_ore)
+
+
+    def _calcola_punteggio_turno_refactored(self, addetto, turno, data, ore_lavorate_mese_corrente, stato):
         """
         Calcola un punteggio di "desiderabilità" per un'assegnazione valida.
         Punteggi più alti sono migliori. Qui implementiamo una logica semplice.
+        Turni recenti e alternanza mattina/pomeriggio sono letti dallo `stato`
+        di pianificazione, che prosegue anche tra un mese e il successivo.
         """
         punteggio = 100 # Punteggio base
 
@@ -847,47 +2074,39 @@ class GestioneTurni:
         if ore_lavorate_mese_corrente + ore_turno <= ore_contratto:
             punteggio += 20
 
-        # 2. Malus per turni uguali recenti (guardiamo ultimi 3 giorni nel calendario parziale)
+        # 2. Malus per turni uguali recenti (ultimi 3 giorni, anche del mese precedente)
         turno_str = f"{turno[0]}-{turno[1]}"
-        giorno_corrente = data.day
         turni_recenti_uguali = 0
-        for d in range(max(1, giorno_corrente - 3), giorno_corrente):
-            if d in mese_calendario:
-                turno_passato_info = mese_calendario[d].get(addetto)
-                if isinstance(turno_passato_info, (list, tuple)) and len(turno_passato_info) == 2:
-                     if f"{turno_passato_info[0]}-{turno_passato_info[1]}" == turno_str:
-                         turni_recenti_uguali += 1
+        for data_passata_str, turno_passato_str in stato['recenti'].get(addetto, []):
+            giorni_fa = (data - datetime.strptime(data_passata_str, '%Y-%m-%d')).days
+            if 1 <= giorni_fa <= 3 and turno_passato_str == turno_str:
+                turni_recenti_uguali += 1
         punteggio -= turni_recenti_uguali * 30 # Penalità crescente
 
         # 3. Bonus per alternanza mattina/pomeriggio (molto semplificato)
-        #    Contiamo turni mattina/pomeriggio nel mese finora
-        mattina = 0
-        pomeriggio = 0
-        for d, turni_giorno in mese_calendario.items():
-             turno_passato_info = turni_giorno.get(addetto)
-             if isinstance(turno_passato_info, (list, tuple)) and len(turno_passato_info) == 2:
-                orario_inizio_passato = self._get_orario_in_minuti(turno_passato_info[0])
-                if orario_inizio_passato is not None and orario_inizio_passato < self._get_orario_in_minuti("13:00"):
-                   mattina += 1
-                else:
-                   pomeriggio += 1
+        #    Usiamo i contatori di turni mattina/pomeriggio accumulati nello stato
+        mattina = stato['mattine'].get(addetto, 0)
+        pomeriggio = stato['pomeriggi'].get(addetto, 0)
 
-        ora_inizio_turno_corrente = self._get_orario_in_minuti(turno[0])
-        if ora_inizio_turno_corrente is not None:
-             if ora_inizio_turno_corrente < self._get_orario_in_minuti("13:00"): # È un turno di mattina
-                 if mattina <= pomeriggio: # Favorisce se ha fatto meno mattine
-                     punteggio += 10
-             else: # È un turno di pomeriggio
-                 if pomeriggio < mattina: # Favorisce se ha fatto meno pomeriggi
-                     punteggio += 10
+        if inizio_min < self._get_orario_in_minuti("13:00"): # È un turno di mattina
+            if mattina <= pomeriggio: # Favorisce se ha fatto meno mattine
+                punteggio += 10
+        else: # È un turno di pomeriggio
+            if pomeriggio < mattina: # Favorisce se ha fatto meno pomeriggi
+                punteggio += 10
+
+        # 4. Malus per chi ha già lavorato più domeniche (equità sulle domeniche)
+        if data.weekday() == 6:
+            punteggio -= 5 * stato['domeniche'].get(addetto, 0)
 
         return punteggio
 
-    def _seleziona_turni_giornalieri(self, data, addetti_disponibili, mese_calendario):
+    def _seleziona_turni_giornalieri(self, data, addetti_disponibili, stato):
         """
         Seleziona la migliore combinazione di turni per coprire l'orario 8:00-21:00,
         dando priorità assoluta alla copertura.
         Utilizza una strategia greedy focalizzata sulla copertura.
+        `stato` è lo stato di pianificazione (ore, rotazione, ultimi turni) fino al giorno prima.
         """
         turni_assegnati_giorno = {} # {nome_addetto: ('HH:MM', 'HH:MM'), ...}
         orario_inizio_min = self._get_orario_in_minuti(self.orario_apertura)
@@ -911,11 +2130,11 @@ class GestioneTurni:
         # 1. Genera tutte le possibili assegnazioni VALIDE per oggi
         assegnazioni_possibili = []
         for addetto in addetti_disponibili:
-            # Calcola le ore lavorate finora nel mese per questo addetto
-            ore_lavorate_mese = self._calcola_ore_lavorate_mese(addetto, mese_calendario)
+            # Ore lavorate finora nel mese per questo addetto (dallo stato)
+            ore_lavorate_mese = stato['ore_mese'].get(addetto, 0.0)
             for turno in self.turni_disponibili:
-                if self._verifica_vincoli_turno(addetto, turno, data, ore_lavorate_mese):
-                    punteggio = self._calcola_punteggio_turno_refactored(addetto, turno, data, ore_lavorate_mese, mese_calendario)
+                if self._verifica_vincoli_turno(addetto, turno, data, ore_lavorate_mese, stato):
+                    punteggio = self._calcola_punteggio_turno_refactored(addetto, turno, data, ore_lavorate_mese, stato)
                     inizio_min = self._get_orario_in_minuti(turno[0])
                     fine_min = self._get_orario_in_minuti(turno[1])
                     # Aggiungi solo se gli orari sono validi
@@ -1009,7 +2228,7 @@ class GestioneTurni:
                 data_str_ymd = data.strftime('%Y-%m-%d')
                 giorno_settimana = data.weekday()
                 info_addetto = self.addetti[addetto]
-                if data_str_ymd in info_addetto.get('ferie', []):
+                if self._in_ferie(self._ferie_addetto(addetto, data.year), data_str_ymd):
                      turni_assegnati_giorno[addetto] = 'FERIE'
                 elif giorno_settimana in info_addetto.get('giorni_riposo', []):
                      turni_assegnati_giorno[addetto] = 'RIPOSO'
@@ -1022,16 +2241,19 @@ class GestioneTurni:
 
     # --- Funzione Principale Refactored ---
     # --- Funzione Principale Refactored (Sostituisce l'originale) ---
-    def _genera_calendario_mensile_refactored(self, anno, mese):
+    def _genera_giorni(self, anno, mese, stato, avanzamento=None, annulla=None):
         """
-        Genera il calendario mensile dando priorità alla copertura oraria completa
-        e utilizzando funzioni helper per separare le logiche.
+        Generatore del mese giorno per giorno: produce (data, turni_giorno) appena
+        ogni giornata è definitiva, aggiornando `stato` sul posto.
+        È il punto di partenza della pipeline di esportazione in streaming.
+        Vedi _genera_calendario_mensile_refactored per avanzamento/annulla.
         """
+        self._inizia_mese_stato(stato, anno, mese)
+
         # Ottieni le festività per l'anno corrente usando la funzione helper
         festivi_anno_corrente = self._get_festivi_mese(anno, mese) # Passiamo anche il mese, anche se non usato per ora dalla helper
 
         num_giorni = calendar.monthrange(anno, mese)[1]
-        calendario_mensile = {} # {1: {nome: turno/stato, ...}, 2: {...}}
 
         # Prova a ottenere il nome del mese in italiano
         try:
@@ -1043,6 +2265,12 @@ class GestioneTurni:
         print(f"Festività considerate (formato gg-mm): {', '.join(sorted(list(festivi_anno_corrente)))}")
 
         for giorno in range(1, num_giorni + 1):
+            # Punto di controllo per annullamento/avanzamento (generazione in background)
+            if annulla is not None and annulla.is_set():
+                raise GenerazioneAnnullata()
+            if avanzamento is not None:
+                avanzamento(giorno, num_giorni)
+
             data = datetime(anno, mese, giorno)
             data_str_dm = data.strftime('%d-%m') # Per controllo festivi
             giorno_settimana_abbr = data.strftime('%a') # Es: Lun, Mar...
@@ -1053,12 +2281,14 @@ class GestioneTurni:
             if data_str_dm in festivi_anno_corrente: # Usa la variabile definita sopra
                 print("   Festivo - Saltato")
                 # Marca come festivo per tutti, tranne chi è in ferie quel giorno
-                calendario_mensile[giorno] = {}
+                turni_del_giorno = {}
                 for nome_addetto, info_addetto in self.addetti.items():
-                     if data.strftime('%Y-%m-%d') in info_addetto.get('ferie', []):
-                          calendario_mensile[giorno][nome_addetto] = 'FERIE'
+                     if self._in_ferie(self._ferie_addetto(nome_addetto, data.year), data.strftime('%Y-%m-%d')):
+                          turni_del_giorno[nome_addetto] = 'FERIE'
                      else:
-                          calendario_mensile[giorno][nome_addetto] = 'FESTIVO'
+                          turni_del_giorno[nome_addetto] = 'FESTIVO'
+                self._aggiorna_stato_pianificazione(stato, data, turni_del_giorno)
+                yield data, turni_del_giorno
                 continue
 
             # 1. Trova addetti disponibili oggi (considera ferie e riposi settimanali)
@@ -1067,28 +2297,30 @@ class GestioneTurni:
             if not addetti_disponibili_oggi:
                 print("   ATTENZIONE: Nessun addetto disponibile per questo giorno!")
                 # Marca tutti come non disponibili (o errore?)
-                calendario_mensile[giorno] = {}
+                turni_del_giorno = {}
                 for nome_addetto, info_addetto in self.addetti.items():
                     data_str_ymd = data.strftime('%Y-%m-%d')
                     giorno_settimana = data.weekday()
-                    if data_str_ymd in info_addetto.get('ferie', []):
-                         calendario_mensile[giorno][nome_addetto] = 'FERIE'
+                    if self._in_ferie(self._ferie_addetto(nome_addetto, data.year), data_str_ymd):
+                         turni_del_giorno[nome_addetto] = 'FERIE'
                     elif giorno_settimana in info_addetto.get('giorni_riposo', []):
-                         calendario_mensile[giorno][nome_addetto] = 'RIPOSO'
+                         turni_del_giorno[nome_addetto] = 'RIPOSO'
                     else:
                          # Questo caso dovrebbe essere raro se _trova_addetti_disponibili_giorno funziona
-                         calendario_mensile[giorno][nome_addetto] = 'ERRORE_NODISP'
+                         turni_del_giorno[nome_addetto] = 'ERRORE_NODISP'
+                self._aggiorna_stato_pianificazione(stato, data, turni_del_giorno)
+                yield data, turni_del_giorno
                 continue
 
             print(f"   Addetti potenzialmente disponibili: {', '.join(addetti_disponibili_oggi)}")
 
             # 2. Seleziona i turni per la giornata dando priorità alla copertura
-            #    Passa il calendario parziale (mese_calendario) per i controlli sui vincoli
-            turni_del_giorno = self._seleziona_turni_giornalieri(data, addetti_disponibili_oggi, calendario_mensile)
+            #    Passa lo stato di pianificazione (ore, rotazione, ultimi turni) per i vincoli
+            turni_del_giorno = self._seleziona_turni_giornalieri(data, addetti_disponibili_oggi, stato)
 
-            # 3. Aggiungi i turni selezionati al calendario mensile
+            # 3. Aggiorna lo stato con i turni selezionati (giornata definitiva)
             #    La funzione _seleziona_turni_giornalieri già include Ferie/Riposo per chi non lavora
-            calendario_mensile[giorno] = turni_del_giorno
+            self._aggiorna_stato_pianificazione(stato, data, turni_del_giorno)
 
             # Stampa i turni assegnati per il giorno (debug)
             if turni_del_giorno:
@@ -1103,6 +2335,25 @@ class GestioneTurni:
                  # Questo non dovrebbe accadere con la logica attuale, ma è una sicurezza
                  print("   Nessun turno assegnato per il giorno (potrebbe essere errore logico).")
 
+            yield data, turni_del_giorno
+
+    def _genera_calendario_mensile_refactored(self, anno, mese, avanzamento=None, annulla=None, stato=None):
+        """
+        Genera il calendario mensile dando priorità alla copertura oraria completa
+        e utilizzando funzioni helper per separare le logiche.
+
+        `avanzamento` (opzionale) è chiamata come avanzamento(giorno, num_giorni)
+        all'inizio di ogni giorno; `annulla` (opzionale, threading.Event) viene
+        controllato tra un giorno e l'altro e, se impostato, solleva GenerazioneAnnullata.
+        `stato` (opzionale) è lo stato di pianificazione ereditato dal mese precedente:
+        viene aggiornato sul posto, così il chiamante può passarlo al mese successivo.
+        """
+        if stato is None:
+            stato = self._nuovo_stato_pianificazione()
+
+        calendario_mensile = {} # {1: {nome: turno/stato, ...}, 2: {...}}
+        for data, turni_del_giorno in self._genera_giorni(anno, mese, stato, avanzamento, annulla):
+            calendario_mensile[data.day] = turni_del_giorno
 
         # Calcolo finale e stampa riepilogo ore (opzionale, ma utile)
         print("\n--- Riepilogo Ore Lavorate Stimate nel Mese ---")
@@ -1124,180 +2375,567 @@ class GestioneTurni:
         print("\n--- Fine Generazione Pianificazione ---")
         return calendario_mensile
 
-    def _salva_calendario_excel(self, calendario, anno, mese):
-        """Salva il calendario dei turni su file Excel con formattazione migliorata"""
-        wb = openpyxl.Workbook()
-        ws = wb.active
+    def _genera_orizzonte(self, anno, mese, num_mesi, stato=None, avanzamento=None, annulla=None):
+        """
+        Genera `num_mesi` mesi consecutivi a partire da anno/mese (es. 12 per un anno intero).
+        È un generatore: produce (anno, mese, calendario, stato) un mese alla volta,
+        così il chiamante può salvare ogni mese appena pronto e scartarlo. Tra un mese
+        e l'altro passa solo lo stato compatto (ore, rotazione, domeniche, ultimo turno),
+        quindi la memoria resta costante qualunque sia la lunghezza del periodo.
+        Lo `stato` prodotto è lo stesso oggetto aggiornato mese per mese: copiarlo
+        se serve conservarne un'istantanea.
+        """
+        if stato is None:
+            stato = self._nuovo_stato_pianificazione()
+        for _ in range(num_mesi):
+            calendario = self._genera_calendario_mensile_refactored(
+                anno, mese, avanzamento=avanzamento, annulla=annulla, stato=stato)
+            yield anno, mese, calendario, stato
+            mese += 1
+            if mese == 13:
+                mese = 1
+                anno += 1
 
-        # Impostazioni di base del foglio
-        try:
-            nome_mese = calendar.month_name[mese]
-        except IndexError:
-            nome_mese = f"Mese {mese}" # Fallback
-        ws.title = f"Turni {nome_mese} {anno}"
-        ws.sheet_view.zoomScale = 85
+    # --- Pianificazione Multi-Negozio ---
+    def _configurazione_negozio(self, negozio, anno, mese, stato=None, indisponibilita=None, ore_altrove=None,
+                                turni_altrove=None):
+        """
+        Prepara la configurazione (dizionario semplice, serializzabile) per generare
+        il mese di un negozio in un processo separato.
+        `indisponibilita` {nome: [date]}, `ore_altrove` {nome: ore} e `turni_altrove`
+        {nome: {data: [inizio, fine]}} arrivano dalla passata di coordinamento: le ore
+        già svolte in altri negozi vengono scalate da ore contratto e ore massime
+        dell'addetto condiviso, i turni servono a rispettare il riposo minimo.
+        """
+        info_negozio = self.negozi[negozio]
+        addetti_negozio = {nome: copy.deepcopy(self.addetti[nome])
+                           for nome in info_negozio.get('addetti', []) if nome in self.addetti}
+        for nome, ore in (ore_altrove or {}).items():
+            if nome in addetti_negozio:
+                info = addetti_negozio[nome]
+                info['ore_max'] = max(0, info.get('ore_max', 48) - ore)
+                info['ore_contratto'] = max(0, info.get('ore_contratto', 40) - ore)
+        return {
+            'negozio': negozio,
+            'anno': anno,
+            'mese': mese,
+            'addetti': addetti_negozio,
+            'turni': copy.deepcopy(info_negozio.get('turni', self.turni_disponibili)),
+            'orario_apertura': info_negozio.get('orario_apertura', self.orario_apertura),
+            'orario_chiusura': info_negozio.get('orario_chiusura', self.orario_chiusura),
+            'giorni_festivi': list(self.giorni_festivi),
+            'riposo_minimo_ore': self.riposo_minimo_ore,
+            'indisponibilita': {nome: sorted(date) for nome, date in (indisponibilita or {}).items()},
+            'turni_altrove': copy.deepcopy(turni_altrove or {}),
+            'ferie_archiviate': self._ferie_archiviate_periodo(anno, anno) if anno is not None else {},
+            'stato': copy.deepcopy(stato),
+        }
 
-        # Stili comuni
-        thin_border_side = Side(style='thin', color='A0A0A0')
-        bordo_sottile = Border(
-            left=thin_border_side,
-            right=thin_border_side,
-            top=thin_border_side,
-            bottom=thin_border_side
-        )
-        allineamento_centro = Alignment(
-            horizontal='center',
-            vertical='center',
-            wrap_text=True
-        )
-        allineamento_sinistra = Alignment(
-            horizontal='left',
-            vertical='center',
-            wrap_text=True
-        )
-
-        # Formattazione header
-        header_font = Font(bold=True, size=11, color='000000')
-        header_fill = PatternFill(start_color=self.colori['header'],
-                                end_color=self.colori['header'],
-                                fill_type='solid')
-
-        # Scrivi intestazione (Data e Giorno Sett.)
-        ws.cell(1, 1, "Data").font = header_font
-        ws.cell(1, 1).fill = header_fill
-        ws.cell(1, 1).border = bordo_sottile
-        ws.cell(1, 1).alignment = allineamento_centro
-        ws.column_dimensions['A'].width = 15
+    def _partiziona_negozi(self):
+        """
+        Suddivide i negozi in gruppi indipendenti: due negozi sono nello stesso gruppo
+        se condividono (anche indirettamente) almeno un addetto.
+        Restituisce una lista di liste di nomi negozio, nell'ordine di self.negozi.
+        """
+        gruppo_di = {negozio: negozio for negozio in self.negozi}
+
+        def radice(negozio):
+            while gruppo_di[negozio] != negozio:
+                gruppo_di[negozio] = gruppo_di[gruppo_di[negozio]]
+                negozio = gruppo_di[negozio]
+            return negozio
+
+        primo_negozio_addetto = {}
+        for negozio, info in self.negozi.items():
+            for nome in info.get('addetti', []):
+                if nome in primo_negozio_addetto:
+                    gruppo_di[radice(negozio)] = radice(primo_negozio_addetto[nome])
+                else:
+                    primo_negozio_addetto[nome] = negozio
 
-        # Scrivi nomi addetti nelle colonne
-        nomi_addetti_ordinati = sorted(self.addetti.keys())
-        for col, addetto in enumerate(nomi_addetti_ordinati, 2):
-            cell = ws.cell(1, col, addetto)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = bordo_sottile
-            cell.alignment = allineamento_centro
-            ws.column_dimensions[get_column_letter(col)].width = 18 # Larghezza colonne addetti
-
-        # Calcola Pasqua per festività
-        def calcola_pasqua(year):
-            a = year % 19; b = year // 100; c = year % 100; d = b // 4; e = b % 4
-            f = (b + 8) // 25; g = (b - f + 1) // 3; h = (19 * a + b - d - g + 15) % 30
-            i = c // 4; k = c % 4; l = (32 + 2 * e + 2 * i - h - k) % 7
-            m = (a + 11 * h + 22 * l) // 451
-            month = (h + l - 7 * m + 114) // 31
-            day = ((h + l - 7 * m + 114) % 31) + 1
-            return datetime(year, month, day)
-        pasqua = calcola_pasqua(anno)
-        pasquetta = pasqua + timedelta(days=1)
-        festivita_calcolate = {pasqua.strftime('%d-%m'), pasquetta.strftime('%d-%m')}
-        festivi_mese_corrente = set(self.giorni_festivi) | festivita_calcolate
+        gruppi = {}
+        for negozio in self.negozi:
+            gruppi.setdefault(radice(negozio), []).append(negozio)
+        return list(gruppi.values())
 
+    def _vincoli_da_negozi_precedenti(self, negozio, gruppo, risultati):
+        """
+        Per gli addetti condivisi di `negozio`, raccoglie date già occupate, turni e ore
+        già lavorate nei negozi che lo precedono nel gruppo (priorità = ordine in self.negozi).
+        Restituisce (indisponibilita {nome: set(date)}, ore_altrove {nome: ore},
+        turni_altrove {nome: {data: [inizio, fine]}}).
+        """
+        indisponibilita = {}
+        ore_altrove = {}
+        turni_altrove = {}
+        addetti_negozio = set(self.negozi[negozio].get('addetti', []))
+        for altro in gruppo[:gruppo.index(negozio)]:
+            calendario_altro, stato_altro = risultati[altro]
+            anno_mese = stato_altro['mese'] # 'YYYY-MM' del mese generato
+            for nome in addetti_negozio & set(self.negozi[altro].get('addetti', [])):
+                for giorno, turni_giorno in calendario_altro.items():
+                    turno_info = turni_giorno.get(nome)
+                    if isinstance(turno_info, (list, tuple)) and len(turno_info) == 2:
+                        data_str = f"{anno_mese}-{int(giorno):02d}"
+                        indisponibilita.setdefault(nome, set()).add(data_str)
+                        turni_altrove.setdefault(nome, {})[data_str] = list(turno_info)
+                ore_altrove[nome] = ore_altrove.get(nome, 0.0) + self._calcola_ore_lavorate_mese(nome, calendario_altro)
+        return indisponibilita, ore_altrove, turni_altrove
+
+    def _conflitti_negozio(self, calendario, anno, mese, indisponibilita, ore_altrove, turni_altrove=None):
+        """
+        Elenca i conflitti di un negozio rispetto ai negozi con priorità maggiore:
+        addetti condivisi con un turno in due negozi lo stesso giorno o senza il
+        riposo minimo rispetto al turno altrove del giorno prima o dopo, oppure
+        (senza straordinario) ore totali oltre il massimo.
+        """
+        conflitti = []
+        for nome, date_occupate in indisponibilita.items():
+            for giorno, turni_giorno in calendario.items():
+                turno_info = turni_giorno.get(nome)
+                if not (isinstance(turno_info, (list, tuple)) and len(turno_info) == 2):
+                    continue
+                data_str = f"{anno:04d}-{mese:02d}-{int(giorno):02d}"
+                if data_str in date_occupate:
+                    conflitti.append(f"{nome}: doppio turno il {data_str}")
+        for nome, turni_nome in (turni_altrove or {}).items():
+            for giorno, turni_giorno in calendario.items():
+                turno_info = turni_giorno.get(nome)
+                if not (isinstance(turno_info, (list, tuple)) and len(turno_info) == 2):
+                    continue
+                data = datetime(anno, mese, int(giorno))
+                for scarto in (-1, 1):
+                    giorno_vicino = data + timedelta(days=scarto)
+                    turno_vicino = turni_nome.get(giorno_vicino.strftime('%Y-%m-%d'))
+                    if turno_vicino and not self._riposo_tra_turni_rispettato(data, turno_info, giorno_vicino, turno_vicino):
+                        conflitti.append(f"{nome}: riposo inferiore a {self.riposo_minimo_ore} ore tra il "
+                                         f"{min(data, giorno_vicino):%Y-%m-%d} e il {max(data, giorno_vicino):%Y-%m-%d}")
+        for nome, ore in ore_altrove.items():
+            info = self.addetti.get(nome, {})
+            if info.get('straordinario', False):
+                continue
+            ore_totali = ore + self._calcola_ore_lavorate_mese(nome, calendario)
+            if ore_totali > info.get('ore_max', 48) + 0.01:
+                conflitti.append(f"{nome}: {ore_totali:.1f} ore totali oltre il massimo ({info.get('ore_max', 48)})")
+        return conflitti
 
-        # Scrivi i giorni e i turni/stati
-        num_giorni_mese = calendar.monthrange(anno, mese)[1]
-        for giorno in range(1, num_giorni_mese + 1):
-            data = datetime(anno, mese, giorno)
-            data_str_dm = data.strftime('%d-%m')
-            data_str_ymd = data.strftime('%Y-%m-%d')
-            giorno_settimana_abbr = data.strftime('%a') # Es: Lun, Mar...
+    def _genera_multinegozio(self, anno, mese, stati=None, max_processi=None, annulla=None):
+        """
+        Genera il mese per tutti i negozi definiti in self.negozi.
+
+        1. I negozi vengono generati in parallelo in processi separati, ognuno
+           con i propri orari, turni e addetti.
+        2. Passata di coordinamento: nei gruppi di negozi con addetti condivisi, un
+           negozio che va in conflitto con quelli a priorità maggiore (doppio turno
+           nello stesso giorno, riposo minimo non rispettato tra i due negozi o ore
+           totali oltre il massimo) viene rigenerato con quelle date bloccate, i turni
+           altrui come vincolo di riposo e le ore già svolte scalate. Il primo negozio di ogni
+           gruppo non cambia mai, quindi bastano al più tanti giri quanti i negozi.
+
+        `stati` {negozio: stato} permette di proseguire da un mese precedente.
+        Restituisce {negozio: (calendario, stato)}.
+        """
+        if not self.negozi:
+            raise ValueError("Nessun negozio definito.")
+        stati = stati or {}
+        gruppi = [gruppo for gruppo in self._partiziona_negozi() if len(gruppo) > 1]
+        configurazioni = {negozio: self._configurazione_negozio(negozio, anno, mese, stati.get(negozio))
+                          for negozio in self.negozi}
+        risultati = {}
+        da_generare = list(self.negozi)
+        numero_processi = max_processi or min(len(da_generare), os.cpu_count() or 1)
+
+        with ProcessPoolExecutor(max_workers=numero_processi, mp_context=multiprocessing.get_context('spawn')) as pool:
+            for giro in range(1, len(self.negozi) + 2):
+                if annulla is not None and annulla.is_set():
+                    raise GenerazioneAnnullata()
+                print(f"Multi-negozio {mese:02d}/{anno} - giro {giro}: generazione di {', '.join(da_generare)}")
+                for negozio, calendario, stato in pool.map(_genera_negozio_in_processo,
+                                                           [configurazioni[n] for n in da_generare]):
+                    risultati[negozio] = (calendario, stato)
+
+                # Passata di coordinamento sugli addetti condivisi
+                da_generare = []
+                for gruppo in gruppi:
+                    for negozio in gruppo[1:]:
+                        indisponibilita, ore_altrove, turni_altrove = self._vincoli_da_negozi_precedenti(
+                            negozio, gruppo, risultati)
+                        conflitti = self._conflitti_negozio(risultati[negozio][0], anno, mese,
+                                                            indisponibilita, ore_altrove, turni_altrove)
+                        if conflitti:
+                            print(f"   {negozio}: {len(conflitti)} conflitti ({'; '.join(conflitti[:3])}...)")
+                            configurazioni[negozio] = self._configurazione_negozio(
+                                negozio, anno, mese, stati.get(negozio), indisponibilita, ore_altrove, turni_altrove)
+                            da_generare.append(negozio)
+                            break # I negozi successivi del gruppo dipendono da questo: al prossimo giro
+                if not da_generare:
+                    break
+            else:
+                print(f"ATTENZIONE: conflitti non risolti tra negozi per {mese:02d}/{anno}: {', '.join(da_generare)}")
 
-            # Formattazione riga
-            riga = giorno + 1
+        return {negozio: risultati[negozio] for negozio in self.negozi}
 
-            # Scrivi data e giorno settimana
-            cell_data = ws.cell(riga, 1, f"{giorno:02d}/{mese:02d}/{anno} ({giorno_settimana_abbr})")
-            cell_data.border = bordo_sottile
-            cell_data.alignment = allineamento_sinistra # Allinea a sinistra per leggibilità
+    def _genera_orizzonte_multinegozio(self, anno, mese, num_mesi, max_processi=None, annulla=None):
+        """
+        Come _genera_orizzonte, ma per tutti i negozi: produce (anno, mese, {negozio: calendario})
+        un mese alla volta, passando a ogni negozio il proprio stato del mese precedente.
+        """
+        stati = {}
+        for _ in range(num_mesi):
+            risultati = self._genera_multinegozio(anno, mese, stati=stati, max_processi=max_processi, annulla=annulla)
+            stati = {negozio: stato for negozio, (calendario, stato) in risultati.items()}
+            yield anno, mese, {negozio: calendario for negozio, (calendario, stato) in risultati.items()}
+            mese += 1
+            if mese == 13:
+                mese = 1
+                anno += 1
 
-            # Determina colore di sfondo per la riga del giorno
-            is_festivo = data_str_dm in festivi_mese_corrente
-            is_weekend = data.weekday() >= 5 # Sabato=5, Domenica=6
+    def _motore_negozio(self, negozio):
+        """Restituisce un motore senza interfaccia con addetti, orari e turni del negozio."""
+        motore = GestioneTurni.motore_senza_interfaccia(self._configurazione_negozio(negozio, None, None))
+        # Resta in questo processo: legge le ferie archiviate di qualunque anno come l'applicazione
+        motore.cartella_archivio_ferie = self.cartella_archivio_ferie
+        motore._cache_ferie_archiviate = self._cache_ferie_archiviate
+        return motore
 
-            fill_giorno = None
-            if is_festivo:
-                fill_giorno = PatternFill(start_color=self.colori['festivo'], end_color=self.colori['festivo'], fill_type='solid')
-            elif is_weekend:
-                fill_giorno = PatternFill(start_color=self.colori['weekend'], end_color=self.colori['weekend'], fill_type='solid')
-
-            if fill_giorno:
-                 cell_data.fill = fill_giorno
-                 # Applica sfondo a tutta la riga per chiarezza
-                 for col_idx in range(2, len(nomi_addetti_ordinati) + 2):
-                     ws.cell(riga, col_idx).fill = fill_giorno
-
-
-            # Scrivi turni/stati per ogni addetto
-            turni_del_giorno = calendario.get(giorno, {})
-            for col, addetto in enumerate(nomi_addetti_ordinati, 2):
-                cell = ws.cell(riga, col)
-                cell.border = bordo_sottile
-                cell.alignment = allineamento_centro # Centra il turno/stato
-
-                stato_turno = turni_del_giorno.get(addetto, '-') # Default a '-' se manca l'addetto quel giorno
-
-                fill_cella = None # Fill specifico per la cella (sovrascrive quello giorno)
-                testo_cella = "-"
-                font_cella = None
-
-                if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
-                    # È un turno ('HH:MM', 'HH:MM')
-                    testo_cella = f"{stato_turno[0]}-{stato_turno[1]}"
-                    # Colora base a mattina/pomeriggio
-                    try:
-                         if self._get_orario_in_minuti(stato_turno[0]) < self._get_orario_in_minuti("13:00"):
-                              fill_cella = PatternFill(start_color=self.colori['turno_mattina'], end_color=self.colori['turno_mattina'], fill_type='solid')
-                         else:
-                              fill_cella = PatternFill(start_color=self.colori['turno_pomeriggio'], end_color=self.colori['turno_pomeriggio'], fill_type='solid')
-                    except: pass # Ignora errori di formato orario qui
-
-                elif isinstance(stato_turno, str):
-                    # È uno stato (FERIE, RIPOSO, FESTIVO, ERRORE...)
-                    testo_cella = stato_turno
-                    if stato_turno == 'FERIE':
-                        fill_cella = PatternFill(start_color=self.colori['ferie'], end_color=self.colori['ferie'], fill_type='solid')
-                    elif stato_turno == 'RIPOSO':
-                        fill_cella = PatternFill(start_color=self.colori['riposo'], end_color=self.colori['riposo'], fill_type='solid')
-                    elif stato_turno == 'FESTIVO':
-                        # Usa lo stesso colore della riga festiva, ma assicurati sia applicato
-                        fill_cella = PatternFill(start_color=self.colori['festivo'], end_color=self.colori['festivo'], fill_type='solid')
-                    elif 'ERRORE' in stato_turno:
-                         fill_cella = PatternFill(start_color=self.colori['errore'], end_color=self.colori['errore'], fill_type='solid')
-                         font_cella = Font(color='FFFFFF', bold=True) # Testo bianco su sfondo rosso
-                         testo_cella = "ERR!" # Testo corto per errore
-                    else:
-                         testo_cella = stato_turno # Mostra stringa com'è
+    # --- Fattibilità Ferie (indice di copertura) ---
+    def _min_turni_copertura(self):
+        """
+        Numero minimo di turni (quindi di addetti, uno per turno) necessari a coprire
+        l'orario di apertura con i turni disponibili. None se l'orario non è copribile.
+        """
+        copertura = self._copertura_minima()
+        return len(copertura) if copertura is not None else None
 
-                # Applica testo, fill e font
-                cell.value = testo_cella
-                if fill_cella: # Il fill specifico della cella ha la priorità
-                    cell.fill = fill_cella
-                elif fill_giorno: # Altrimenti usa il fill del giorno (weekend/festivo)
-                     cell.fill = fill_giorno # Già applicato prima, ma riassicura coerenza
-                     # Potrebbe essere necessario rimuovere il fill se è un turno normale in giorno festivo/weekend?
-                     # if isinstance(stato_turno, (list, tuple)): cell.fill = PatternFill(fill_type=None) # Rimuovi fill giorno se c'è turno? Decisione stilistica.
+    def _copertura_minima(self):
+        """
+        Turni (inizio_min, fine_min) di una copertura dell'orario di apertura con il minimo
+        numero di turni, a parità di numero con meno ore. None se l'orario non è copribile.
+        """
+        apertura_min = self._get_orario_in_minuti(self.orario_apertura)
+        chiusura_min = self._get_orario_in_minuti(self.orario_chiusura)
+        intervalli = []
+        for turno in self.turni_disponibili:
+            inizio_min = self._get_orario_in_minuti(turno[0])
+            fine_min = self._get_orario_in_minuti(turno[1])
+            if inizio_min is not None and fine_min is not None and inizio_min < fine_min:
+                intervalli.append((inizio_min, fine_min))
+
+        # Copertura greedy di un intervallo: ottima per intervalli su una retta
+        coperto_fino = apertura_min
+        scelti = []
+        while coperto_fino < chiusura_min:
+            # Il turno che arriva più avanti; a parità, quello che inizia più tardi (meno ore)
+            migliore = max(((fine, inizio) for inizio, fine in intervalli if inizio <= coperto_fino), default=None)
+            if migliore is None or migliore[0] <= coperto_fino:
+                return None # Buco non copribile da nessun turno
+            coperto_fino = migliore[0]
+            scelti.append((migliore[1], migliore[0]))
+        return scelti
+
+    def _indice_copertura(self, anno, mese):
+        """
+        Restituisce (costruendolo una sola volta per versione dei dati) l'indice di
+        capacità di copertura del mese:
+          - 'addetti': lista nomi; il bit i delle maschere corrisponde a addetti[i]
+          - 'turni_slot': per ogni slot di 15 minuti dell'orario, maschera dei turni che lo coprono
+          - 'disponibili': {giorno: maschera degli addetti disponibili} (None = festivo, chiuso)
+          - 'min_turni': turni minimi per coprire la giornata (None = orario non copribile)
+          - 'ore_copertura': ore di turno della copertura minima di una giornata
+          - 'ore_turno_max': ore del turno più lungo
+        Le combinazioni addetto/turno che coprono uno slot sono quindi
+        disponibili[giorno] x turni_slot[slot]: ogni addetto può svolgere ogni turno.
+        """
+        chiave = (anno, mese, self._versione_dati)
+        if self._cache_indice_copertura.get('chiave') == chiave:
+            return self._cache_indice_copertura['indice']
+
+        nomi = sorted(self.addetti)
+        apertura_min = self._get_orario_in_minuti(self.orario_apertura)
+        chiusura_min = self._get_orario_in_minuti(self.orario_chiusura)
+        turni_slot = []
+        for inizio_slot in range(apertura_min, chiusura_min, 15):
+            fine_slot = min(inizio_slot + 15, chiusura_min)
+            maschera = 0
+            for indice_turno, turno in enumerate(self.turni_disponibili):
+                inizio_min = self._get_orario_in_minuti(turno[0])
+                fine_min = self._get_orario_in_minuti(turno[1])
+                if inizio_min is not None and fine_min is not None and inizio_min <= inizio_slot and fine_min >= fine_slot:
+                    maschera |= 1 << indice_turno
+            turni_slot.append(maschera)
+
+        festivi = self._get_festivi_mese(anno, mese)
+        disponibili = {}
+        for giorno in range(1, calendar.monthrange(anno, mese)[1] + 1):
+            data = datetime(anno, mese, giorno)
+            if data.strftime('%d-%m') in festivi:
+                disponibili[giorno] = None
+                continue
+            disponibili_oggi = set(self._trova_addetti_disponibili_giorno(data))
+            disponibili[giorno] = sum(1 << i for i, nome in enumerate(nomi) if nome in disponibili_oggi)
+
+        copertura = self._copertura_minima()
+        durate = [fine - inizio for inizio, fine in
+                  ((self._get_orario_in_minuti(turno[0]), self._get_orario_in_minuti(turno[1])) for turno in self.turni_disponibili)
+                  if inizio is not None and fine is not None and inizio < fine]
+        indice = {'addetti': nomi, 'turni_slot': turni_slot, 'disponibili': disponibili,
+                  'min_turni': len(copertura) if copertura is not None else None,
+                  'ore_copertura': sum(fine - inizio for inizio, fine in copertura or []) / 60.0,
+                  'ore_turno_max': max(durate, default=0) / 60.0}
+        self._cache_indice_copertura = {'chiave': chiave, 'indice': indice}
+        return indice
+
+    def _capacita_ore_mese(self, addetto, anno, mese, date):
+        """
+        Stima veloce delle ore del mese concedendo ad `addetto` le ferie nelle `date` del mese:
+        restituisce (ore_disponibili, ore_richieste).
+        ore_richieste = giorni di apertura x ore della copertura minima di una giornata;
+        ore_disponibili = per ogni addetto, giorni disponibili x turno più lungo, limitato a
+        ore_max (tranne per chi può fare straordinario).
+        """
+        indice = self._indice_copertura(anno, mese)
+        giorni_aperti = [maschera for maschera in indice['disponibili'].values() if maschera is not None]
+        ore_richieste = len(giorni_aperti) * indice['ore_copertura']
+        giorni_ferie = {int(data_str[8:10]) for data_str in date}
+        ore_disponibili = 0.0
+        for bit, nome in enumerate(indice['addetti']):
+            giorni = sum(1 for giorno, maschera in indice['disponibili'].items()
+                         if maschera is not None and maschera >> bit & 1
+                         and not (nome == addetto and giorno in giorni_ferie))
+            ore = giorni * indice['ore_turno_max']
+            info = self.addetti.get(nome, {})
+            if not info.get('straordinario', False):
+                ore = min(ore, info.get('ore_max', 48))
+            ore_disponibili += ore
+        return ore_disponibili, ore_richieste
+
+    def _verifica_fattibilita_ferie(self, addetto, date):
+        """
+        Verifica, senza generare il calendario, se l'orario resta copribile
+        concedendo ad `addetto` le ferie nelle `date` ('YYYY-MM-DD').
+        Restituisce {data: (esito, margine)} con esito:
+          - 'fattibile': restano più addetti dei turni minimi necessari
+          - 'a_rischio': restano esattamente gli addetti minimi (nessun margine)
+          - 'non_fattibile': gli addetti rimasti non bastano a coprire l'orario, oppure nel mese
+            le loro ore (vedi _capacita_ore_mese) non bastano a coprire tutte le giornate
+        `margine` = addetti disponibili rimasti - turni minimi (None se il negozio è chiuso).
+        """
+        ore_insufficienti = {}
+        for data_str in date:
+            chiave = (int(data_str[:4]), int(data_str[5:7]))
+            if chiave not in ore_insufficienti:
+                ore_disponibili, ore_richieste = self._capacita_ore_mese(
+                    addetto, chiave[0], chiave[1], [d for d in date if d.startswith(data_str[:7])])
+                ore_insufficienti[chiave] = ore_disponibili < ore_richieste - 0.01
+        risultati = {}
+        for data_str in date:
+            data = datetime.strptime(data_str, '%Y-%m-%d')
+            indice = self._indice_copertura(data.year, data.month)
+            maschera = indice['disponibili'][data.day]
+            if maschera is None:
+                risultati[data_str] = ('fattibile', None) # Festivo: negozio chiuso
+                continue
+            if indice['min_turni'] is None or not all(indice['turni_slot']):
+                risultati[data_str] = ('non_fattibile', None) # Orario non copribile con i turni definiti
+                continue
+            if addetto in indice['addetti']:
+                maschera &= ~(1 << indice['addetti'].index(addetto))
+            margine = bin(maschera).count('1') - indice['min_turni']
+            if margine < 0 or ore_insufficienti[(data.year, data.month)]:
+                esito = 'non_fattibile'
+            elif margine == 0:
+                esito = 'a_rischio'
+            else:
+                esito = 'fattibile'
+            risultati[data_str] = (esito, margine)
+        return risultati
 
-                if font_cella:
-                    cell.font = font_cella
+    # --- Scenari What-If ---
+    def _applica_scenario(self, scenario):
+        """
+        Applica le modifiche di uno scenario a una COPIA di addetti e turni
+        e restituisce (addetti, turni). I dati dell'applicazione non vengono toccati.
+
+        Formato scenario (es. da file JSON):
+            {"nome": "Part-time 24h",
+             "modifiche": [
+                 {"op": "aggiungi_addetto", "nome": "Nuovo", "dati": {"ore_contratto": 24, "ore_max": 24}},
+                 {"op": "modifica_addetto", "nome": "Sara", "dati": {"straordinario": true}},
+                 {"op": "rimuovi_addetto", "nome": "Matteo"},
+                 {"op": "aggiungi_turno", "turno": ["10:00", "16:00"]},
+                 {"op": "rimuovi_turno", "turno": ["14:00", "18:30"]}]}
+        """
+        addetti = copy.deepcopy(self.addetti)
+        turni = [list(t) for t in self.turni_disponibili]
+        nome_scenario = scenario.get('nome', '?')
+
+        for modifica in scenario.get('modifiche', []):
+            op = modifica.get('op')
+            nome = modifica.get('nome')
+            if op == 'aggiungi_addetto':
+                if nome in addetti:
+                    raise ValueError(f"Scenario '{nome_scenario}': l'addetto '{nome}' esiste già.")
+                dati = {'ore_contratto': 40, 'ore_max': 48, 'straordinario': False, 'giorni_riposo': [], 'ferie': []}
+                dati.update(copy.deepcopy(modifica.get('dati', {})))
+                dati['ferie'] = self._intervalli_ferie(dati['ferie']) # Lo scenario può elencare date singole
+                addetti[nome] = dati
+            elif op == 'modifica_addetto':
+                if nome not in addetti:
+                    raise ValueError(f"Scenario '{nome_scenario}': addetto '{nome}' non trovato.")
+                addetti[nome].update(copy.deepcopy(modifica.get('dati', {})))
+                addetti[nome]['ferie'] = self._intervalli_ferie(addetti[nome].get('ferie', []))
+            elif op == 'rimuovi_addetto':
+                if addetti.pop(nome, None) is None:
+                    raise ValueError(f"Scenario '{nome_scenario}': addetto '{nome}' non trovato.")
+            elif op == 'aggiungi_turno':
+                turno = list(modifica.get('turno', []))
+                if len(turno) != 2 or self._get_orario_in_minuti(turno[0]) is None or self._get_orario_in_minuti(turno[1]) is None:
+                    raise ValueError(f"Scenario '{nome_scenario}': turno non valido {modifica.get('turno')}.")
+                if turno not in turni:
+                    turni.append(turno)
+            elif op == 'rimuovi_turno':
+                turno = list(modifica.get('turno', []))
+                if turno not in turni:
+                    raise ValueError(f"Scenario '{nome_scenario}': turno {turno} non trovato.")
+                turni.remove(turno)
+            else:
+                raise ValueError(f"Scenario '{nome_scenario}': operazione sconosciuta '{op}'.")
+        return addetti, turni
 
-        # Congela la prima riga (header)
-        ws.freeze_panes = 'A2'
+    def _metriche_scenario(self, anno, mese, num_mesi):
+        """
+        Genera il periodo indicato (senza salvare nulla) e ne calcola le metriche di confronto:
+        giorni con errori di copertura, ore di straordinario (oltre ore_max), ore mancanti
+        rispetto al contratto, e due indici di equità: deviazione standard del rapporto
+        ore lavorate / ore contratto e differenza max-min delle domeniche lavorate.
+        """
+        giorni_errore = 0
+        ore_straordinario = 0.0
+        ore_mancanti = 0.0
+        stato = None
+        for anno_m, mese_m, calendario, stato in self._genera_orizzonte(anno, mese, num_mesi):
+            giorni_errore += sum(1 for turni_giorno in calendario.values()
+                                 if self._giorno_con_errori(turni_giorno))
+            for nome, info in self.addetti.items():
+                ore = stato['ore_mese'].get(nome, 0.0)
+                ore_max = info.get('ore_max', 0)
+                ore_contratto = info.get('ore_contratto', 0)
+                if ore_max > 0 and ore > ore_max + 0.01:
+                    ore_straordinario += ore - ore_max
+                if ore_contratto > 0 and ore < ore_contratto - 0.01:
+                    ore_mancanti += ore_contratto - ore
+
+        rapporti = [stato['ore_totali'].get(nome, 0.0) / (info['ore_contratto'] * num_mesi)
+                    for nome, info in self.addetti.items() if info.get('ore_contratto', 0) > 0]
+        domeniche = [stato['domeniche'].get(nome, 0) for nome in self.addetti]
+        return {
+            'giorni_errore': giorni_errore,
+            'ore_straordinario': round(ore_straordinario, 1),
+            'ore_mancanti': round(ore_mancanti, 1),
+            'ore_totali': round(sum(stato['ore_totali'].values()), 1),
+            'equita_ore': round(statistics.pstdev(rapporti), 3) if rapporti else 0.0,
+            'scarto_domeniche': (max(domeniche) - min(domeniche)) if domeniche else 0,
+        }
+
+    def _valuta_scenari(self, scenari, anno, mese, num_mesi=1, max_processi=None):
+        """
+        Valuta in parallelo (un processo per scenario) lo scenario attuale e gli scenari
+        indicati sul periodo anno/mese + num_mesi. Restituisce la tabella di confronto
+        come lista di dizionari, nello stesso ordine: prima riga lo scenario attuale.
+        """
+        configurazioni = []
+        for scenario in [{'nome': 'Attuale', 'modifiche': []}] + list(scenari):
+            addetti, turni = self._applica_scenario(scenario) # Errori di formato qui, prima di avviare i processi
+            configurazioni.append({
+                'scenario': scenario.get('nome', f"Scenario {len(configurazioni)}"),
+                'anno': anno, 'mese': mese, 'num_mesi': num_mesi,
+                'addetti': addetti, 'turni': turni,
+                'orario_apertura': self.orario_apertura,
+                'orario_chiusura': self.orario_chiusura,
+                'giorni_festivi': list(self.giorni_festivi),
+                'riposo_minimo_ore': self.riposo_minimo_ore,
+                'ferie_archiviate': self._ferie_archiviate_periodo(anno, anno + (mese + num_mesi - 2) // 12),
+            })
+        numero_processi = max_processi or min(len(configurazioni), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=numero_processi, mp_context=multiprocessing.get_context('spawn')) as pool:
+            return list(pool.map(_valuta_scenario_in_processo, configurazioni))
+
+    @staticmethod
+    def _giorno_con_errori(turni_giorno):
+        """
+        Indica se una giornata contiene errori: stati ERRORE degli addetti o chiavi di segnalazione
+        come ERRORE_COPERTURA (il cui valore, es. "Buco dalle 19:00", non contiene la parola ERRORE).
+        """
+        return any(nome.startswith('ERRORE') or 'ERRORE' in str(valore) for nome, valore in turni_giorno.items())
+
+    def _calendario_contiene_errori(self, calendario):
+        """Indica se il calendario contiene errori critici (es. copertura incompleta)."""
+        for giorno, dati_giorno in calendario.items():
+            if isinstance(dati_giorno, dict):
+                if self._giorno_con_errori(dati_giorno):
+                    return True
+        return False
 
-        # Salva il file
+    def _percorso_base_turni(self, anno, mese, negozio=None):
+        """
+        Restituisce il percorso (sul Desktop, senza estensione) dei file dei turni per anno/mese.
+        Con più negozi il nome include il negozio: Turni_<Negozio>_<Mese>_<Anno>
+        """
+        try:
+            nome_mese = calendar.month_name[mese]
+        except IndexError:
+            nome_mese = f"Mese {mese}" # Fallback
         desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-        nome_file = os.path.join(desktop_path, f"Turni_{nome_mese}_{anno}.xlsx")
+        if negozio:
+            # '_' è il separatore usato dalle statistiche per leggere mese e anno
+            return os.path.join(desktop_path, f"Turni_{negozio.replace('_', ' ')}_{nome_mese}_{anno}")
+        return os.path.join(desktop_path, f"Turni_{nome_mese}_{anno}")
+
+    def _percorso_file_turni(self, anno, mese, negozio=None):
+        """Restituisce il percorso del file Excel dei turni (sul Desktop) per anno/mese."""
+        return self._percorso_base_turni(anno, mese, negozio) + '.xlsx'
+
+    def _percorso_file_annuale(self, anno, mese, num_mesi, negozio=None):
+        """
+        Restituisce il percorso del file Excel unico (un foglio per mese) per un periodo:
+        Pianificazione_[<Negozio>_]<Anno>.xlsx per un anno solare completo, altrimenti
+        Pianificazione_[<Negozio>_]<Mese>_<Anno>-<Mese>_<Anno>.xlsx.
+        Il prefisso diverso da "Turni_" lo esclude dalle statistiche per singolo mese.
+        """
+        mese_fine = (mese - 1 + num_mesi - 1) % 12 + 1
+        anno_fine = anno + (mese - 1 + num_mesi - 1) // 12
+        if mese == 1 and num_mesi == 12:
+            periodo = f"{anno}"
+        else:
+            periodo = f"{calendar.month_name[mese]}_{anno}-{calendar.month_name[mese_fine]}_{anno_fine}"
+        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
+        if negozio:
+            return os.path.join(desktop_path, f"Pianificazione_{negozio.replace('_', ' ')}_{periodo}.xlsx")
+        return os.path.join(desktop_path, f"Pianificazione_{periodo}.xlsx")
+
+    def _apri_file(self, nome_file):
+        """
+        Apre il file con l'applicazione predefinita del sistema.
+        Non attende la chiusura dell'applicazione esterna (nessun blocco della GUI).
+        """
+        if os.name == 'nt': # Windows
+            os.startfile(nome_file)
+        elif sys.platform == 'darwin': # macOS
+            subprocess.Popen(('open', nome_file))
+        else: # linux variants
+            subprocess.Popen(('xdg-open', nome_file),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _salva_calendario_excel(self, calendario, anno, mese):
+        """Salva il calendario dei turni su file Excel e lo apre (versione sincrona, con messaggi)"""
+        nome_file = self._percorso_file_turni(anno, mese)
         try:
-            wb.save(nome_file)
+            self._scrivi_calendario_excel(calendario, anno, mese, nome_file)
             messagebox.showinfo("Salvataggio Excel", f"File salvato con successo sul Desktop:\n{nome_file}")
 
             # Apri il file dopo salvataggio
             try:
-                if os.name == 'nt': # Windows
-                    os.startfile(nome_file)
-                elif sys.platform == 'darwin': # macOS
-                    subprocess.call(('open', nome_file))
-                else: # linux variants
-                    subprocess.call(('xdg-open', nome_file))
+                self._apri_file(nome_file)
             except Exception as e_open:
                  print(f"Avviso: Impossibile aprire automaticamente il file Excel ({e_open})")
                  messagebox.showwarning("Apertura File", "File Excel salvato, ma impossibile aprirlo automaticamente.")
@@ -1309,6 +2947,909 @@ class GestioneTurni:
             print(f"Errore salvataggio Excel: {e_save}")
             traceback.print_exc()
 
+    def _registro_stili_excel(self, wb):
+        """
+        Registra nel workbook (una sola volta) gli stili con nome usati dal calendario
+        e restituisce {chiave: nome_stile}. Le celle ricevono solo il nome dello stile,
+        senza creare oggetti PatternFill/Border/Font per ogni cella.
+        """
+        lato_sottile = openpyxl.styles.Side(style='thin', color='A0A0A0')
+        bordo_sottile = openpyxl.styles.Border(left=lato_sottile, right=lato_sottile, top=lato_sottile, bottom=lato_sottile)
+        allineamento_centro = openpyxl.styles.Alignment(horizontal='center', vertical='center', wrap_text=True)
+        allineamento_sinistra = openpyxl.styles.Alignment(horizontal='left', vertical='center', wrap_text=True)
+
+        def riempimento(chiave_colore):
+            colore = self.colori[chiave_colore]
+            return openpyxl.styles.PatternFill(start_color=colore, end_color=colore, fill_type='solid')
+
+        # chiave: (riempimento, font, allineamento) - None = font/riempimento standard
+        definizioni = {
+            'header': (riempimento('header'), openpyxl.styles.Font(bold=True, size=11, color='000000'), allineamento_centro),
+            'data': (None, None, allineamento_sinistra),
+            'data_weekend': (riempimento('weekend'), None, allineamento_sinistra),
+            'data_festivo': (riempimento('festivo'), None, allineamento_sinistra),
+            'cella': (None, None, allineamento_centro),
+            'cella_weekend': (riempimento('weekend'), None, allineamento_centro),
+            'cella_festivo': (riempimento('festivo'), None, allineamento_centro),
+            'mattina': (riempimento('turno_mattina'), None, allineamento_centro),
+            'pomeriggio': (riempimento('turno_pomeriggio'), None, allineamento_centro),
+            'ferie': (riempimento('ferie'), None, allineamento_centro),
+            'riposo': (riempimento('riposo'), None, allineamento_centro),
+            'festivo': (riempimento('festivo'), None, allineamento_centro),
+            'errore': (riempimento('errore'), openpyxl.styles.Font(color='FFFFFF', bold=True), allineamento_centro), # Testo bianco su rosso
+            'modificato': (riempimento('modificato'), openpyxl.styles.Font(bold=True), allineamento_centro),
+        }
+
+        registro = {}
+        for chiave, (fill, font, allineamento) in definizioni.items():
+            nome_stile = f"turni_{chiave}"
+            if nome_stile not in wb.named_styles:
+                stile = openpyxl.styles.NamedStyle(name=nome_stile)
+                stile.font = font or copy.copy(openpyxl.styles.DEFAULT_FONT)
+                stile.border = bordo_sottile
+                stile.alignment = allineamento
+                if fill:
+                    stile.fill = fill
+                wb.add_named_style(stile)
+            registro[chiave] = nome_stile
+        return registro
+
+    # --- Modello Excel (stili, larghezze e formattazione condizionale) ---
+    # Celle di esempio del foglio "Turni" del modello da cui vengono letti gli stili
+    CELLE_STILI_MODELLO = {'header': 'A1', 'data': 'A2', 'cella': 'B2',
+                           'data_weekend': 'A3', 'cella_weekend': 'B3',
+                           'data_festivo': 'A4', 'cella_festivo': 'B4'}
+
+    def _crea_modello_excel(self):
+        """
+        Crea il modello Excel predefinito (dai colori di self.colori). Il foglio "Turni" contiene:
+        - celle di esempio (CELLE_STILI_MODELLO) con gli stili di intestazione, data e celle
+          per giorni normali, weekend e festivi;
+        - larghezza delle colonne A (data) e B (addetti), zoom e riquadri bloccati;
+        - le regole di formattazione condizionale che colorano gli stati (ERR!, FERIE,
+          RIPOSO, FESTIVO, turni di mattina/pomeriggio), con formule riferite alla cella B2.
+        Il modello può essere salvato con _salva_modello_excel e personalizzato in Excel.
+        """
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Turni"
+        ws.sheet_view.zoomScale = 85
+        ws.freeze_panes = 'A2'
+        ws.column_dimensions['A'].width = 15
+        ws.column_dimensions['B'].width = 18
+
+        stili = self._registro_stili_excel(wb)
+        esempi = {'A1': "Data", 'B1': "Addetto", 'A2': "01/01/2025 (Wed)", 'B2': "08:00-14:30",
+                  'A3': "04/01/2025 (Sat)", 'B3': "14:00-21:00", 'A4': "06/01/2025 (Mon)", 'B4': "FESTIVO"}
+        for chiave, coordinata in self.CELLE_STILI_MODELLO.items():
+            ws[coordinata] = esempi[coordinata]
+            ws[coordinata].style = stili[chiave]
+
+        def riempimento(chiave_colore):
+            colore = self.colori[chiave_colore]
+            return openpyxl.styles.PatternFill(start_color=colore, end_color=colore, fill_type='solid')
+
+        area = 'B2:B4'
+        regole = [
+            openpyxl.formatting.rule.CellIsRule(operator='equal', formula=['"ERR!"'], stopIfTrue=True,
+                       fill=riempimento('errore'), font=openpyxl.styles.Font(color='FFFFFF', bold=True)),
+            openpyxl.formatting.rule.CellIsRule(operator='equal', formula=['"FERIE"'], stopIfTrue=True, fill=riempimento('ferie')),
+            openpyxl.formatting.rule.CellIsRule(operator='equal', formula=['"RIPOSO"'], stopIfTrue=True, fill=riempimento('riposo')),
+            openpyxl.formatting.rule.CellIsRule(operator='equal', formula=['"FESTIVO"'], stopIfTrue=True, fill=riempimento('festivo')),
+            # Turni "HH:MM-HH:MM": mattina se inizia prima delle 13:00 (confronto tra testi HH:MM)
+            openpyxl.formatting.rule.FormulaRule(formula=['AND(LEN(B2)=11,MID(B2,3,1)=":",LEFT(B2,5)<"13:00")'], stopIfTrue=True,
+                        fill=riempimento('turno_mattina')),
+            openpyxl.formatting.rule.FormulaRule(formula=['AND(LEN(B2)=11,MID(B2,3,1)=":")'], stopIfTrue=True,
+                        fill=riempimento('turno_pomeriggio')),
+        ]
+        for regola in regole:
+            ws.conditional_formatting.add(area, regola)
+        return wb
+
+    def _salva_modello_excel(self, percorso=None):
+        """Salva il modello Excel predefinito (se non esiste già) e ne restituisce il percorso."""
+        percorso = percorso or self.file_modello_excel
+        if not os.path.exists(percorso):
+            self._crea_modello_excel().save(percorso)
+        return percorso
+
+    def _leggi_modello_excel(self):
+        """
+        Restituisce le impostazioni del modello Excel: quello in self.file_modello_excel se esiste,
+        altrimenti quello predefinito. Il risultato è in cache finché il file non cambia.
+        Chiavi: 'stili' {chiave: NamedStyle}, 'larghezza_data', 'larghezza_addetti', 'zoom',
+        'blocca', 'regole' (regole di formattazione condizionale, riferite a B2).
+        """
+        percorso = self.file_modello_excel
+        try:
+            chiave_cache = (percorso, os.path.getmtime(percorso))
+        except OSError:
+            chiave_cache = None # Nessun file: modello predefinito
+        if self._cache_modello_excel is not None and self._cache_modello_excel[0] == chiave_cache:
+            return self._cache_modello_excel[1]
+
+        if chiave_cache is not None:
+            wb = openpyxl.load_workbook(percorso)
+            if "Turni" not in wb.sheetnames:
+                raise ValueError(f"Il modello '{percorso}' non contiene il foglio 'Turni'.")
+            ws = wb["Turni"]
+        else:
+            ws = self._crea_modello_excel()["Turni"]
+
+        stili = {}
+        for chiave, coordinata in self.CELLE_STILI_MODELLO.items():
+            cella = ws[coordinata]
+            stili[chiave] = openpyxl.styles.NamedStyle(name=f"turni_modello_{chiave}", font=copy.copy(cella.font),
+                                       fill=copy.copy(cella.fill), border=copy.copy(cella.border),
+                                       alignment=copy.copy(cella.alignment), number_format=cella.number_format)
+        regole = sorted((copy.deepcopy(regola) for formattazione in ws.conditional_formatting
+                         for regola in formattazione.rules), key=lambda regola: regola.priority)
+        for regola in regole:
+            regola.priority = 0 # Riassegnata (nello stesso ordine) quando la regola viene aggiunta al foglio
+
+        modello = {
+            'stili': stili,
+            'larghezza_data': ws.column_dimensions['A'].width or 15,
+            'larghezza_addetti': ws.column_dimensions['B'].width or 18,
+            'zoom': ws.sheet_view.zoomScale or 100,
+            'blocca': ws.freeze_panes,
+            'regole': regole,
+        }
+        self._cache_modello_excel = (chiave_cache, modello)
+        return modello
+
+    def _testo_cella(self, stato_turno):
+        """Testo di una cella turno/stato nel file Excel (senza stile)."""
+        if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+            return f"{stato_turno[0]}-{stato_turno[1]}"
+        if isinstance(stato_turno, str):
+            return "ERR!" if 'ERRORE' in stato_turno else stato_turno
+        return "-"
+
+    def _testo_e_stile_cella(self, stato_turno, tipo_giorno):
+        """
+        Restituisce (testo, chiave_stile) per una cella turno/stato.
+        `tipo_giorno` è '', 'weekend' o 'festivo' (colore della riga, usato se la
+        cella non ha un colore proprio).
+        """
+        if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+            # È un turno ('HH:MM', 'HH:MM'): colore in base a mattina/pomeriggio
+            inizio_min = self._get_orario_in_minuti(stato_turno[0])
+            testo = f"{stato_turno[0]}-{stato_turno[1]}"
+            if inizio_min is None:
+                return testo, f"cella_{tipo_giorno}" if tipo_giorno else 'cella'
+            return testo, 'mattina' if inizio_min < self._get_orario_in_minuti("13:00") else 'pomeriggio'
+
+        if isinstance(stato_turno, str):
+            # È uno stato (FERIE, RIPOSO, FESTIVO, ERRORE...)
+            if stato_turno == 'FERIE':
+                return stato_turno, 'ferie'
+            if stato_turno == 'RIPOSO':
+                return stato_turno, 'riposo'
+            if stato_turno == 'FESTIVO':
+                return stato_turno, 'festivo'
+            if 'ERRORE' in stato_turno:
+                return "ERR!", 'errore' # Testo corto per errore
+            return stato_turno, f"cella_{tipo_giorno}" if tipo_giorno else 'cella'
+
+        return "-", f"cella_{tipo_giorno}" if tipo_giorno else 'cella'
+
+    def _scrivi_calendario_excel(self, calendario, anno, mese, nome_file, annulla=None):
+        """
+        Scrive il calendario dei turni su file Excel con formattazione migliorata.
+        Usa un workbook in modalità write-only: le righe vengono scritte in streaming
+        e ogni cella riceve uno stile con nome registrato una volta sola.
+        Non mostra finestre di dialogo (può essere eseguita in un thread di lavoro):
+        gli errori vengono propagati al chiamante. Se `annulla` viene impostato
+        durante la scrittura, solleva GenerazioneAnnullata senza salvare.
+        """
+        self._esporta_calendario(calendario, anno, mese, [EsportatoreExcel(nome_file)], annulla)
+
+    def _esporta_calendario(self, calendario, anno, mese, destinazioni, annulla=None, chiudi=True):
+        """
+        Invia un calendario mensile già generato alle destinazioni, in un'unica passata.
+        Con chiudi=False le destinazioni restano aperte (per aggiungere altri mesi,
+        es. al file annuale) e la chiusura spetta al chiamante.
+        """
+        completato = False
+        try:
+            for destinazione in destinazioni:
+                destinazione.inizia_mese(self, anno, mese)
+            for giorno in range(1, calendar.monthrange(anno, mese)[1] + 1):
+                if annulla is not None and annulla.is_set():
+                    raise GenerazioneAnnullata()
+                data = datetime(anno, mese, giorno)
+                for destinazione in destinazioni:
+                    destinazione.scrivi_giorno(data, calendario.get(giorno, {}))
+            for destinazione in destinazioni:
+                destinazione.termina_mese(anno, mese)
+            completato = True
+        finally:
+            if chiudi or not completato:
+                for destinazione in destinazioni:
+                    destinazione.chiudi(completato)
+
+    def _esegui_pipeline(self, anno, mese, num_mesi, destinazioni, stato=None,
+                         avanzamento=None, annulla=None, scrittura_parallela=True):
+        """
+        Pipeline in streaming: genera `num_mesi` mesi da anno/mese e passa ogni giorno,
+        appena definitivo, a tutte le destinazioni (Excel, CSV, JSON, statistiche...).
+        Nessun calendario completo resta in memoria.
+        Con `scrittura_parallela` le destinazioni girano in un thread di scrittura
+        alimentato da una coda limitata: calcolo e I/O si sovrappongono e la memoria
+        resta comunque limitata. Restituisce lo stato di pianificazione finale.
+        """
+        if stato is None:
+            stato = self._nuovo_stato_pianificazione()
+
+        coda_eventi = queue.Queue(maxsize=64)
+        errori_scrittura = []
+
+        def distribuisci(metodo, *args):
+            for destinazione in destinazioni:
+                getattr(destinazione, metodo)(*args)
+
+        def scrittore():
+            try:
+                while True:
+                    evento = coda_eventi.get()
+                    if evento is None:
+                        return
+                    distribuisci(*evento)
+            except Exception as e:
+                errori_scrittura.append(e)
+                while coda_eventi.get() is not None: # Svuota la coda: il generatore si fermerà
+                    pass
+
+        def invia(*evento):
+            if errori_scrittura:
+                raise errori_scrittura[0]
+            if scrittura_parallela:
+                coda_eventi.put(evento)
+            else:
+                distribuisci(*evento)
+
+        thread_scrittura = None
+        if scrittura_parallela:
+            thread_scrittura = threading.Thread(target=scrittore, daemon=True)
+            thread_scrittura.start()
+
+        completato = False
+        try:
+            for _ in range(num_mesi):
+                invia('inizia_mese', self, anno, mese)
+                for data, turni_giorno in self._genera_giorni(anno, mese, stato, avanzamento, annulla):
+                    invia('scrivi_giorno', data, turni_giorno)
+                invia('termina_mese', anno, mese)
+                mese += 1
+                if mese == 13:
+                    mese = 1
+                    anno += 1
+            completato = True
+        finally:
+            if thread_scrittura is not None:
+                coda_eventi.put(None)
+                thread_scrittura.join()
+            distribuisci('chiudi', completato and not errori_scrittura)
+        if errori_scrittura:
+            raise errori_scrittura[0]
+        return stato
+
+    # --- Formato "lungo" e statistiche per addetto (usati dalle destinazioni) ---
+    def _righe_formato_lungo(self, data, turni_giorno):
+        """
+        Converte una giornata in righe (data, addetto, stato, inizio_min, fine_min, ore),
+        una per addetto. stato è 'TURNO' per i turni, altrimenti FERIE/RIPOSO/FESTIVO/
+        ERRORE/'-' (non assegnato); per gli stati inizio/fine sono vuoti e le ore 0.
+        """
+        data_str = data.strftime('%Y-%m-%d')
+        righe = []
+        for nome in sorted(self.addetti):
+            stato_turno = turni_giorno.get(nome, '-')
+            if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+                inizio_min = self._get_orario_in_minuti(stato_turno[0])
+                fine_min = self._get_orario_in_minuti(stato_turno[1])
+                if inizio_min is not None and fine_min is not None:
+                    durata_min = fine_min - inizio_min
+                    if durata_min < 0: durata_min += 24 * 60 # Mezzanotte
+                    righe.append((data_str, nome, 'TURNO', inizio_min, fine_min, round(durata_min / 60.0, 2)))
+                    continue
+                stato_turno = 'ERRORE'
+            elif isinstance(stato_turno, str) and 'ERRORE' in stato_turno:
+                stato_turno = 'ERRORE'
+            righe.append((data_str, nome, str(stato_turno), None, None, 0.0))
+        return righe
+
+    def _nuove_statistiche_addetto(self):
+        """Contatori delle statistiche di un addetto (stesse voci della finestra Statistiche)."""
+        return {'giorni_lavorati': 0, 'turni': 0, 'ore': 0.0, 'ferie': 0, 'riposi': 0,
+                'domeniche_lavorate': 0, 'festivi_lavorati': 0, 'errori': 0}
+
+    def _aggiorna_statistiche_addetto(self, statistiche, stato_turno, data, is_festivo):
+        """Aggiorna i contatori di un addetto con il turno/stato di una giornata."""
+        if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+            inizio_min = self._get_orario_in_minuti(stato_turno[0])
+            fine_min = self._get_orario_in_minuti(stato_turno[1])
+            if inizio_min is None or fine_min is None:
+                statistiche['errori'] += 1
+                return
+            durata_min = fine_min - inizio_min
+            if durata_min < 0: durata_min += 24 * 60 # Mezzanotte
+            statistiche['turni'] += 1
+            statistiche['giorni_lavorati'] += 1
+            statistiche['ore'] += durata_min / 60.0
+            if data.weekday() == 6: # Domenica = 6
+                statistiche['domeniche_lavorate'] += 1
+            if is_festivo:
+                statistiche['festivi_lavorati'] += 1
+        elif stato_turno == 'FERIE':
+            statistiche['ferie'] += 1
+        elif stato_turno == 'RIPOSO':
+            statistiche['riposi'] += 1
+        elif isinstance(stato_turno, str) and 'ERRORE' in stato_turno:
+            statistiche['errori'] += 1
+        elif stato_turno not in ('-', '', 'FESTIVO', None):
+            statistiche['errori'] += 1 # Valore non riconosciuto (es. modificato a mano nel file)
+
+    # --- Copertura per fasce di 15 minuti (heatmap) ---
+    def _fasce_copertura(self):
+        """
+        Restituisce (apertura_min, num_fasce) delle fasce di MINUTI_FASCIA_COPERTURA minuti
+        tra apertura e chiusura del negozio (l'ultima fascia può essere parziale).
+        """
+        apertura_min = self._get_orario_in_minuti(self.orario_apertura)
+        chiusura_min = self._get_orario_in_minuti(self.orario_chiusura)
+        if apertura_min is None or chiusura_min is None or chiusura_min <= apertura_min:
+            return 0, 0
+        return apertura_min, -(-(chiusura_min - apertura_min) // MINUTI_FASCIA_COPERTURA)
+
+    def _copertura_giorno(self, turni_giorno, apertura_min, num_fasce):
+        """
+        Numero di addetti presenti in ogni fascia della giornata (array NumPy di num_fasce interi).
+        Un addetto conta in una fascia se il suo turno la copre per intero.
+        Calcolato con un array di differenze: +1 a inizio turno, -1 a fine turno, poi somma cumulativa.
+        """
+        differenze = np.zeros(num_fasce + 1, dtype=np.int16)
+        for nome, stato_turno in turni_giorno.items():
+            if not (isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2):
+                continue
+            inizio_min = self._get_orario_in_minuti(stato_turno[0])
+            fine_min = self._get_orario_in_minuti(stato_turno[1])
+            if inizio_min is None or fine_min is None:
+                continue
+            if fine_min < inizio_min: fine_min += 24 * 60 # Mezzanotte
+            prima = max(0, -(-(inizio_min - apertura_min) // MINUTI_FASCIA_COPERTURA))
+            ultima = min(num_fasce, (fine_min - apertura_min) // MINUTI_FASCIA_COPERTURA)
+            if prima < ultima:
+                differenze[prima] += 1
+                differenze[ultima] -= 1
+        return np.cumsum(differenze[:-1], dtype=np.int16)
+
+    def _matrice_copertura(self, calendario, anno, mese):
+        """Matrice giorni x fasce di 15 minuti con il numero di addetti presenti, per un calendario in memoria."""
+        accumulatore = AccumulatoreCopertura()
+        self._esporta_calendario(calendario, anno, mese, [accumulatore])
+        return accumulatore.per_mese[(anno, mese)]
+
+    # --- Confronto tra pianificazioni (diff) ---
+    def _testo_confronto(self, stato_turno):
+        """Forma testuale normalizzata di un turno/stato, usata per confrontare pianificazioni."""
+        if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+            return f"{stato_turno[0]}-{stato_turno[1]}"
+        if stato_turno is None or stato_turno == '':
+            return '-'
+        if isinstance(stato_turno, str) and ('ERRORE' in stato_turno or stato_turno == 'ERR!'):
+            return 'ERRORE'
+        return str(stato_turno)
+
+    def _stato_da_testo(self, testo):
+        """Inverso di _testo_confronto: 'HH:MM-HH:MM' -> ('HH:MM', 'HH:MM'), gli stati restano stringhe."""
+        testo = '-' if testo is None else str(testo).strip()
+        if testo.count('-') == 1 and ':' in testo:
+            inizio, fine = (parte.strip() for parte in testo.split('-'))
+            if self._get_orario_in_minuti(inizio) is not None and self._get_orario_in_minuti(fine) is not None:
+                return (inizio, fine)
+        if testo == 'ERR!':
+            return 'ERRORE'
+        return testo or '-'
+
+    def _carica_calendario_da_file(self, percorso, foglio=None):
+        """
+        Legge un calendario mensile salvato: file JSON sidecar (.json, veloce) o Excel
+        (.xlsx, foglio `foglio` o il primo con colonna 'Data'). Restituisce (anno, mese, calendario)
+        con calendario nel formato del motore: {giorno: {addetto: (inizio, fine) | stato}}.
+        Solleva ValueError se il file non ha il formato atteso.
+        """
+        if percorso.lower().endswith('.json'):
+            with open(percorso, 'r', encoding='utf-8') as f:
+                dati = json.load(f)
+            if dati.get('formato') != EsportatoreJSON.FORMATO:
+                raise ValueError(f"Il file '{os.path.basename(percorso)}' non è un file turni JSON riconosciuto.")
+            calendario = {int(giorno): {nome: tuple(valore) if isinstance(valore, list) else valore
+                                        for nome, valore in turni.items()}
+                          for giorno, turni in dati['giorni'].items()}
+            return dati['anno'], dati['mese'], calendario
+
+        wb = openpyxl.load_workbook(percorso, read_only=True, data_only=True)
+        try:
+            fogli = [wb[foglio]] if foglio else wb.worksheets
+            for ws in fogli:
+                righe = ws.iter_rows(values_only=True)
+                intestazione = next(righe, None)
+                if intestazione and str(intestazione[0]).strip().lower() == 'data':
+                    break
+            else:
+                raise ValueError(f"Nessun foglio con colonna 'Data' in '{os.path.basename(percorso)}'.")
+            nomi_addetti = [str(nome) for nome in intestazione[1:] if nome is not None]
+            anno = mese = None
+            calendario = {}
+            for riga in righe:
+                try:
+                    data = datetime.strptime(str(riga[0]).split('(')[0].strip(), '%d/%m/%Y')
+                except (ValueError, TypeError):
+                    continue # Riga senza data valida
+                anno, mese = data.year, data.month
+                calendario[data.day] = {nome: self._stato_da_testo(valore)
+                                        for nome, valore in zip(nomi_addetti, riga[1:])}
+        finally:
+            wb.close()
+        if anno is None:
+            raise ValueError(f"Nessuna data valida trovata in '{os.path.basename(percorso)}'.")
+        return anno, mese, calendario
+
+    def _griglia_confronto(self, calendario, giorni, addetti):
+        """Griglia giorni x addetti (DataFrame di testi normalizzati) di un calendario."""
+        return pd.DataFrame([[self._testo_confronto(calendario.get(giorno, {}).get(nome)) for nome in addetti]
+                             for giorno in giorni], index=giorni, columns=addetti)
+
+    def _confronta_calendari(self, calendario_prima, calendario_dopo, anno, mese):
+        """
+        Confronta due calendari dello stesso mese (dal motore, da JSON o da Excel) in un'unica
+        passata vettoriale sulle griglie giorni x addetti. Restituisce un dizionario con:
+        'modifiche' [(giorno, addetto, prima, dopo)], 'per_addetto' {addetto: [(giorno, prima, dopo)]},
+        'per_giorno' {giorno: [(addetto, prima, dopo)]}, 'addetti_aggiunti'/'addetti_rimossi',
+        e le griglie 'prima'/'dopo' e la 'maschera' delle celle cambiate (per l'export Excel).
+        """
+        giorni = list(range(1, calendar.monthrange(anno, mese)[1] + 1))
+        def addetti_di(calendario):
+            # Esclude le chiavi di segnalazione del giorno (ERRORE, ERRORE_COPERTURA)
+            return {nome for turni in calendario.values() for nome in turni if not nome.startswith('ERRORE')}
+        addetti_prima, addetti_dopo = addetti_di(calendario_prima), addetti_di(calendario_dopo)
+        addetti = sorted(addetti_prima | addetti_dopo)
+
+        griglia_prima = self._griglia_confronto(calendario_prima, giorni, addetti)
+        griglia_dopo = self._griglia_confronto(calendario_dopo, giorni, addetti)
+        maschera = griglia_prima.to_numpy() != griglia_dopo.to_numpy()
+
+        righe, colonne = maschera.nonzero() # Già ordinate per giorno e poi per addetto
+        valori_prima, valori_dopo = griglia_prima.to_numpy()[righe, colonne], griglia_dopo.to_numpy()[righe, colonne]
+        modifiche = [(giorni[r], addetti[c], p, d) for r, c, p, d in zip(righe, colonne, valori_prima, valori_dopo)]
+        per_addetto, per_giorno = {}, {}
+        for giorno, nome, prima, dopo in modifiche:
+            per_addetto.setdefault(nome, []).append((giorno, prima, dopo))
+            per_giorno.setdefault(giorno, []).append((nome, prima, dopo))
+
+        return {'anno': anno, 'mese': mese, 'modifiche': modifiche,
+                'per_addetto': per_addetto, 'per_giorno': per_giorno,
+                'addetti_aggiunti': sorted(addetti_dopo - addetti_prima),
+                'addetti_rimossi': sorted(addetti_prima - addetti_dopo),
+                'prima': griglia_prima, 'dopo': griglia_dopo, 'maschera': maschera}
+
+    def _confronta_file_turni(self, percorso_prima, percorso_dopo):
+        """Confronta due pianificazioni salvate (JSON o Excel, anche di tipo diverso) dello stesso mese."""
+        anno, mese, calendario_prima = self._carica_calendario_da_file(percorso_prima)
+        anno_dopo, mese_dopo, calendario_dopo = self._carica_calendario_da_file(percorso_dopo)
+        if (anno, mese) != (anno_dopo, mese_dopo):
+            raise ValueError(f"I file si riferiscono a mesi diversi ({mese}/{anno} e {mese_dopo}/{anno_dopo}).")
+        return self._confronta_calendari(calendario_prima, calendario_dopo, anno, mese)
+
+    def _scrivi_differenze_excel(self, differenze, nome_file):
+        """
+        Scrive le differenze su Excel: il foglio "Differenze" riproduce la griglia del mese
+        (nuova versione) con le celle cambiate evidenziate come "prima → dopo"; il foglio
+        "Elenco Modifiche" elenca le modifiche una per riga. Gli errori sono propagati.
+        """
+        anno, mese = differenze['anno'], differenze['mese']
+        griglia_dopo, maschera = differenze['dopo'], differenze['maschera']
+        griglia_prima = differenze['prima']
+        festivi = self._get_festivi_mese(anno, mese)
+
+        wb = openpyxl.Workbook(write_only=True)
+        stili = self._registro_stili_excel(wb)
+        ws = wb.create_sheet(title="Differenze")
+        ws_elenco = wb.create_sheet(title="Elenco Modifiche")
+
+        def cella(foglio, valore, chiave_stile):
+            c = openpyxl.cell.WriteOnlyCell(foglio, value=valore)
+            c.style = stili[chiave_stile]
+            return c
+
+        ws.sheet_view.zoomScale = 85
+        ws.freeze_panes = 'B2'
+        ws.column_dimensions['A'].width = 15
+        for col in range(2, len(griglia_dopo.columns) + 2):
+            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 18
+        ws.append([cella(ws, "Data", 'header')] + [cella(ws, nome, 'header') for nome in griglia_dopo.columns])
+
+        for indice_riga, giorno in enumerate(griglia_dopo.index):
+            data = datetime(anno, mese, giorno)
+            if data.strftime('%d-%m') in festivi:
+                tipo_giorno = 'festivo'
+            elif data.weekday() >= 5:
+                tipo_giorno = 'weekend'
+            else:
+                tipo_giorno = ''
+            riga = [cella(ws, f"{data.day:02d}/{data.month:02d}/{data.year} ({data.strftime('%a')})",
+                          f"data_{tipo_giorno}" if tipo_giorno else 'data')]
+            for indice_colonna, testo in enumerate(griglia_dopo.iloc[indice_riga]):
+                if maschera[indice_riga, indice_colonna]:
+                    riga.append(cella(ws, f"{griglia_prima.iat[indice_riga, indice_colonna]} → {testo}", 'modificato'))
+                else:
+                    riga.append(cella(ws, *self._testo_e_stile_cella(self._stato_da_testo(testo), tipo_giorno)))
+            ws.append(riga)
+
+        ws_elenco.freeze_panes = 'A2'
+        for col, larghezza in zip('ABCD', (15, 20, 16, 16)):
+            ws_elenco.column_dimensions[col].width = larghezza
+        ws_elenco.append([cella(ws_elenco, testo, 'header') for testo in ("Data", "Addetto", "Prima", "Dopo")])
+        for giorno, nome, prima, dopo in differenze['modifiche']:
+            ws_elenco.append([cella(ws_elenco, f"{giorno:02d}/{mese:02d}/{anno}", 'data'), cella(ws_elenco, nome, 'data'),
+                              cella(ws_elenco, prima, 'cella'), cella(ws_elenco, dopo, 'modificato')])
+        wb.save(nome_file)
+
+
+    # --- Indice delle statistiche dei file salvati ---
+    def _elenca_file_turni(self, cartella):
+        """
+        Elenca i file 'Turni_*.xlsx' della cartella, dal più recente, con una sola
+        scansione (os.scandir restituisce già le informazioni sul file).
+        """
+        with os.scandir(cartella) as voci:
+            file_turni = [(voce.stat().st_mtime, voce.name) for voce in voci
+                          if voce.name.startswith('Turni_') and voce.name.endswith('.xlsx') and voce.is_file()]
+        return [nome for _, nome in sorted(file_turni, reverse=True)]
+
+    def _carica_indice_statistiche(self):
+        """Carica (una volta) l'indice persistente dei riepiloghi: {percorso: voce}."""
+        if self._indice_statistiche is None:
+            try:
+                with open(self.file_indice_statistiche, 'r', encoding='utf-8') as f:
+                    indice = json.load(f)
+                self._indice_statistiche = indice if indice.get('versione') == 1 else {'versione': 1, 'file': {}}
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._indice_statistiche = {'versione': 1, 'file': {}}
+        return self._indice_statistiche
+
+    def _salva_indice_statistiche(self):
+        """Salva l'indice dei riepiloghi (scrittura atomica)."""
+        indice = self._carica_indice_statistiche()
+        # Rimuove le voci dei file non più presenti
+        indice['file'] = {percorso: voce for percorso, voce in indice['file'].items() if os.path.exists(percorso)}
+        try:
+            self._scrivi_file_atomico(self.file_indice_statistiche, json.dumps(indice, ensure_ascii=False))
+        except OSError as e:
+            print(f"Avviso: impossibile salvare l'indice delle statistiche ({e})")
+
+    def _riepilogo_calendario(self, calendario, anno, mese):
+        """Riepilogo per addetto (voci di _nuove_statistiche_addetto) di un calendario mensile."""
+        statistiche = AccumulatoreStatistiche()
+        motore = copy.copy(self)
+        # Addetti presenti nel calendario (anche se non più nei dati correnti)
+        motore.addetti = {nome: None for turni in calendario.values() for nome in turni if not nome.startswith('ERRORE')}
+        motore._esporta_calendario(calendario, anno, mese, [statistiche])
+        return statistiche.per_mese[(anno, mese)]
+
+    def _riepilogo_file_turni(self, percorso):
+        """
+        Riepilogo per addetto di un file turni salvato (Excel o JSON): {'anno', 'mese',
+        'num_giorni', 'addetti': {addetto: statistiche}}. Il risultato è conservato in un
+        indice persistente, valido finché percorso, data di modifica e dimensione del file
+        (e le festività del mese) non cambiano: riaprire le statistiche di un mese già
+        analizzato non richiede di rileggere il file.
+        Solleva ValueError se il file non ha il formato atteso.
+        """
+        percorso = os.path.abspath(percorso)
+        voce = self._voce_indice_valida(percorso)
+        if voce is None:
+            voce = self._analizza_file_turni(percorso)
+            self._carica_indice_statistiche()['file'][percorso] = voce
+            self._salva_indice_statistiche()
+        return voce
+
+    def _voce_indice_valida(self, percorso):
+        """Voce dell'indice per il file, se ancora valida (stesso mtime, dimensione e festività); altrimenti None."""
+        voce = self._carica_indice_statistiche()['file'].get(percorso)
+        if voce is None:
+            return None
+        info = os.stat(percorso)
+        if (voce['mtime'] == info.st_mtime and voce['dimensione'] == info.st_size
+                and voce['festivi'] == sorted(self._get_festivi_mese(voce['anno'], voce['mese']))):
+            return voce
+        return None
+
+    def _analizza_file_turni(self, percorso):
+        """Legge un file turni e ne calcola il riepilogo per addetto (voce dell'indice), senza cache."""
+        info = os.stat(percorso)
+        anno, mese, calendario = self._carica_calendario_da_file(percorso)
+        voce = {'mtime': info.st_mtime, 'dimensione': info.st_size, 'anno': anno, 'mese': mese,
+                'num_giorni': len(calendario), 'festivi': sorted(self._get_festivi_mese(anno, mese)),
+                'addetti': self._riepilogo_calendario(calendario, anno, mese)}
+        for statistiche in voce['addetti'].values():
+            statistiche['ore'] = round(statistiche['ore'], 2)
+        return voce
+
+    def _riepiloghi_file_turni(self, percorsi, max_processi=None):
+        """
+        Riepiloghi di molti file turni: quelli validi nell'indice vengono letti dalla cache,
+        gli altri analizzati in parallelo in un pool di processi (in linea se sono pochi:
+        l'avvio dei processi costa più dell'analisi di qualche file).
+        L'indice viene salvato una volta sola alla fine.
+        Restituisce ({percorso: voce}, {percorso: messaggio di errore}).
+        """
+        riepiloghi, errori = {}, {}
+        da_analizzare = []
+        for percorso in map(os.path.abspath, percorsi):
+            try:
+                voce = self._voce_indice_valida(percorso)
+            except OSError as e:
+                errori[percorso] = str(e)
+                continue
+            if voce is not None:
+                riepiloghi[percorso] = voce
+            else:
+                da_analizzare.append(percorso)
+
+        configurazioni = [{'percorso': percorso, 'giorni_festivi': self.giorni_festivi} for percorso in da_analizzare]
+        if len(configurazioni) < 8:
+            risultati = [_riepilogo_file_in_processo(configurazione) for configurazione in configurazioni]
+        else:
+            numero_processi = max_processi or min(len(configurazioni), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=numero_processi, mp_context=multiprocessing.get_context('spawn')) as pool:
+                risultati = list(pool.map(_riepilogo_file_in_processo, configurazioni))
+
+        indice = self._carica_indice_statistiche()
+        for percorso, voce, errore in risultati:
+            if errore is not None:
+                errori[percorso] = errore
+            else:
+                riepiloghi[percorso] = indice['file'][percorso] = voce
+        if risultati:
+            self._salva_indice_statistiche()
+        return riepiloghi, errori
+
+    def _aggrega_riepiloghi(self, riepiloghi):
+        """
+        Unisce i riepiloghi di più file (es. i mesi di un anno, anche di più negozi).
+        Restituisce {'per_mese': {(anno, mese): {addetto: statistiche}}, 'totali': {addetto: statistiche}},
+        con i mesi in ordine cronologico.
+        """
+        per_mese, totali = {}, {}
+        for voce in sorted(riepiloghi.values(), key=lambda voce: (voce['anno'], voce['mese'])):
+            mese_corrente = per_mese.setdefault((voce['anno'], voce['mese']), {})
+            for nome, statistiche in voce['addetti'].items():
+                for destinazione in (mese_corrente.setdefault(nome, self._nuove_statistiche_addetto()),
+                                     totali.setdefault(nome, self._nuove_statistiche_addetto())):
+                    for chiave, valore in statistiche.items():
+                        destinazione[chiave] += valore
+        for statistiche in [*totali.values(), *(s for mese in per_mese.values() for s in mese.values())]:
+            statistiche['ore'] = round(statistiche['ore'], 2)
+        return {'per_mese': per_mese, 'totali': dict(sorted(totali.items()))}
+
+    def _tabella_statistiche(self, riepilogo):
+        """
+        Tabella (DataFrame, una riga per addetto) del riepilogo di un file turni, per la finestra
+        Statistiche: contatori, media ore settimanali e verifica rispetto al massimo settimanale
+        dei dati correnti, calcolate per colonna. 'stato' vale 'avviso' (oltre il massimo senza
+        straordinari), 'straordinario' (oltre il massimo, autorizzato), 'sconosciuto' (addetto non
+        nei dati correnti) o ''.
+        """
+        tabella = pd.DataFrame.from_dict(riepilogo['addetti'], orient='index',
+                                         columns=list(self._nuove_statistiche_addetto()))
+        tabella.index.name = 'addetto'
+        tabella = tabella.reset_index()
+        num_settimane = riepilogo['num_giorni'] / 7.0
+        tabella['media_ore_sett'] = (tabella['ore'] / num_settimane).round(1) if num_settimane > 0 else 0.0
+        noto = tabella['addetto'].isin(list(self.addetti))
+        ore_max = tabella['addetto'].map(lambda nome: self.addetti.get(nome, {}).get('ore_max', 0)).astype(float)
+        straordinario = tabella['addetto'].map(lambda nome: bool(self.addetti.get(nome, {}).get('straordinario', False)))
+        oltre_max = noto & (ore_max > 0) & (tabella['media_ore_sett'] > ore_max + 0.1) # Tolleranza 0.1 ore
+        tabella['ore_max'] = ore_max
+        tabella['stato'] = np.select([~noto, oltre_max & ~straordinario, oltre_max], ['sconosciuto', 'avviso', 'straordinario'], '')
+        return tabella
+
+    def confronta_scenari(self):
+        """Confronta scenari What-If (letti da file JSON) valutandoli in parallelo"""
+        if not self.addetti or not self.turni_disponibili:
+            messagebox.showerror("Errore", "Definire addetti e turni prima di confrontare scenari.")
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Confronto Scenari What-If")
+        window.geometry("900x450")
+
+        frame_param = ttk.LabelFrame(window, text="Scenari e Periodo", padding=10)
+        frame_param.pack(fill='x', padx=10, pady=10)
+
+        file_var = tk.StringVar()
+        ttk.Label(frame_param, text="File scenari (JSON):").grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        ttk.Entry(frame_param, textvariable=file_var, width=50).grid(row=0, column=1, columnspan=4, padx=5, pady=5, sticky='ew')
+
+        def scegli_file():
+            percorso = filedialog.askopenfilename(parent=window, title="Seleziona file scenari",
+                                                  filetypes=[("JSON", "*.json"), ("Tutti i file", "*.*")])
+            if percorso:
+                file_var.set(percorso)
+        ttk.Button(frame_param, text="Sfoglia...", command=scegli_file).grid(row=0, column=5, padx=5, pady=5)
+
+        anno_var = tk.IntVar(value=datetime.now().year)
+        mese_var = tk.IntVar(value=datetime.now().month)
+        num_mesi_var = tk.IntVar(value=1)
+        ttk.Label(frame_param, text="Anno:").grid(row=1, column=0, padx=5, pady=5, sticky='w')
+        ttk.Spinbox(frame_param, from_=2000, to=2100, textvariable=anno_var, width=6).grid(row=1, column=1, padx=5, pady=5, sticky='w')
+        ttk.Label(frame_param, text="Mese (1-12):").grid(row=1, column=2, padx=5, pady=5, sticky='w')
+        ttk.Spinbox(frame_param, from_=1, to=12, textvariable=mese_var, width=4).grid(row=1, column=3, padx=5, pady=5, sticky='w')
+        ttk.Label(frame_param, text="Mesi:").grid(row=1, column=4, padx=5, pady=5, sticky='w')
+        ttk.Spinbox(frame_param, from_=1, to=12, textvariable=num_mesi_var, width=4).grid(row=1, column=5, padx=5, pady=5, sticky='w')
+        frame_param.grid_columnconfigure(1, weight=1)
+
+        # Tabella di confronto
+        colonne = [('scenario', "Scenario", 180), ('giorni_errore', "Giorni con errori", 110),
+                   ('ore_straordinario', "Ore straord.", 90), ('ore_mancanti', "Ore sotto contratto", 120),
+                   ('ore_totali', "Ore totali", 80), ('equita_ore', "Dev. std ore/contratto", 140),
+                   ('scarto_domeniche', "Scarto domeniche", 110)]
+        tabella = ttk.Treeview(window, columns=[c[0] for c in colonne], show='headings', height=10)
+        for chiave, titolo, larghezza in colonne:
+            tabella.heading(chiave, text=titolo)
+            tabella.column(chiave, width=larghezza, anchor='center' if chiave != 'scenario' else 'w')
+        tabella.pack(fill='both', expand=True, padx=10, pady=5)
+
+        stato_label = ttk.Label(window, text="")
+        stato_label.pack(pady=5)
+
+        coda_messaggi = queue.Queue()
+
+        def lavoro_valutazione(motore, scenari, anno, mese, num_mesi):
+            try:
+                coda_messaggi.put(('risultati', motore._valuta_scenari(scenari, anno, mese, num_mesi)))
+            except Exception as e:
+                coda_messaggi.put(('errore', e, traceback.format_exc()))
+
+        def controlla_coda():
+            if not window.winfo_exists():
+                return
+            try:
+                messaggio = coda_messaggi.get_nowait()
+            except queue.Empty:
+                window.after(200, controlla_coda)
+                return
+            btn_avvia.config(state='normal')
+            if messaggio[0] == 'risultati':
+                tabella.delete(*tabella.get_children())
+                for riga in messaggio[1]:
+                    tabella.insert('', tk.END, values=[riga[c[0]] for c in colonne])
+                stato_label.config(text=f"Valutati {len(messaggio[1])} scenari.")
+            else:
+                stato_label.config(text="Errore durante la valutazione.")
+                print(messaggio[2])
+                messagebox.showerror("Errore Scenari", f"Errore durante la valutazione degli scenari:\n{messaggio[1]}", parent=window)
+
+        def avvia():
+            percorso = file_var.get()
+            try:
+                with open(percorso, 'r', encoding='utf-8') as f:
+                    scenari = json.load(f)
+                if isinstance(scenari, dict): # Ammesso anche {"scenari": [...]}
+                    scenari = scenari.get('scenari', [])
+                anno, mese, num_mesi = anno_var.get(), mese_var.get(), num_mesi_var.get()
+                if not 1 <= mese <= 12 or num_mesi < 1:
+                    raise ValueError("Mese o numero di mesi non valido.")
+                motore = self._istantanea_dati()
+                for scenario in scenari:
+                    motore._applica_scenario(scenario) # Validazione immediata
+            except (OSError, ValueError, tk.TclError) as e:
+                messagebox.showerror("Errore Scenari", f"Impossibile preparare gli scenari:\n{e}", parent=window)
+                return
+            btn_avvia.config(state='disabled')
+            stato_label.config(text=f"Valutazione di {len(scenari) + 1} scenari in corso...")
+            threading.Thread(target=lavoro_valutazione, args=(motore, scenari, anno, mese, num_mesi), daemon=True).start()
+            window.after(200, controlla_coda)
+
+        btn_avvia = ttk.Button(frame_param, text="Confronta", command=avvia)
+        btn_avvia.grid(row=1, column=6, padx=10, pady=5)
+
+    def confronta_pianificazioni(self):
+        """Confronta due pianificazioni salvate (Excel o JSON) ed elenca le modifiche per addetto"""
+        window = tk.Toplevel(self.root)
+        window.title("Confronta Pianificazioni")
+        window.geometry("750x500")
+
+        frame_file = ttk.LabelFrame(window, text="Pianificazioni da confrontare", padding=10)
+        frame_file.pack(fill='x', padx=10, pady=10)
+        frame_file.grid_columnconfigure(1, weight=1)
+
+        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
+        file_prima_var = tk.StringVar()
+        file_dopo_var = tk.StringVar()
+        for riga, (etichetta, variabile) in enumerate((("Versione precedente:", file_prima_var),
+                                                        ("Nuova versione:", file_dopo_var))):
+            ttk.Label(frame_file, text=etichetta).grid(row=riga, column=0, padx=5, pady=5, sticky='w')
+            ttk.Entry(frame_file, textvariable=variabile, width=60).grid(row=riga, column=1, padx=5, pady=5, sticky='ew')
+
+            def scegli_file(variabile=variabile):
+                percorso = filedialog.askopenfilename(parent=window, title="Seleziona pianificazione", initialdir=desktop_path,
+                                                      filetypes=[("Turni (Excel o JSON)", "*.xlsx *.json"), ("Tutti i file", "*.*")])
+                if percorso:
+                    variabile.set(percorso)
+            ttk.Button(frame_file, text="Sfoglia...", command=scegli_file).grid(row=riga, column=2, padx=5, pady=5)
+
+        # Elenco modifiche raggruppato per addetto
+        tabella = ttk.Treeview(window, columns=('data', 'prima', 'dopo'), show='tree headings', height=12)
+        tabella.heading('#0', text="Addetto")
+        tabella.column('#0', width=180)
+        for chiave, titolo in (('data', "Data"), ('prima', "Prima"), ('dopo', "Dopo")):
+            tabella.heading(chiave, text=titolo)
+            tabella.column(chiave, width=150, anchor='center')
+        tabella.pack(fill='both', expand=True, padx=10, pady=5)
+
+        stato_label = ttk.Label(window, text="", wraplength=700)
+        stato_label.pack(pady=5)
+
+        risultato = {'differenze': None}
+
+        def confronta():
+            if not file_prima_var.get() or not file_dopo_var.get():
+                messagebox.showerror("Errore", "Selezionare entrambi i file da confrontare.", parent=window)
+                return
+            try:
+                differenze = self._confronta_file_turni(file_prima_var.get(), file_dopo_var.get())
+            except Exception as e:
+                print(f"Errore confronto pianificazioni: {e}")
+                traceback.print_exc()
+                messagebox.showerror("Errore Confronto", f"Impossibile confrontare i file:\n{e}", parent=window)
+                return
+            risultato['differenze'] = differenze
+            tabella.delete(*tabella.get_children())
+            anno, mese = differenze['anno'], differenze['mese']
+            for nome, modifiche in differenze['per_addetto'].items():
+                nodo = tabella.insert('', tk.END, text=f"{nome} ({len(modifiche)})", open=True)
+                for giorno, prima, dopo in modifiche:
+                    tabella.insert(nodo, tk.END, values=(f"{giorno:02d}/{mese:02d}/{anno}", prima, dopo))
+            testo = (f"{len(differenze['modifiche'])} modifiche per {len(differenze['per_addetto'])} addetti "
+                     f"in {len(differenze['per_giorno'])} giorni.")
+            if differenze['addetti_aggiunti']:
+                testo += f" Nuovi addetti: {', '.join(differenze['addetti_aggiunti'])}."
+            if differenze['addetti_rimossi']:
+                testo += f" Addetti non più presenti: {', '.join(differenze['addetti_rimossi'])}."
+            stato_label.config(text=testo)
+            btn_esporta.config(state='normal' if differenze['modifiche'] else 'disabled')
+
+        def esporta_excel():
+            differenze = risultato['differenze']
+            nome_file = filedialog.asksaveasfilename(
+                parent=window, title="Salva differenze", defaultextension=".xlsx", initialdir=desktop_path,
+                initialfile=f"Differenze_{calendar.month_name[differenze['mese']]}_{differenze['anno']}.xlsx",
+                filetypes=[("Excel", "*.xlsx")])
+            if not nome_file:
+                return
+            try:
+                self._scrivi_differenze_excel(differenze, nome_file)
+            except PermissionError:
+                messagebox.showerror("Errore Salvataggio Excel", f"Permesso negato.\nIl file '{nome_file}' potrebbe essere aperto in un altro programma. Chiuderlo e riprovare.", parent=window)
+                return
+            except Exception as e:
+                messagebox.showerror("Errore Salvataggio Excel", f"Errore durante il salvataggio del file Excel:\n{e}", parent=window)
+                traceback.print_exc()
+                return
+            try:
+                self._apri_file(nome_file)
+            except Exception as e_open:
+                print(f"Avviso: Impossibile aprire automaticamente il file Excel ({e_open})")
+
+        frame_bottoni = ttk.Frame(window, padding=(10, 0, 10, 10))
+        frame_bottoni.pack(fill='x')
+        ttk.Button(frame_bottoni, text="Confronta", command=confronta).pack(side=tk.LEFT, padx=5)
+        btn_esporta = ttk.Button(frame_bottoni, text="Esporta Excel con differenze", command=esporta_excel, state='disabled')
+        btn_esporta.pack(side=tk.LEFT, padx=5)
 
     def visualizza_statistiche(self):
         """Visualizza le statistiche dei turni leggendo un file Excel generato"""
@@ -1317,7 +3858,7 @@ class GestioneTurni:
         # Cerca file Excel nella cartella Desktop (dove li salviamo)
         desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
         try:
-            files_turni = [f for f in os.listdir(desktop_path) if f.startswith('Turni_') and f.endswith('.xlsx')]
+            files_turni = self._elenca_file_turni(desktop_path) # Già ordinati, più recente prima
         except FileNotFoundError:
              messagebox.showerror("Errore", f"Cartella Desktop non trovata: {desktop_path}")
              return
@@ -1335,274 +3876,500 @@ class GestioneTurni:
         frame_select.pack(pady=10, fill=tk.X)
 
         ttk.Label(frame_select, text="Seleziona file Excel dal Desktop:").pack(side=tk.LEFT, padx=5)
-        # Ordina i file per data (più recente prima)
-        files_turni.sort(key=lambda name: os.path.getmtime(os.path.join(desktop_path, name)), reverse=True)
         file_var = tk.StringVar(value=files_turni[0] if files_turni else "")
         combo_files = ttk.Combobox(frame_select, textvariable=file_var, values=files_turni, state='readonly', width=40)
         combo_files.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
 
-        # Frame per mostrare le statistiche (con scrollbar)
-        frame_stats_outer = ttk.Frame(window, padding=10)
-        frame_stats_outer.pack(pady=10, fill=tk.BOTH, expand=True)
-
-        canvas = tk.Canvas(frame_stats_outer)
-        scrollbar_stats = ttk.Scrollbar(frame_stats_outer, orient=tk.VERTICAL, command=canvas.yview)
-        # Frame interno al canvas per contenere le etichette
-        frame_stats_inner = ttk.Frame(canvas)
-
-        # Configura scrollbar e canvas
+        # Tabella delle statistiche: una riga per addetto in un Treeview (disegna solo le righe visibili),
+        # ordinabile cliccando sulle intestazioni e filtrabile senza rileggere il file
+        frame_filtro = ttk.Frame(window, padding=(10, 0))
+        frame_filtro.pack(fill=tk.X)
+        ttk.Label(frame_filtro, text="Filtra addetto:").pack(side=tk.LEFT, padx=5)
+        filtro_var = tk.StringVar()
+        ttk.Entry(frame_filtro, textvariable=filtro_var, width=25).pack(side=tk.LEFT, padx=5)
+        solo_avvisi_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_filtro, text="Solo con avvisi o errori", variable=solo_avvisi_var).pack(side=tk.LEFT, padx=10)
+
+        titolo_label = ttk.Label(window, text="", font=('Helvetica', 12, 'bold'))
+        titolo_label.pack(pady=5)
+
+        frame_tabella = ttk.Frame(window, padding=10)
+        frame_tabella.pack(fill=tk.BOTH, expand=True)
+        colonne = [('addetto', "Addetto", 160), ('giorni_lavorati', "Giorni lav.", 75), ('turni', "Turni", 55),
+                   ('ore', "Ore", 65), ('media_ore_sett', "Media sett.", 75), ('ferie', "Ferie", 55),
+                   ('riposi', "Riposi", 55), ('domeniche_lavorate', "Domeniche", 75),
+                   ('festivi_lavorati', "Festivi", 60), ('errori', "Errori", 55)]
+        tabella = ttk.Treeview(frame_tabella, columns=[c[0] for c in colonne], show='headings')
+        for chiave, titolo, larghezza in colonne:
+            tabella.heading(chiave, text=titolo, command=lambda chiave=chiave: ordina_per(chiave))
+            tabella.column(chiave, width=larghezza, anchor='w' if chiave == 'addetto' else 'center')
+        tabella.tag_configure('avviso', foreground='red')
+        tabella.tag_configure('straordinario', foreground='darkorange')
+        tabella.tag_configure('sconosciuto', foreground='gray')
+        scrollbar_stats = ttk.Scrollbar(frame_tabella, orient=tk.VERTICAL, command=tabella.yview)
+        tabella.configure(yscrollcommand=scrollbar_stats.set)
         scrollbar_stats.pack(side=tk.RIGHT, fill=tk.Y)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        canvas.configure(yscrollcommand=scrollbar_stats.set)
-        canvas_window = canvas.create_window((0, 0), window=frame_stats_inner, anchor="nw")
+        tabella.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        # Aggiorna scrollregion quando il frame interno cambia dimensione
-        def on_frame_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-        frame_stats_inner.bind("<Configure>", on_frame_configure)
+        # Dettaglio dell'addetto selezionato (verifica rispetto al monte ore)
+        dettaglio_label = ttk.Label(window, text="", wraplength=760)
+        dettaglio_label.pack(fill=tk.X, padx=10, pady=(0, 10))
 
-        # Aggiorna larghezza del frame interno quando il canvas cambia dimensione
-        def on_canvas_configure(event):
-             canvas.itemconfig(canvas_window, width=event.width)
-        canvas.bind("<Configure>", on_canvas_configure)
+        # Stato della tabella: righe del file corrente, ordinamento scelto
+        dati_tabella = {'righe': None, 'ordina': 'addetto', 'decrescente': False}
 
-        # Funzione per attivare scroll con rotellina mouse
-        def on_mouse_wheel(event):
-             # Su Windows/macOS delta è +/- 120, su Linux è +/- 1 (event.num)
-             if event.num == 4 or event.delta > 0: # Linux scroll up or Win/Mac scroll up
-                 canvas.yview_scroll(-1, "units")
-             elif event.num == 5 or event.delta < 0: # Linux scroll down or Win/Mac scroll down
-                 canvas.yview_scroll(1, "units")
+        def mostra_righe(*_):
+            """Ripopola il Treeview dalle righe già calcolate, applicando filtro e ordinamento."""
+            tabella.delete(*tabella.get_children())
+            righe = dati_tabella['righe']
+            if righe is None:
+                return
+            testo_filtro = filtro_var.get().strip().lower()
+            if testo_filtro:
+                righe = righe[righe['addetto'].str.lower().str.contains(testo_filtro, regex=False)]
+            if solo_avvisi_var.get():
+                righe = righe[righe['stato'].isin(['avviso', 'straordinario']) | (righe['errori'] > 0)]
+            chiave = dati_tabella['ordina']
+            righe = righe.sort_values([chiave, 'addetto'] if chiave != 'addetto' else chiave,
+                                      ascending=not dati_tabella['decrescente'], kind='stable',
+                                      key=lambda colonna: colonna.str.lower() if colonna.dtype == object else colonna)
+            for riga in righe.itertuples(index=False):
+                valori = [f"{riga.ore:.2f}" if chiave_col == 'ore' else getattr(riga, chiave_col) for chiave_col, _, _ in colonne]
+                tabella.insert('', tk.END, iid=riga.addetto, values=valori, tags=(riga.stato,) if riga.stato else ())
+            for chiave_col, titolo, _ in colonne:
+                freccia = (" ▼" if dati_tabella['decrescente'] else " ▲") if chiave_col == chiave else ""
+                tabella.heading(chiave_col, text=titolo + freccia)
+            dettaglio_label.config(text=f"{len(righe)} addetti su {len(dati_tabella['righe'])} mostrati.", foreground='black')
+
+        def ordina_per(chiave):
+            if dati_tabella['ordina'] == chiave:
+                dati_tabella['decrescente'] = not dati_tabella['decrescente']
+            else:
+                dati_tabella['ordina'], dati_tabella['decrescente'] = chiave, False
+            mostra_righe()
 
-        # Binding per diverse piattaforme
-        canvas.bind_all("<MouseWheel>", on_mouse_wheel) # Windows
-        canvas.bind_all("<Button-4>", on_mouse_wheel) # Linux scroll up
-        canvas.bind_all("<Button-5>", on_mouse_wheel) # Linux scroll down
+        def on_select_riga(event=None):
+            selezione = tabella.selection()
+            if not selezione or dati_tabella['righe'] is None:
+                return
+            riga = dati_tabella['righe'].set_index('addetto').loc[selezione[0]]
+            if riga['stato'] == 'avviso':
+                testo, colore = (f"⚠️ ATTENZIONE: Media ore sett. ({riga['media_ore_sett']:.1f}) > Max "
+                                 f"({riga['ore_max']:g}) senza autorizzazione straordinari!"), "red"
+            elif riga['stato'] == 'straordinario':
+                testo, colore = (f"INFO: Media ore sett. ({riga['media_ore_sett']:.1f}) > Max "
+                                 f"({riga['ore_max']:g}), con autorizzazione straordinari."), "darkorange"
+            elif riga['stato'] == 'sconosciuto':
+                testo, colore = "INFO: Addetto non trovato nei dati correnti dell'applicazione per verifica ore.", "gray"
+            else:
+                testo, colore = f"{selezione[0]}: nessun avviso sul monte ore.", "black"
+            if riga['errori'] > 0:
+                testo += f" Errori/Valori Sconosciuti: {riga['errori']}."
+                colore = 'red'
+            dettaglio_label.config(text=testo, foreground=colore)
 
+        tabella.bind('<<TreeviewSelect>>', on_select_riga)
+        filtro_var.trace_add('write', mostra_righe)
+        solo_avvisi_var.trace_add('write', mostra_righe)
 
         def aggiorna_statistiche():
             """Aggiorna le statistiche visualizzate leggendo l'Excel selezionato."""
-            # Pulisci frame statistiche precedente
-            for widget in frame_stats_inner.winfo_children():
-                widget.destroy()
+            dati_tabella['righe'] = None
+            mostra_righe()
+            titolo_label.config(text="")
 
             file_selezionato = file_var.get()
             if not file_selezionato:
-                ttk.Label(frame_stats_inner, text="Selezionare un file.").pack()
+                dettaglio_label.config(text="Selezionare un file.", foreground='black')
                 return
 
             file_path = os.path.join(desktop_path, file_selezionato)
 
             try:
-                    # ---> INIZIO CODICE AGGIUNTO/MODIFICATO <---
-                # Estrai anno e mese dal nome del file (es. Turni_Maggio_2025.xlsx)
-                try:
-                    # Prova a separare nome, mese, anno
-                    parts = file_selezionato.replace('.xlsx','').split('_')
-                    if len(parts) >= 3:
-                        anno_stats = int(parts[-1])
-                        # Converti nome mese italiano in numero mese
-                        nome_mese_stats = parts[-2].capitalize()
-                        # Assicurati che mesi_italiano sia definito come in genera_pianificazione
-                        mesi_italiano = [""] + list(calendar.month_name)[1:]
-                        try:
-                            import locale
-                            # Tentativo impostazione locale per nomi mese
-                            try:
-                                    locale.setlocale(locale.LC_TIME, 'it_IT.UTF-8')
-                            except locale.Error: # Fallback se locale non supportato
-                                try: # try:
-                                        locale.setlocale(locale.LC_TIME, 'Italian_Italy') # Windows?
-                                except:
-                                        pass # Usa inglese se fallisce
-                            mesi_italiano = [""] + [calendar.month_name[i].capitalize() for i in range(1, 13)]
-                        except ImportError:
-                            print("Modulo locale non trovato, uso nomi mese inglesi.")
-                            pass
-
-                        try:
-                            mese_stats = mesi_italiano.index(nome_mese_stats)
-                            if mese_stats == 0: raise ValueError
-                        except ValueError:
-                            raise ValueError(f"Nome mese '{nome_mese_stats}' non riconosciuto.")
-
-                        # Ottieni i festivi per quel mese/anno
-                        festivi_mese_corrente = self._get_festivi_mese(anno_stats, mese_stats)
-                        print(f"Statistiche: Calcolati festivi per {nome_mese_stats} {anno_stats}: {festivi_mese_corrente}")
-                    else:
-                        raise ValueError("Formato nome file non riconosciuto (atteso Turni_Mese_Anno.xlsx)")
-                except Exception as e_parse:
-                    messagebox.showerror("Errore Nome File", f"Impossibile determinare mese/anno dal nome file '{file_selezionato}'.\nErrore: {e_parse}\nImpossibile calcolare festivi lavorati.")
-                    # Definisci comunque la variabile come set vuoto per evitare il NameError
-                    festivi_mese_corrente = set()
-                # ---> FINE CODICE AGGIUNTO/MODIFICATO <---
-                # Carica dati Excel usando pandas
-                df = pd.read_excel(file_path, index_col=None) # Legge la prima riga come header
-
-                # Verifica colonne attese
-                if not df.columns.to_list() or not df.columns[0].lower() == 'data':
-                     ttk.Label(frame_stats_inner, text=f"Errore: Il file '{file_selezionato}' non sembra avere il formato atteso (manca colonna 'Data'?).").pack(padx=5, pady=5)
-                     return
-
-                nomi_addetti_excel = df.columns[1:] # Nomi addetti dalle colonne Excel
-
-                ttk.Label(frame_stats_inner, text=f"Statistiche per: {file_selezionato}", font=('Helvetica', 12, 'bold')).pack(pady=10)
-
-                # Calcola statistiche per ogni addetto presente nel file Excel
-                for addetto in nomi_addetti_excel:
-                    # Inizializza contatori per questo addetto
-                    turni_totali = 0
-                    ferie = 0
-                    riposi = 0
-                    festivi_lavorati = 0 # Contiamo turni nei giorni festivi
-                    ore_totali = 0.0
-                    domeniche_lavorate = 0
-                    errori_cella = 0
-                    giorni_effettivi_lavorati = 0 # Conta giorni con un turno valido
-
-                    # Analizziamo ogni riga (giorno) per questo addetto
-                    for index, riga in df.iterrows():
-                        # Ottieni la data dalla prima colonna
-                        try:
-                            # Prova diversi formati comuni per la data (es. 'gg/mm/aaaa (Gio)')
-                            data_str = str(riga.iloc[0]).split('(')[0].strip()
-                            data = datetime.strptime(data_str, '%d/%m/%Y')
-                        except (ValueError, TypeError):
-                            # print(f"Riga {index+2}: Impossibile interpretare la data '{riga.iloc[0]}'. Salto riga.")
-                            continue # Salta riga se la data non è interpretabile
-
-                        # Determina se è festivo (usando la stessa logica della generazione)
-                        data_str_dm = data.strftime('%d-%m')
-                        is_festivo = data_str_dm in festivi_mese_corrente
-
-                        # Ottieni il valore della cella per l'addetto corrente
-                        try:
-                             valore_cella = str(riga[addetto]).strip() if pd.notna(riga[addetto]) else "-"
-                        except KeyError:
-                             # print(f"Addetto '{addetto}' non trovato nel file Excel alla riga {index+2}")
-                             continue # Addetto non presente nel file?
-
-                        # Analizza il contenuto della cella
-                        if valore_cella == "FERIE":
-                            ferie += 1
-                        elif valore_cella == "RIPOSO":
-                            riposi += 1
-                        elif valore_cella == "FESTIVO":
-                             # Non conta come giorno lavorato, ma potrebbe essere utile saperlo
-                             pass
-                        elif valore_cella == "-" or valore_cella == "":
-                             # Giorno non lavorato (non ferie/riposo/festivo)
-                             pass
-                        elif 'ERR' in valore_cella: # Cattura celle marcate come Errore
-                            errori_cella += 1
-                        elif '-' in valore_cella and ':' in valore_cella:
-                            # Probabilmente è un turno "HH:MM-HH:MM"
-                            try:
-                                inizio_str, fine_str = valore_cella.split('-')
-                                inizio_min = self._get_orario_in_minuti(inizio_str.strip())
-                                fine_min = self._get_orario_in_minuti(fine_str.strip())
-
-                                if inizio_min is not None and fine_min is not None:
-                                    turni_totali += 1
-                                    giorni_effettivi_lavorati += 1
-                                    durata_min = fine_min - inizio_min
-                                    if durata_min < 0: durata_min += 24 * 60 # Mezzanotte
-                                    ore_totali += durata_min / 60.0
-
-                                    # Controlla se è domenica
-                                    if data.weekday() == 6: # Domenica = 6
-                                        domeniche_lavorate += 1
-                                    # Controlla se è festivo lavorato
-                                    if is_festivo:
-                                         festivi_lavorati += 1
-                                else:
-                                     # Formato ora non valido dentro il turno?
-                                     # print(f"Addetto {addetto}, Giorno {data_str}: formato ora non valido in '{valore_cella}'")
-                                     errori_cella += 1
-                            except ValueError:
-                                # Errore nello split o formato?
-                                # print(f"Addetto {addetto}, Giorno {data_str}: impossibile analizzare turno '{valore_cella}'")
-                                errori_cella += 1
-                        else:
-                             # Valore non riconosciuto
-                             # print(f"Addetto {addetto}, Giorno {data_str}: valore cella non riconosciuto '{valore_cella}'")
-                             errori_cella += 1
-
-
-                    # Crea frame per le statistiche dell'addetto
-                    frame_addetto = ttk.LabelFrame(frame_stats_inner, text=addetto, padding=10)
-                    frame_addetto.pack(fill=tk.X, padx=10, pady=5)
-
-                    # Mostra statistiche calcolate
-                    ttk.Label(frame_addetto, text=f"Giorni Lavorati: {giorni_effettivi_lavorati}").grid(row=0, column=0, sticky='w', padx=5)
-                    ttk.Label(frame_addetto, text=f"Turni Totali: {turni_totali}").grid(row=0, column=1, sticky='w', padx=5)
-                    ttk.Label(frame_addetto, text=f"Ore Lavorate: {ore_totali:.2f}").grid(row=0, column=2, sticky='w', padx=5)
-
-                    ttk.Label(frame_addetto, text=f"Giorni Ferie: {ferie}").grid(row=1, column=0, sticky='w', padx=5)
-                    ttk.Label(frame_addetto, text=f"Giorni Riposo: {riposi}").grid(row=1, column=1, sticky='w', padx=5)
-
-                    ttk.Label(frame_addetto, text=f"Domeniche Lavorate: {domeniche_lavorate}").grid(row=2, column=0, sticky='w', padx=5)
-                    ttk.Label(frame_addetto, text=f"Festivi Lavorati: {festivi_lavorati}").grid(row=2, column=1, sticky='w', padx=5)
-
-                    if errori_cella > 0:
-                         ttk.Label(frame_addetto, text=f"Errori/Valori Sconosciuti: {errori_cella}", foreground='red').grid(row=2, column=2, sticky='w', padx=5)
-
-
-                    # Verifica rispetto monte ore (se l'addetto è nei dati correnti dell'app)
-                    if addetto in self.addetti:
-                        info_addetto = self.addetti[addetto]
-                        ore_contratto = info_addetto.get('ore_contratto', 0)
-                        ore_max = info_addetto.get('ore_max', 0)
-                        straordinario_ok = info_addetto.get('straordinario', False)
-                        stato_ore = ""
-                        colore_stato = "black"
-
-                        # Calcola media ore settimanali (approssimata)
-                        num_settimane = df.shape[0] / 7.0 # Numero giorni / 7
-                        media_ore_sett = ore_totali / num_settimane if num_settimane > 0 else 0
-
-                        # Verifica limite massimo settimanale (più significativo del totale mensile)
-                        if ore_max > 0 and media_ore_sett > (ore_max + 0.1) and not straordinario_ok: # Tolleranza 0.1 ore
-                             stato_ore = f"⚠️ ATTENZIONE: Media ore sett. ({media_ore_sett:.1f}) > Max ({ore_max}) senza autorizzazione straordinari!"
-                             colore_stato = "red"
-                        elif ore_max > 0 and media_ore_sett > (ore_max + 0.1):
-                             stato_ore = f"INFO: Media ore sett. ({media_ore_sett:.1f}) > Max ({ore_max}), con autorizzazione straordinari."
-                             colore_stato = "darkorange"
-                        # elif ore_contratto > 0 and media_ore_sett < (ore_contratto - 0.1):
-                        #      stato_ore = f"INFO: Media ore sett. ({media_ore_sett:.1f}) < Contratto ({ore_contratto})."
-                        #      colore_stato = "blue"
-
-                        if stato_ore:
-                             ttk.Label(frame_addetto, text=stato_ore, foreground=colore_stato).grid(row=3, column=0, columnspan=3, sticky='w', padx=5, pady=5)
-                    else:
-                         ttk.Label(frame_addetto, text="INFO: Addetto non trovato nei dati correnti dell'applicazione per verifica ore.", foreground='gray').grid(row=3, column=0, columnspan=3, sticky='w', padx=5, pady=5)
-
-                    # Configura colonne del frame addetto per allineamento
-                    frame_addetto.grid_columnconfigure(0, weight=1)
-                    frame_addetto.grid_columnconfigure(1, weight=1)
-                    frame_addetto.grid_columnconfigure(2, weight=1)
-
-
+                # Riepilogo per addetto dall'indice (il file viene analizzato solo se è cambiato)
+                riepilogo = self._riepilogo_file_turni(file_path)
+                dati_tabella['righe'] = self._tabella_statistiche(riepilogo)
+            except ValueError as e_formato:
+                 dettaglio_label.config(text=f"Errore: Il file '{file_selezionato}' non sembra avere il formato atteso:\n{e_formato}", foreground='red')
+                 return
             except FileNotFoundError:
-                 ttk.Label(frame_stats_inner, text=f"Errore: File non trovato '{file_path}'.").pack(padx=5, pady=5)
+                 dettaglio_label.config(text=f"Errore: File non trovato '{file_path}'.", foreground='red')
+                 return
             except Exception as e:
-                 ttk.Label(frame_stats_inner, text=f"Errore imprevisto nell'analisi del file:\n{e}").pack(padx=5, pady=5)
+                 dettaglio_label.config(text=f"Errore imprevisto nell'analisi del file:\n{e}", foreground='red')
                  print(f"Errore analisi statistiche: {e}")
                  traceback.print_exc()
+                 return
 
-            # Aggiorna la scrollregion dopo aver aggiunto tutto
-            canvas.update_idletasks() # Assicura che le dimensioni siano aggiornate
-            canvas.config(scrollregion=canvas.bbox("all"))
+            titolo_label.config(text=f"Statistiche per: {file_selezionato}")
+            mostra_righe()
 
         # Bottone per aggiornare statistiche
         btn_aggiorna = ttk.Button(frame_select, text="Mostra Statistiche", command=aggiorna_statistiche)
         btn_aggiorna.pack(side=tk.LEFT, padx=10)
+        ttk.Button(frame_select, text="Totali per Periodo...",
+                   command=lambda: self.visualizza_statistiche_aggregate(desktop_path, files_turni)).pack(side=tk.LEFT, padx=5)
 
         # Aggiorna statistiche iniziali se un file è preselezionato
         if file_var.get():
             aggiorna_statistiche()
 
 
+    def visualizza_statistiche_aggregate(self, cartella, files_turni):
+        """Totali per addetto su più mesi (anno o da inizio anno), con dettaglio per mese"""
+        window = tk.Toplevel(self.root)
+        window.title("Statistiche Aggregate per Periodo")
+        window.geometry("950x550")
+
+        # Anni disponibili dai nomi dei file (Turni_[Negozio_]<Mese>_<Anno>.xlsx)
+        anni = sorted({int(nome[:-5].rsplit('_', 1)[-1]) for nome in files_turni
+                       if nome[:-5].rsplit('_', 1)[-1].isdigit()}, reverse=True)
+
+        frame_param = ttk.Frame(window, padding=10)
+        frame_param.pack(fill='x')
+        ttk.Label(frame_param, text="Anno:").pack(side=tk.LEFT, padx=5)
+        anno_var = tk.IntVar(value=anni[0] if anni else datetime.now().year)
+        ttk.Spinbox(frame_param, from_=2000, to=2100, textvariable=anno_var, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Label(frame_param, text="Fino al mese (1-12):").pack(side=tk.LEFT, padx=5)
+        fino_a_var = tk.IntVar(value=12)
+        ttk.Spinbox(frame_param, from_=1, to=12, textvariable=fino_a_var, width=4).pack(side=tk.LEFT, padx=5)
+
+        colonne = [('ore', "Ore", 80), ('turni', "Turni", 60), ('giorni_lavorati', "Giorni lav.", 80),
+                   ('domeniche_lavorate', "Domeniche", 80), ('festivi_lavorati', "Festivi", 70),
+                   ('ferie', "Ferie", 60), ('riposi', "Riposi", 60), ('errori', "Errori", 60)]
+        tabella = ttk.Treeview(window, columns=[c[0] for c in colonne], show='tree headings')
+        tabella.heading('#0', text="Addetto / Mese")
+        tabella.column('#0', width=200)
+        for chiave, titolo, larghezza in colonne:
+            tabella.heading(chiave, text=titolo)
+            tabella.column(chiave, width=larghezza, anchor='center')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tabella.yview)
+        tabella.configure(yscrollcommand=scrollbar.set)
+
+        stato_label = ttk.Label(window, text="", wraplength=900)
+        stato_label.pack(side=tk.BOTTOM, pady=5)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y, padx=(0, 10))
+        tabella.pack(fill='both', expand=True, padx=(10, 0), pady=5)
+
+        coda_messaggi = queue.Queue()
+
+        def lavoro_aggregazione(motore, percorsi, anno, fino_a):
+            try:
+                riepiloghi, errori = motore._riepiloghi_file_turni(percorsi)
+                # Il nome del file indica solo l'anno: il mese viene verificato sul contenuto
+                riepiloghi = {percorso: voce for percorso, voce in riepiloghi.items()
+                              if voce['anno'] == anno and voce['mese'] <= fino_a}
+                coda_messaggi.put(('risultati', motore._aggrega_riepiloghi(riepiloghi), len(riepiloghi), errori))
+            except Exception as e:
+                coda_messaggi.put(('errore', e, traceback.format_exc()))
+
+        def controlla_coda():
+            if not window.winfo_exists():
+                return
+            try:
+                messaggio = coda_messaggi.get_nowait()
+            except queue.Empty:
+                window.after(200, controlla_coda)
+                return
+            btn_calcola.config(state='normal')
+            if messaggio[0] == 'errore':
+                stato_label.config(text="Errore durante il calcolo.")
+                print(messaggio[2])
+                messagebox.showerror("Errore Statistiche", f"Errore durante il calcolo delle statistiche:\n{messaggio[1]}", parent=window)
+                return
+            aggregato, num_file, errori = messaggio[1], messaggio[2], messaggio[3]
+            tabella.delete(*tabella.get_children())
+            for nome, totali in aggregato['totali'].items():
+                nodo = tabella.insert('', tk.END, text=nome, values=[totali[c[0]] for c in colonne])
+                for (anno_m, mese_m), per_addetto in aggregato['per_mese'].items():
+                    if nome in per_addetto:
+                        tabella.insert(nodo, tk.END, text=f"{calendar.month_name[mese_m]} {anno_m}",
+                                       values=[per_addetto[nome][c[0]] for c in colonne])
+            testo = f"{num_file} file analizzati, {len(aggregato['per_mese'])} mesi."
+            if errori:
+                testo += f" File non leggibili: {', '.join(os.path.basename(p) for p in errori)}."
+                print("Errori statistiche aggregate:", errori)
+            stato_label.config(text=testo)
+
+        def calcola():
+            try:
+                anno, fino_a = anno_var.get(), fino_a_var.get()
+                if not 1 <= fino_a <= 12: raise ValueError
+            except (tk.TclError, ValueError):
+                messagebox.showerror("Errore Input", "Anno o mese non validi.", parent=window)
+                return
+            percorsi = [os.path.join(cartella, nome) for nome in files_turni if nome[:-5].endswith(f"_{anno}")]
+            if not percorsi:
+                messagebox.showinfo("Info", f"Nessun file turni trovato per il {anno}.", parent=window)
+                return
+            btn_calcola.config(state='disabled')
+            stato_label.config(text=f"Analisi di {len(percorsi)} file in corso...")
+            threading.Thread(target=lavoro_aggregazione, args=(self._istantanea_dati(), percorsi, anno, fino_a),
+                             daemon=True).start()
+            window.after(200, controlla_coda)
+
+        btn_calcola = ttk.Button(frame_param, text="Calcola", command=calcola)
+        btn_calcola.pack(side=tk.LEFT, padx=10)
+
+    def mostra_anteprima(self, anteprime, titolo, salva=None, avviso=None, parent=None):
+        """
+        Anteprima a video della pianificazione generata, senza passare da Excel.
+        `anteprime`: {negozio (o None): AccumulatoreAnteprima}. La griglia (giorni x addetti,
+        colori di self.colori) è disegnata su un canvas e vengono disegnate solo le celle
+        visibili: lo scorrimento resta fluido anche con centinaia di addetti e un anno di giorni.
+        `salva`: funzione senza argomenti che salva i file (bottone "Salva file"); None = già salvati.
+        Se i file non sono ancora salvati le celle si possono modificare (doppio clic): ogni modifica
+        viene verificata subito (ore massime, riposi, ferie, copertura) con ValidatoreIncrementale
+        e le violazioni sono evidenziate nella griglia.
+        La finestra viene chiusa insieme a `parent`, se indicato. Restituisce la finestra.
+        """
+        LARGHEZZA_DATA, LARGHEZZA_CELLA, ALTEZZA_RIGA = 120, 96, 22
+        # Chiave di stile della cella (_testo_e_stile_cella) -> colore di self.colori (None = bianco)
+        colori_stile = {'mattina': 'turno_mattina', 'pomeriggio': 'turno_pomeriggio', 'ferie': 'ferie',
+                        'riposo': 'riposo', 'festivo': 'festivo', 'errore': 'errore', 'cella': None,
+                        'cella_weekend': 'weekend', 'cella_festivo': 'festivo'}
+        colori_data = {'': None, 'weekend': 'weekend', 'festivo': 'festivo'}
+
+        def colore(chiave):
+            return f"#{self.colori[chiave]}" if chiave else 'white'
+
+        window = tk.Toplevel(parent or self.root)
+        window.title(f"Anteprima - {titolo}")
+        window.geometry("1000x650")
+
+        frame_comandi = ttk.Frame(window, padding=(10, 10, 10, 0))
+        frame_comandi.pack(fill=tk.X)
+        negozio_var = tk.StringVar()
+        nomi_negozi = {negozio or "Pianificazione": negozio for negozio in anteprime}
+        if len(anteprime) > 1:
+            ttk.Label(frame_comandi, text="Negozio:").pack(side=tk.LEFT, padx=5)
+            combo_negozi = ttk.Combobox(frame_comandi, textvariable=negozio_var, values=list(nomi_negozi),
+                                        state='readonly', width=18)
+            combo_negozi.pack(side=tk.LEFT, padx=5)
+            combo_negozi.bind('<<ComboboxSelected>>', lambda event: cambia_negozio())
+        negozio_var.set(next(iter(nomi_negozi)))
+        info_label = ttk.Label(frame_comandi, text="")
+        info_label.pack(side=tk.LEFT, padx=10)
+
+        frame_griglia = ttk.Frame(window, padding=10)
+        frame_griglia.pack(fill=tk.BOTH, expand=True)
+        canvas = tk.Canvas(frame_griglia, background='white', highlightthickness=0,
+                           xscrollincrement=LARGHEZZA_CELLA, yscrollincrement=ALTEZZA_RIGA)
+        scrollbar_y = ttk.Scrollbar(frame_griglia, orient=tk.VERTICAL, command=lambda *args: scorri(canvas.yview, *args))
+        scrollbar_x = ttk.Scrollbar(frame_griglia, orient=tk.HORIZONTAL, command=lambda *args: scorri(canvas.xview, *args))
+        canvas.configure(xscrollcommand=scrollbar_x.set, yscrollcommand=scrollbar_y.set)
+        scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+        scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
+        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        cella_label = ttk.Label(window, text="", padding=(10, 0))
+        cella_label.pack(fill=tk.X)
+        frame_bottoni = ttk.Frame(window, padding=10)
+        frame_bottoni.pack(fill=tk.X)
+        if avviso:
+            ttk.Label(frame_bottoni, text=avviso, foreground='red', wraplength=600).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_bottoni, text="Chiudi", command=window.destroy).pack(side=tk.RIGHT, padx=5)
+        if salva is not None:
+            def salva_e_chiudi():
+                riepiloghi = [validatore.riepilogo() for validatore in validatori.values()]
+                if any(r['celle'] or r['oltre_max'] for r in riepiloghi) and not messagebox.askyesno(
+                        "Vincoli Violati", "Alcune modifiche violano i vincoli (celle evidenziate in rosso).\n\n"
+                        "Salvare comunque?", icon='warning', parent=window):
+                    return
+                salva()
+                window.destroy()
+            ttk.Button(frame_bottoni, text="Salva file (Excel e altri formati)", command=salva_e_chiudi).pack(side=tk.RIGHT, padx=5)
+
+        modificabile = salva is not None
+        stato = {'anteprima': None, 'validatore': None, 'modificate': set(), 'ridisegno': None}
+        validatori = {} # {negozio: ValidatoreIncrementale}, creati alla prima apertura del negozio
+        celle_modificate = {negozio: set() for negozio in anteprime} # {(riga, colonna)} per negozio
+
+        def cambia_negozio():
+            negozio = nomi_negozi[negozio_var.get()]
+            anteprima = stato['anteprima'] = anteprime[negozio]
+            if modificabile and negozio not in validatori:
+                validatori[negozio] = ValidatoreIncrementale(anteprima.calendari)
+            stato['validatore'] = validatori.get(negozio)
+            stato['modificate'] = celle_modificate[negozio]
+            larghezza = LARGHEZZA_DATA + len(anteprima.addetti) * LARGHEZZA_CELLA
+            altezza = (len(anteprima.righe) + 1) * ALTEZZA_RIGA
+            canvas.configure(scrollregion=(0, 0, larghezza, altezza))
+            canvas.xview_moveto(0)
+            canvas.yview_moveto(0)
+            aggiorna_info()
+            programma_ridisegno()
+
+        def aggiorna_info():
+            anteprima, validatore = stato['anteprima'], stato['validatore']
+            testo = f"{len(anteprima.righe)} giorni, {len(anteprima.addetti)} addetti"
+            problemi = bool(anteprima.giorni_errore)
+            if anteprima.giorni_errore:
+                testo += f", {len(anteprima.giorni_errore)} giorni con errori"
+            if validatore is not None:
+                riepilogo = validatore.riepilogo()
+                problemi = problemi or riepilogo['celle'] or riepilogo['oltre_max']
+                testo += (f" | modifiche: {len(stato['modificate'])}, celle con vincoli violati: {riepilogo['celle']}, "
+                          f"addetti oltre ore max: {riepilogo['oltre_max']} (doppio clic per modificare)")
+            info_label.config(text=testo, foreground='red' if problemi else 'black')
+
+        def programma_ridisegno(event=None):
+            # Più eventi ravvicinati (scorrimento, ridimensionamento) = un solo ridisegno
+            if stato['ridisegno'] is None:
+                stato['ridisegno'] = window.after_idle(ridisegna)
+
+        def scorri(vista, *args):
+            vista(*args)
+            programma_ridisegno()
+
+        def ridisegna():
+            """Ridisegna le sole celle visibili, con intestazione e colonna delle date sempre in vista."""
+            stato['ridisegno'] = None
+            anteprima, validatore = stato['anteprima'], stato['validatore']
+            canvas.delete('all')
+            x0, y0 = canvas.canvasx(0), canvas.canvasy(0)
+            larghezza, altezza = canvas.winfo_width(), canvas.winfo_height()
+            prima_colonna = max(0, int((x0 - LARGHEZZA_DATA) // LARGHEZZA_CELLA))
+            ultima_colonna = min(len(anteprima.addetti), int((x0 + larghezza - LARGHEZZA_DATA) // LARGHEZZA_CELLA) + 1)
+            prima_riga = max(0, int(y0 // ALTEZZA_RIGA) - 1)
+            ultima_riga = min(len(anteprima.righe), int((y0 + altezza) // ALTEZZA_RIGA))
+
+            evidenziate = [] # Bordi delle celle modificate o con vincoli violati, disegnati sopra la griglia
+            for indice_riga in range(prima_riga, ultima_riga):
+                data, _, codici = anteprima.righe[indice_riga]
+                y = (indice_riga + 1) * ALTEZZA_RIGA
+                for colonna in range(prima_colonna, min(ultima_colonna, len(codici))):
+                    testo, chiave_stile = anteprima.voci[codici[colonna]]
+                    x = LARGHEZZA_DATA + colonna * LARGHEZZA_CELLA
+                    canvas.create_rectangle(x, y, x + LARGHEZZA_CELLA, y + ALTEZZA_RIGA, outline='#A0A0A0',
+                                            fill=colore(colori_stile.get(chiave_stile)))
+                    canvas.create_text(x + LARGHEZZA_CELLA / 2, y + ALTEZZA_RIGA / 2, text=testo,
+                                       fill='white' if chiave_stile == 'errore' else 'black')
+                    if validatore is not None and validatore.problemi(data, anteprima.addetti[colonna]):
+                        evidenziate.append((x, y, colore('errore')))
+                    elif (indice_riga, colonna) in stato['modificate']:
+                        evidenziate.append((x, y, colore('modificato')))
+            for x, y, colore_bordo in evidenziate:
+                canvas.create_rectangle(x + 1, y + 1, x + LARGHEZZA_CELLA - 1, y + ALTEZZA_RIGA - 1,
+                                        outline=colore_bordo, width=3)
+
+            # Colonna delle date (bloccata a sinistra)
+            for indice_riga in range(prima_riga, ultima_riga):
+                data, tipo_giorno, _ = anteprima.righe[indice_riga]
+                errore = indice_riga in anteprima.giorni_errore
+                y = (indice_riga + 1) * ALTEZZA_RIGA
+                canvas.create_rectangle(x0, y, x0 + LARGHEZZA_DATA, y + ALTEZZA_RIGA, outline='#A0A0A0',
+                                        fill=colore('errore' if errore else colori_data[tipo_giorno]))
+                canvas.create_text(x0 + 6, y + ALTEZZA_RIGA / 2, anchor='w',
+                                   text=f"{data.day:02d}/{data.month:02d}/{data.year} ({data.strftime('%a')})",
+                                   fill='white' if errore else 'black')
+
+            # Intestazione con i nomi degli addetti (bloccata in alto; in rosso chi supera le ore massime)
+            oltre_max = {nome for nome, _, _ in validatore.oltre_max} if validatore is not None else set()
+            for colonna in range(prima_colonna, ultima_colonna):
+                x = LARGHEZZA_DATA + colonna * LARGHEZZA_CELLA
+                canvas.create_rectangle(x, y0, x + LARGHEZZA_CELLA, y0 + ALTEZZA_RIGA, outline='#A0A0A0',
+                                        fill=colore('header'))
+                canvas.create_text(x + LARGHEZZA_CELLA / 2, y0 + ALTEZZA_RIGA / 2, text=anteprima.addetti[colonna],
+                                   font=('Helvetica', 9, 'bold'), width=LARGHEZZA_CELLA - 4,
+                                   fill='red' if anteprima.addetti[colonna] in oltre_max else 'black')
+            canvas.create_rectangle(x0, y0, x0 + LARGHEZZA_DATA, y0 + ALTEZZA_RIGA, outline='#A0A0A0', fill=colore('header'))
+            canvas.create_text(x0 + LARGHEZZA_DATA / 2, y0 + ALTEZZA_RIGA / 2, text="Data", font=('Helvetica', 9, 'bold'))
+
+        def cella_in(event):
+            """(indice_riga, colonna) della cella sotto il mouse, o None (intestazione, date, fuori griglia)."""
+            anteprima = stato['anteprima']
+            x, y = canvas.canvasx(event.x), canvas.canvasy(event.y)
+            indice_riga = int(y // ALTEZZA_RIGA) - 1
+            colonna = int((x - LARGHEZZA_DATA) // LARGHEZZA_CELLA)
+            if event.y < ALTEZZA_RIGA or event.x < LARGHEZZA_DATA or not 0 <= indice_riga < len(anteprima.righe):
+                return None
+            if not 0 <= colonna < len(anteprima.righe[indice_riga][2]):
+                return None
+            return indice_riga, colonna
+
+        def mostra_cella(event):
+            """Testo completo della cella sotto il mouse (i nomi lunghi sono troncati nella griglia) e vincoli violati."""
+            anteprima, validatore = stato['anteprima'], stato['validatore']
+            cella = cella_in(event)
+            if cella is None:
+                cella_label.config(text="")
+                return
+            data, _, codici = anteprima.righe[cella[0]]
+            nome = anteprima.addetti[cella[1]]
+            testo = f"{nome} - {data.strftime('%d/%m/%Y')}: {anteprima.voci[codici[cella[1]]][0]}"
+            problemi = validatore.problemi(data, nome) if validatore is not None else []
+            if validatore is not None and validatore.giorno_scoperto(data):
+                problemi = problemi + ["copertura del giorno incompleta"]
+            if problemi:
+                testo += " - ATTENZIONE: " + "; ".join(problemi)
+            cella_label.config(text=testo, foreground='red' if problemi else 'black')
+
+        def modifica_cella(event):
+            """Doppio clic: menu con i turni disponibili e gli stati assegnabili alla cella."""
+            cella = cella_in(event)
+            if cella is None or stato['validatore'] is None:
+                return
+            indice_riga, colonna = cella
+            anteprima = stato['anteprima']
+            motore = next(motore for motore, anno, mese, _ in anteprima.calendari
+                          if (anno, mese) == (anteprima.righe[indice_riga][0].year, anteprima.righe[indice_riga][0].month))
+            menu = tk.Menu(window, tearoff=0)
+            for turno in motore.turni_disponibili:
+                menu.add_command(label=f"{turno[0]}-{turno[1]}",
+                                 command=lambda turno=turno: applica_modifica(indice_riga, colonna, [turno[0], turno[1]]))
+            menu.add_separator()
+            for stato_turno, etichetta in (('RIPOSO', "RIPOSO"), ('FERIE', "FERIE"), ('-', "Nessun turno (-)")):
+                menu.add_command(label=etichetta,
+                                 command=lambda stato_turno=stato_turno: applica_modifica(indice_riga, colonna, stato_turno))
+            menu.tk_popup(event.x_root, event.y_root)
+
+        def applica_modifica(indice_riga, colonna, stato_turno):
+            anteprima, validatore = stato['anteprima'], stato['validatore']
+            data = anteprima.righe[indice_riga][0]
+            validatore.imposta(data, anteprima.addetti[colonna], stato_turno)
+            anteprima.modifica_cella(indice_riga, colonna, stato_turno, validatore.errore_giorno(data))
+            stato['modificate'].add((indice_riga, colonna))
+            aggiorna_info()
+            programma_ridisegno()
+
+        def rotellina(event, vista):
+            # Su Windows/macOS delta è +/- 120, su Linux arrivano Button-4/5
+            passi = -1 if event.num == 4 or event.delta > 0 else 1
+            scorri(vista, 'scroll', passi * 3, 'units')
+
+        canvas.bind('<Configure>', programma_ridisegno)
+        canvas.bind('<Motion>', mostra_cella)
+        if modificabile:
+            canvas.bind('<Double-Button-1>', modifica_cella)
+        canvas.bind('<MouseWheel>', lambda event: rotellina(event, canvas.yview))
+        canvas.bind('<Shift-MouseWheel>', lambda event: rotellina(event, canvas.xview))
+        canvas.bind('<Button-4>', lambda event: rotellina(event, canvas.yview))
+        canvas.bind('<Button-5>', lambda event: rotellina(event, canvas.yview))
+        canvas.bind('<Shift-Button-4>', lambda event: rotellina(event, canvas.xview))
+        canvas.bind('<Shift-Button-5>', lambda event: rotellina(event, canvas.xview))
+        cambia_negozio()
+        return window
+
+    _nomi_mesi_locali = None
+
+    @classmethod
+    def _nomi_mesi(cls):
+        """
+        Nomi dei mesi (indice 1-12, in italiano se il locale è disponibile). Il locale viene
+        impostato una volta sola, alla prima richiesta, e non a ogni apertura di finestra.
+        """
+        if cls._nomi_mesi_locali is None:
+            try:
+                # Imposta locale italiano per nomi mese, se possibile
+                import locale
+                locale.setlocale(locale.LC_TIME, 'it_IT.UTF-8')
+                cls._nomi_mesi_locali = [""] + [calendar.month_name[i].capitalize() for i in range(1, 13)]
+            except locale.Error:
+                print("Locale italiano non disponibile, usando nomi mese default.")
+                cls._nomi_mesi_locali = [""] + list(calendar.month_name)[1:] # Usa nomi default se locale non trovato
+        return cls._nomi_mesi_locali
+
     def genera_pianificazione(self):
         """Genera la pianificazione dei turni per il mese selezionato"""
         if not self.addetti:
@@ -1615,7 +4382,7 @@ class GestioneTurni:
 
         window = tk.Toplevel(self.root)
         window.title("Genera Pianificazione Mensile")
-        window.geometry("400x200") # Ridotta finestra
+        window.geometry("420x460") # Ridotta finestra
 
         # Frame per selezione periodo
         frame_periodo = ttk.LabelFrame(window, text="Seleziona Periodo", padding=10)
@@ -1630,95 +4397,1971 @@ class GestioneTurni:
 
         # Mese
         ttk.Label(frame_periodo, text="Mese:").grid(row=0, column=2, padx=5, pady=5, sticky='w')
-        mesi_italiano = [""] + list(calendar.month_name)[1:] # Usa nomi mese completi
-        try:
-            # Imposta locale italiano per nomi mese, se possibile
-            import locale
-            locale.setlocale(locale.LC_TIME, 'it_IT.UTF-8')
-            mesi_italiano = [""] + [calendar.month_name[i].capitalize() for i in range(1, 13)]
-        except:
-            print("Locale italiano non disponibile, usando nomi mese default.")
-            pass # Usa nomi default se locale non trovato
+        mesi_italiano = self._nomi_mesi() # Usa nomi mese completi
 
         mese_var = tk.StringVar(value=mesi_italiano[datetime.now().month])
         ttk.Combobox(frame_periodo, textvariable=mese_var,
                     values=mesi_italiano[1:], state='readonly', width=12).grid(row=0, column=3, padx=5, pady=5, sticky='w')
 
-        # Funzione interna chiamata dal bottone
-        def genera():
-            """Genera i turni per il mese selezionato"""
+        # Numero di mesi consecutivi (1 = solo il mese selezionato, 12 = un anno intero)
+        ttk.Label(frame_periodo, text="Mesi:").grid(row=1, column=0, padx=5, pady=5, sticky='w')
+        num_mesi_var = tk.IntVar(value=1)
+        ttk.Spinbox(frame_periodo, from_=1, to=24, textvariable=num_mesi_var, width=6).grid(row=1, column=1, padx=5, pady=5, sticky='w')
+
+        # Negozio (solo se sono definiti più negozi in dati_turni.json)
+        TUTTI_I_NEGOZI = "Tutti i negozi"
+        negozio_var = tk.StringVar(value=TUTTI_I_NEGOZI)
+        if self.negozi:
+            ttk.Label(frame_periodo, text="Negozio:").grid(row=1, column=2, padx=5, pady=5, sticky='w')
+            ttk.Combobox(frame_periodo, textvariable=negozio_var, values=[TUTTI_I_NEGOZI] + list(self.negozi),
+                         state='readonly', width=12).grid(row=1, column=3, padx=5, pady=5, sticky='w')
+
+        # Oltre all'Excel vengono sempre scritti i file JSON (rilettura rapida); gli altri formati sono opzionali
+        NESSUN_FORMATO = "Nessuno"
+        formato_extra_var = tk.StringVar(value=NESSUN_FORMATO)
+        ttk.Label(frame_periodo, text="Esporta anche:").grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+        ttk.Combobox(frame_periodo, textvariable=formato_extra_var, values=[NESSUN_FORMATO] + list(FORMATI_ESPORTAZIONE),
+                     state='readonly', width=12).grid(row=2, column=2, columnspan=2, padx=5, pady=5, sticky='w')
+        # Con più mesi: un solo file Excel con un foglio per mese e un riepilogo, invece di un file per mese
+        file_unico_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_periodo, text="Un unico file Excel per il periodo (un foglio per mese)",
+                        variable=file_unico_var).grid(row=3, column=0, columnspan=4, padx=5, pady=5, sticky='w')
+        # Calendari .ics per addetto (Desktop/Calendari_Turni), aggiornati solo se cambiano
+        calendari_ics_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_periodo, text="Aggiorna calendari ICS degli addetti",
+                        variable=calendari_ics_var).grid(row=4, column=0, columnspan=4, padx=5, pady=5, sticky='w')
+        # Anteprima a video prima di salvare: i file vengono scritti solo se l'utente lo chiede
+        anteprima_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frame_periodo, text="Mostra anteprima prima di salvare i file",
+                        variable=anteprima_var).grid(row=5, column=0, columnspan=4, padx=5, pady=5, sticky='w')
+
+        def apri_modello_excel():
+            """Crea (se manca) e apre il modello Excel usato per stili e colori dei file generati."""
             try:
-                anno = anno_var.get()
-                # Trova l'indice del mese selezionato (1-12)
-                mese_nome_selezionato = mese_var.get()
-                try:
-                     mese = mesi_italiano.index(mese_nome_selezionato)
-                     if mese == 0: raise ValueError # Indice 0 non è un mese valido
-                except ValueError:
-                     messagebox.showerror("Errore Interno", "Mese selezionato non valido.")
-                     return
-
-                print(f"Avvio generazione per {mese_nome_selezionato} {anno}...")
-                # Disabilita bottone durante generazione? (Opzionale)
+                percorso = self._salva_modello_excel()
+                self._apri_file(os.path.abspath(percorso))
+            except Exception as e:
+                messagebox.showerror("Modello Excel", f"Impossibile creare o aprire il modello Excel:\n{e}", parent=window)
+        ttk.Button(frame_periodo, text="Personalizza modello Excel...", command=apri_modello_excel).grid(
+            row=6, column=0, columnspan=4, padx=5, pady=5, sticky='w')
+
+        # Stato della generazione in background (condiviso tra i callback)
+        coda_messaggi = queue.Queue()   # Messaggi dal thread di lavoro verso la GUI
+        annulla_evento = threading.Event()
+        stato_lavoro = {'attivo': False, 'anno': None, 'mese': None, 'nome_mese': '', 'motore': None,
+                        'num_mesi': 1, 'mese_corrente': 1, 'negozio': None, 'formato_extra': None,
+                        'file_unico': False, 'calendari_ics': False, 'anteprima': False}
+
+        # Barra di avanzamento e stato
+        frame_avanzamento = ttk.Frame(window, padding=(10, 0))
+        frame_avanzamento.pack(fill='x')
+        barra_avanzamento = ttk.Progressbar(frame_avanzamento, mode='determinate')
+        barra_avanzamento.pack(fill='x', pady=5)
+        stato_label = ttk.Label(frame_avanzamento, text="", anchor='center')
+        stato_label.pack(fill='x')
+
+        def imposta_in_corso(in_corso):
+            """Abilita/disabilita i bottoni in base allo stato del lavoro."""
+            stato_lavoro['attivo'] = in_corso
+            if in_corso:
                 btn_genera.config(state='disabled', text='Generazione in corso...')
-                window.update_idletasks() # Forza aggiornamento UI
+                btn_annulla.config(state='normal')
+            else:
+                btn_genera.config(state='normal', text='Genera Pianificazione')
+                btn_annulla.config(state='disabled')
+
+        def destinazioni_file(negozio, nome_file=None):
+            """
+            Destinazioni dei file: Excel + JSON (+ formato aggiuntivo e calendari ICS se scelti, + archivio
+            SQLite se attivo). Con "file unico"
+            l'Excel è il file del periodo (un foglio per mese), gli altri restano mensili.
+            """
+            if stato_lavoro['file_unico']:
+                nome_file = self._percorso_file_annuale(stato_lavoro['anno'], stato_lavoro['mese'],
+                                                        stato_lavoro['num_mesi'], negozio)
+                esportatore_excel = EsportatoreExcelAnnuale(nome_file, negozio)
+            else:
+                esportatore_excel = EsportatoreExcel(nome_file, negozio)
+            destinazioni = [esportatore_excel, EsportatoreJSON(negozio=negozio)]
+            if stato_lavoro['formato_extra']:
+                destinazioni.append(stato_lavoro['formato_extra'](negozio=negozio))
+            if stato_lavoro['calendari_ics']:
+                destinazioni.append(EsportatoreICS(negozio=negozio))
+            if self.archivio is not None:
+                destinazioni.append(EsportatoreSQLite(self.archivio, negozio))
+            return destinazioni
+
+        # --- Funzioni eseguite nel thread di lavoro (NON devono toccare widget Tk) ---
+        def lavoro_generazione(motore, anno, mese):
+            try:
+                calendario = motore._genera_calendario_mensile_refactored(
+                    anno, mese,
+                    avanzamento=lambda giorno, totale: coda_messaggi.put(('progresso', giorno, totale)),
+                    annulla=annulla_evento)
+                coda_messaggi.put(('generato', calendario))
+            except GenerazioneAnnullata:
+                coda_messaggi.put(('annullato',))
+            except Exception as e:
+                coda_messaggi.put(('errore', e, traceback.format_exc()))
+
+        def lavoro_salvataggio(motore, calendario, anno, mese, negozio=None, apri=True):
+            nome_file = motore._percorso_file_turni(anno, mese, negozio)
+            # Se il mese era già stato salvato, confronta con la versione precedente
+            # (archivio SQLite se attivo, altrimenti file JSON)
+            addetti_modificati = None
+            file_precedente = motore._percorso_base_turni(anno, mese, negozio) + '.json'
+            try:
+                calendario_precedente = None
+                if motore.archivio is not None:
+                    calendario_precedente = motore.archivio.carica_pianificazione(anno, mese, negozio) or None
+                if calendario_precedente is None and os.path.exists(file_precedente):
+                    anno_p, mese_p, calendario_precedente = motore._carica_calendario_da_file(file_precedente)
+                    if (anno_p, mese_p) != (anno, mese):
+                        calendario_precedente = None
+                if calendario_precedente is not None:
+                    differenze = motore._confronta_calendari(calendario_precedente, calendario, anno, mese)
+                    addetti_modificati = sorted(differenze['per_addetto'])
+            except (OSError, ValueError, KeyError, sqlite3.Error) as e_confronto:
+                print(f"Avviso: confronto con la versione precedente non riuscito ({e_confronto})")
+            try:
+                motore._esporta_calendario(calendario, anno, mese, destinazioni_file(negozio, nome_file),
+                                           annulla=annulla_evento)
+            except GenerazioneAnnullata:
+                coda_messaggi.put(('annullato',))
+                return
+            except Exception as e:
+                coda_messaggi.put(('errore_salvataggio', e, nome_file, traceback.format_exc()))
+                return
+            errore_apertura = None
+            try:
+                if apri: # Dopo l'anteprima il file non viene aperto: il contenuto è già stato visto
+                    motore._apri_file(nome_file)
+            except Exception as e_open:
+                errore_apertura = e_open
+            coda_messaggi.put(('salvato', nome_file, errore_apertura, addetti_modificati))
+
+        def lavoro_orizzonte(motore, anno, mese, num_mesi, negozio=None):
+            """
+            Genera più mesi di seguito in streaming: ogni giorno generato passa subito
+            alle destinazioni (Excel, JSON, altri formati), scritte in parallelo alla generazione.
+            """
+            # Con l'anteprima i mesi vengono solo raccolti: i file si scrivono se l'utente li salva
+            anteprima = AccumulatoreAnteprima() if stato_lavoro['anteprima'] else None
+            destinazioni = [anteprima] if anteprima is not None else destinazioni_file(negozio)
+            statistiche = AccumulatoreStatistiche()
+            mesi_iniziati = [0]
+
+            def avanzamento(giorno, totale):
+                if giorno == 1: # Inizio di un nuovo mese dell'orizzonte
+                    mesi_iniziati[0] += 1
+                    coda_messaggi.put(('mese', mesi_iniziati[0], num_mesi))
+                coda_messaggi.put(('progresso', giorno, totale))
+
+            try:
+                motore._esegui_pipeline(anno, mese, num_mesi, destinazioni + [statistiche],
+                                        avanzamento=avanzamento, annulla=annulla_evento)
+                mesi_con_errori = [f"{calendar.month_name[mese_m]} {anno_m}"
+                                   for (anno_m, mese_m), giorni in statistiche.giorni_con_errori.items() if giorni]
+                if anteprima is not None:
+                    coda_messaggi.put(('anteprima', {negozio: anteprima}, mesi_con_errori))
+                else:
+                    coda_messaggi.put(('orizzonte_completato', destinazioni[0].file_salvati, mesi_con_errori))
+            except GenerazioneAnnullata:
+                coda_messaggi.put(('annullato',))
+            except Exception as e:
+                coda_messaggi.put(('errore', e, traceback.format_exc()))
 
-                # ----> CHIAMA LA NUOVA FUNZIONE DI PIANIFICAZIONE <----
-                calendario = self._genera_calendario_mensile_refactored(anno, mese)
+        def lavoro_multinegozio(motore, anno, mese, num_mesi):
+            """Genera tutti i negozi (in processi paralleli) per uno o più mesi e salva un file per negozio."""
+            destinazioni_negozi = {} # {negozio: destinazioni}, aperte per tutto il periodo
+            mesi_con_errori = []
+            completato = False
+            try:
+                coda_messaggi.put(('avanzamento', 0, num_mesi, f"Generazione negozi: mese 1/{num_mesi}..."))
+                orizzonte = motore._genera_orizzonte_multinegozio(anno, mese, num_mesi, annulla=annulla_evento)
+                for indice, (anno_m, mese_m, calendari) in enumerate(orizzonte, 1):
+                    for negozio, calendario in calendari.items():
+                        if negozio not in destinazioni_negozi:
+                            destinazioni_negozi[negozio] = ([AccumulatoreAnteprima()] if stato_lavoro['anteprima']
+                                                            else destinazioni_file(negozio))
+                        motore._motore_negozio(negozio)._esporta_calendario(
+                            calendario, anno_m, mese_m, destinazioni_negozi[negozio],
+                            annulla=annulla_evento, chiudi=False)
+                        if motore._calendario_contiene_errori(calendario):
+                            mesi_con_errori.append(f"{negozio} - {calendar.month_name[mese_m]} {anno_m}")
+                    coda_messaggi.put(('avanzamento', indice, num_mesi, f"Generazione negozi: mese {min(indice + 1, num_mesi)}/{num_mesi}..."))
+                for destinazioni in destinazioni_negozi.values():
+                    for destinazione in destinazioni:
+                        destinazione.chiudi(True) # Salva i file del periodo
+                completato = True
+            except GenerazioneAnnullata:
+                coda_messaggi.put(('annullato',))
+            except Exception as e:
+                coda_messaggi.put(('errore', e, traceback.format_exc()))
+            finally:
+                if not completato: # Scarta i file parziali
+                    for destinazioni in destinazioni_negozi.values():
+                        for destinazione in destinazioni:
+                            destinazione.chiudi(False)
+            if completato and stato_lavoro['anteprima']:
+                coda_messaggi.put(('anteprima', {negozio: destinazioni[0] for negozio, destinazioni
+                                                 in destinazioni_negozi.items()}, mesi_con_errori))
+            elif completato:
+                file_salvati = [nome_file for destinazioni in destinazioni_negozi.values()
+                                for nome_file in destinazioni[0].file_salvati]
+                coda_messaggi.put(('orizzonte_completato', file_salvati, mesi_con_errori))
+
+        def lavoro_salva_anteprime(anteprime, mesi_con_errori):
+            """Scrive su file (Excel, JSON...) i mesi raccolti per l'anteprima, negozio per negozio."""
+            file_salvati = []
+            try:
+                for negozio, anteprima in anteprime.items():
+                    destinazioni = destinazioni_file(negozio)
+                    anteprima.esporta(destinazioni, annulla=annulla_evento)
+                    file_salvati.extend(destinazioni[0].file_salvati)
+            except GenerazioneAnnullata:
+                coda_messaggi.put(('annullato',))
+                return
+            except Exception as e:
+                coda_messaggi.put(('errore_salvataggio', e, getattr(e, 'filename', None) or "", traceback.format_exc()))
+                return
+            coda_messaggi.put(('orizzonte_completato', file_salvati, mesi_con_errori))
+
+        def avvia_thread(funzione, *args):
+            thread = threading.Thread(target=funzione, args=args, daemon=True)
+            thread.start()
+
+        def apri_anteprima(anteprime, mesi_con_errori, salva):
+            """Mostra l'anteprima del lavoro concluso; `salva` avvia il salvataggio dei file."""
+            imposta_in_corso(False)
+            stato_label.config(text="Generazione completata: anteprima aperta.")
+
+            def avvia_salvataggio():
+                imposta_in_corso(True)
+                stato_label.config(text="Salvataggio file...")
+                salva()
+                window.after(100, controlla_coda)
+
+            titolo = stato_lavoro['nome_mese'] + f" {stato_lavoro['anno']}"
+            if stato_lavoro['num_mesi'] > 1:
+                titolo += f" ({stato_lavoro['num_mesi']} mesi)"
+            avviso = ("ATTENZIONE: errori o coperture incomplete in: " + ", ".join(mesi_con_errori)) if mesi_con_errori else None
+            self.mostra_anteprima(anteprime, titolo, salva=avvia_salvataggio, avviso=avviso, parent=window)
+
+        # --- Gestione messaggi nella GUI (thread principale, tramite root.after) ---
+        def controlla_coda():
+            if not window.winfo_exists():
+                return # Finestra chiusa: il thread si fermerà al prossimo controllo di annullamento
+            try:
+                while True:
+                    messaggio = coda_messaggi.get_nowait()
+                    gestisci_messaggio(messaggio)
+            except queue.Empty:
+                pass
+            if stato_lavoro['attivo'] and window.winfo_exists():
+                window.after(100, controlla_coda)
+
+        def gestisci_messaggio(messaggio):
+            tipo = messaggio[0]
+            if tipo == 'progresso':
+                giorno, totale = messaggio[1], messaggio[2]
+                barra_avanzamento.config(maximum=totale + 1, value=giorno - 1)
+                prefisso = f"Mese {stato_lavoro['mese_corrente']}/{stato_lavoro['num_mesi']} - " if stato_lavoro['num_mesi'] > 1 else ""
+                stato_label.config(text=f"{prefisso}Generazione giorno {giorno}/{totale}...")
+
+            elif tipo == 'avanzamento':
+                valore, massimo, testo = messaggio[1], messaggio[2], messaggio[3]
+                barra_avanzamento.config(maximum=massimo, value=valore)
+                stato_label.config(text=testo)
+
+            elif tipo == 'mese':
+                stato_lavoro['mese_corrente'] = messaggio[1]
+
+            elif tipo == 'orizzonte_completato':
+                file_salvati, mesi_con_errori = messaggio[1], messaggio[2]
+                print(f"Generazione di {len(file_salvati)} mesi completata.")
+                imposta_in_corso(False)
+                window.destroy()
+                testo = f"Salvati {len(file_salvati)} file sul Desktop:\n" + "\n".join(os.path.basename(f) for f in file_salvati)
+                if mesi_con_errori:
+                    testo += "\n\nATTENZIONE: errori o coperture incomplete in:\n" + "\n".join(mesi_con_errori)
+                    messagebox.showwarning("Generazione Completata", testo)
+                else:
+                    messagebox.showinfo("Generazione Completata", testo)
 
-                print("Generazione calendario completata.")
-                # Riabilita bottone
-                btn_genera.config(state='normal', text='Genera Pianificazione')
+            elif tipo == 'anteprima':
+                anteprime, mesi_con_errori = messaggio[1], messaggio[2]
+                apri_anteprima(anteprime, mesi_con_errori,
+                               lambda: avvia_thread(lavoro_salva_anteprime, anteprime, mesi_con_errori))
 
+            elif tipo == 'generato':
+                calendario = messaggio[1]
+                print("Generazione calendario completata.")
+                barra_avanzamento.config(value=barra_avanzamento.cget('maximum') - 1)
+
+                if stato_lavoro['anteprima']:
+                    motore, anno, mese, negozio = (stato_lavoro['motore'], stato_lavoro['anno'],
+                                                   stato_lavoro['mese'], stato_lavoro['negozio'])
+                    anteprima = AccumulatoreAnteprima()
+                    motore._esporta_calendario(calendario, anno, mese, [anteprima])
+                    mesi_con_errori = [stato_lavoro['nome_mese']] if self._calendario_contiene_errori(calendario) else []
+                    # Si salva il calendario dell'anteprima, che contiene le eventuali modifiche a mano
+                    apri_anteprima({negozio: anteprima}, mesi_con_errori,
+                                   lambda: avvia_thread(lavoro_salvataggio, motore, anteprima.calendari[0][3],
+                                                        anno, mese, negozio, False))
+                    return
 
                 # Controlla se il calendario contiene errori critici (es. copertura incompleta)
-                contiene_errori = False
-                for giorno, dati_giorno in calendario.items():
-                    if isinstance(dati_giorno, dict):
-                        if any('ERRORE' in str(v) for v in dati_giorno.values()):
-                             contiene_errori = True
-                             break
-                if contiene_errori:
+                if self._calendario_contiene_errori(calendario):
                     print("ATTENZIONE: La pianificazione contiene errori o coperture incomplete.")
-                    if not messagebox.askyesno("Attenzione", "La pianificazione generata contiene errori o coperture incomplete (verificare log e file Excel).\n\nSalvare comunque il file Excel?", icon='warning'):
+                    if not messagebox.askyesno("Attenzione", "La pianificazione generata contiene errori o coperture incomplete (verificare log e file Excel).\n\nSalvare comunque il file Excel?", icon='warning', parent=window):
                         print("Salvataggio annullato dall'utente.")
+                        imposta_in_corso(False)
                         window.destroy() # Chiudi finestra generazione
                         return # Non salvare se l'utente dice no
 
                 print("Avvio salvataggio Excel...")
-                # Salva su Excel (la funzione ora gestisce apertura e messaggi)
-                self._salva_calendario_excel(calendario, anno, mese)
+                stato_label.config(text="Salvataggio file Excel...")
+                avvia_thread(lavoro_salvataggio, stato_lavoro['motore'], calendario,
+                             stato_lavoro['anno'], stato_lavoro['mese'], stato_lavoro['negozio'])
 
+            elif tipo == 'salvato':
+                nome_file, errore_apertura, addetti_modificati = messaggio[1], messaggio[2], messaggio[3]
                 print("Salvataggio Excel completato.")
-                # Messaggio finale spostato dentro _salva_calendario_excel
+                imposta_in_corso(False)
                 window.destroy() # Chiudi la finestra di generazione
+                testo = f"File salvato con successo sul Desktop:\n{nome_file}"
+                if addetti_modificati is not None: # Il mese sostituisce una versione precedente
+                    if addetti_modificati:
+                        testo += "\n\nTurni cambiati rispetto alla versione precedente per:\n" + ", ".join(addetti_modificati)
+                    else:
+                        testo += "\n\nNessun turno cambiato rispetto alla versione precedente."
+                messagebox.showinfo("Salvataggio Excel", testo)
+                if errore_apertura is not None:
+                    print(f"Avviso: Impossibile aprire automaticamente il file Excel ({errore_apertura})")
+                    messagebox.showwarning("Apertura File", "File Excel salvato, ma impossibile aprirlo automaticamente.")
+
+            elif tipo == 'annullato':
+                print("Generazione annullata dall'utente.")
+                imposta_in_corso(False)
+                barra_avanzamento.config(value=0)
+                stato_label.config(text="Generazione annullata.")
+
+            elif tipo == 'errore_salvataggio':
+                e_save, nome_file, dettaglio = messaggio[1], messaggio[2], messaggio[3]
+                imposta_in_corso(False)
+                stato_label.config(text="Errore nel salvataggio.")
+                if isinstance(e_save, PermissionError):
+                    messagebox.showerror("Errore Salvataggio Excel", f"Permesso negato.\nIl file '{nome_file}' potrebbe essere aperto in un altro programma. Chiuderlo e riprovare.", parent=window)
+                else:
+                    messagebox.showerror("Errore Salvataggio Excel", f"Errore durante il salvataggio del file Excel:\n{e_save}", parent=window)
+                    print(f"Errore salvataggio Excel: {e_save}")
+                    print(dettaglio)
+
+            elif tipo == 'errore':
+                e, dettaglio = messaggio[1], messaggio[2]
+                imposta_in_corso(False)
+                stato_label.config(text="Errore durante la generazione.")
+                messagebox.showerror("Errore Inaspettato", f"Si è verificato un errore imprevisto durante la generazione:\n{str(e)}", parent=window)
+                print("--- ERRORE INASPETTATO ---")
+                print(dettaglio) # Stampa l'errore completo nella console per debug
 
+        # Funzione interna chiamata dal bottone
+        def genera():
+            """Avvia la generazione dei turni per il mese selezionato in background"""
+            try:
+                anno = anno_var.get()
+            except (tk.TclError, ValueError):
+                 messagebox.showerror("Errore Input", "Anno o Mese non valido.", parent=window)
+                 return
+            # Trova l'indice del mese selezionato (1-12)
+            mese_nome_selezionato = mese_var.get()
+            try:
+                 mese = mesi_italiano.index(mese_nome_selezionato)
+                 if mese == 0: raise ValueError # Indice 0 non è un mese valido
             except ValueError:
-                 messagebox.showerror("Errore Input", "Anno o Mese non valido.")
-                 if 'btn_genera' in locals(): btn_genera.config(state='normal', text='Genera Pianificazione')
+                 messagebox.showerror("Errore Interno", "Mese selezionato non valido.", parent=window)
+                 return
+
+            try:
+                num_mesi = num_mesi_var.get()
+                if num_mesi < 1: raise ValueError
+            except (tk.TclError, ValueError):
+                 messagebox.showerror("Errore Input", "Numero di mesi non valido.", parent=window)
+                 return
+
+            print(f"Avvio generazione per {mese_nome_selezionato} {anno} ({num_mesi} mesi)...")
+            stato_lavoro.update({'anno': anno, 'mese': mese, 'nome_mese': mese_nome_selezionato,
+                                 'num_mesi': num_mesi, 'mese_corrente': 1,
+                                 'formato_extra': FORMATI_ESPORTAZIONE.get(formato_extra_var.get()),
+                                 'file_unico': file_unico_var.get() and num_mesi > 1,
+                                 'calendari_ics': calendari_ics_var.get(), 'anteprima': anteprima_var.get()})
+            annulla_evento.clear()
+            imposta_in_corso(True)
+            barra_avanzamento.config(value=0)
+            stato_label.config(text="Avvio generazione...")
+
+            # Il thread lavora su una copia dei dati: l'utente può continuare
+            # a modificare addetti e turni mentre il mese viene generato.
+            negozio = negozio_var.get() if self.negozi else None
+            if negozio == TUTTI_I_NEGOZI:
+                # Tutti i negozi: generazione parallela e coordinamento degli addetti condivisi
+                stato_lavoro['negozio'] = None
+                stato_lavoro['motore'] = self._istantanea_dati()
+                avvia_thread(lavoro_multinegozio, stato_lavoro['motore'], anno, mese, num_mesi)
+                window.after(100, controlla_coda)
+                return
+
+            stato_lavoro['negozio'] = negozio
+            stato_lavoro['motore'] = self._motore_negozio(negozio) if negozio else self._istantanea_dati()
+            if num_mesi == 1:
+                avvia_thread(lavoro_generazione, stato_lavoro['motore'], anno, mese)
+            else:
+                avvia_thread(lavoro_orizzonte, stato_lavoro['motore'], anno, mese, num_mesi, negozio)
+            window.after(100, controlla_coda)
+
+        def annulla():
+            """Richiede l'annullamento del lavoro in corso."""
+            if stato_lavoro['attivo']:
+                annulla_evento.set()
+                btn_annulla.config(state='disabled')
+                stato_label.config(text="Annullamento in corso...")
+
+        def chiudi_finestra():
+            annulla_evento.set() # Ferma eventuali lavori in corso
+            window.destroy()
+
+        # Bottoni per avviare/annullare la generazione
+        frame_bottoni = ttk.Frame(window)
+        frame_bottoni.pack(pady=15)
+        btn_genera = ttk.Button(frame_bottoni, text="Genera Pianificazione", command=genera)
+        btn_genera.grid(row=0, column=0, padx=5)
+        btn_annulla = ttk.Button(frame_bottoni, text="Annulla", command=annulla, state='disabled')
+        btn_annulla.grid(row=0, column=1, padx=5)
+
+        window.protocol("WM_DELETE_WINDOW", chiudi_finestra)
+
+
+    def gestione_archivio(self):
+        """
+        Mostra dove sono salvati i dati e permette di passare dal file JSON all'archivio SQLite.
+        Con SQLite attivo mostra le ore lavorate per addetto nell'anno, lette dalle pianificazioni archiviate.
+        """
+        window = tk.Toplevel(self.root)
+        window.title("Archivio Dati")
+        window.geometry("560x460")
+
+        frame_info = ttk.LabelFrame(window, text="Archivio in uso", padding=10)
+        frame_info.pack(fill='x', padx=10, pady=10)
+
+        # Ferie degli anni passati: spostate in file annuali, lette solo quando si consultano quegli anni
+        frame_ferie = ttk.LabelFrame(window, text="Ferie degli anni passati", padding=10)
+        frame_ferie.pack(fill='x', padx=10, pady=(0, 10), side=tk.BOTTOM)
+        anno_corrente = datetime.now().year
+
+        def archivia_ferie():
+            if not messagebox.askyesno("Conferma", f"Spostare le ferie precedenti al {anno_corrente} nell'archivio "
+                                       f"({self.cartella_archivio_ferie})?\n\nL'archiviazione non si può annullare "
+                                       "e azzera l'elenco delle modifiche annullabili.", parent=window):
+                return
+            try:
+                archiviati = self.archivia_ferie(anno_corrente)
             except Exception as e:
-                 messagebox.showerror("Errore Inaspettato", f"Si è verificato un errore imprevisto durante la generazione:\n{str(e)}")
-                 print("--- ERRORE INASPETTATO ---")
-                 traceback.print_exc() # Stampa l'errore completo nella console per debug
-                 if 'btn_genera' in locals(): btn_genera.config(state='normal', text='Genera Pianificazione')
+                print(f"Errore archiviazione ferie: {e}")
+                traceback.print_exc()
+                messagebox.showerror("Errore Archivio", f"Impossibile archiviare le ferie:\n{e}", parent=window)
+                return
+            if not archiviati:
+                messagebox.showinfo("Info", "Nessuna feria degli anni passati da archiviare.", parent=window)
+                return
+            dettaglio = "\n".join(f"{anno}: {giorni} giorni" for anno, giorni in archiviati.items())
+            messagebox.showinfo("Successo", f"Ferie archiviate:\n{dettaglio}", parent=window)
+
+        ttk.Label(frame_ferie, wraplength=510, justify='left',
+                  text="Le ferie archiviate restano consultabili e modificabili da Gestione Ferie "
+                       "scegliendo un mese dell'anno archiviato.").pack(anchor='w')
+        ttk.Button(frame_ferie, text=f"Archivia ferie precedenti al {anno_corrente}",
+                   command=archivia_ferie).pack(anchor='w', pady=(5, 0))
+
+        if self.archivio is None:
+            ttk.Label(frame_info, text=f"File JSON: {self.file_dati}", wraplength=510).pack(anchor='w')
+            ttk.Label(frame_info, wraplength=510, justify='left',
+                      text="Con l'archivio SQLite ogni modifica salva solo i dati cambiati, più istanze "
+                           "possono lavorare sugli stessi dati e le pianificazioni generate vengono "
+                           "archiviate per le consultazioni storiche. Il file JSON resta come copia.").pack(anchor='w', pady=10)
+
+            def migra():
+                if not messagebox.askyesno("Conferma", f"Copiare i dati in {self.file_database} e usare da ora l'archivio SQLite?",
+                                           parent=window):
+                    return
+                archivio = None
+                try:
+                    self.compatta_giornale(attendi=True) # Il JSON resta come copia aggiornata
+                    archivio = ArchivioSQLite(self.file_database)
+                    archivio.sincronizza(self.addetti, self.turni_disponibili, self.negozi)
+                except Exception as e:
+                    print(f"Errore creazione archivio SQLite: {e}")
+                    traceback.print_exc()
+                    if archivio is not None:
+                        archivio.chiudi()
+                    for suffisso in ('', '-wal', '-shm'): # Non lasciare un archivio incompleto
+                        if os.path.exists(self.file_database + suffisso):
+                            os.remove(self.file_database + suffisso)
+                    messagebox.showerror("Errore Archivio", f"Impossibile creare l'archivio SQLite:\n{e}", parent=window)
+                    return
+                self.archivio = archivio
+                messagebox.showinfo("Successo", "Archivio SQLite attivato.", parent=window)
+                window.destroy()
+                self.gestione_archivio()
+
+            ttk.Button(frame_info, text="Passa all'archivio SQLite", command=migra).pack(anchor='w')
+            return
 
+        ttk.Label(frame_info, text=f"Archivio SQLite: {self.file_database}", wraplength=510).pack(anchor='w')
+        mesi_salvati = self.archivio.mesi_salvati()
+        ttk.Label(frame_info, text=f"Pianificazioni archiviate: {len(mesi_salvati)} mesi").pack(anchor='w', pady=(5, 0))
+
+        # Ore lavorate per addetto nell'anno scelto (query sull'archivio, senza caricare i calendari)
+        frame_ore = ttk.LabelFrame(window, text="Ore lavorate per addetto", padding=10)
+        frame_ore.pack(fill='both', expand=True, padx=10, pady=5)
+        anni = sorted({anno for _, anno, _ in mesi_salvati}, reverse=True) or [datetime.now().year]
+        anno_var = tk.IntVar(value=anni[0])
+        frame_anno = ttk.Frame(frame_ore)
+        frame_anno.pack(fill='x')
+        ttk.Label(frame_anno, text="Anno:").pack(side=tk.LEFT)
+        combo_anno = ttk.Combobox(frame_anno, textvariable=anno_var, values=anni, width=8, state='readonly')
+        combo_anno.pack(side=tk.LEFT, padx=5)
+
+        tabella = ttk.Treeview(frame_ore, columns=('giorni', 'ore'), show='tree headings', height=10)
+        tabella.heading('#0', text="Addetto")
+        tabella.column('#0', width=220)
+        tabella.heading('giorni', text="Giorni lavorati")
+        tabella.heading('ore', text="Ore")
+        for colonna in ('giorni', 'ore'):
+            tabella.column(colonna, width=120, anchor='center')
+        tabella.pack(fill='both', expand=True, pady=5)
+
+        def aggiorna_ore(event=None):
+            anno = anno_var.get()
+            tabella.delete(*tabella.get_children())
+            try:
+                ore = self.archivio.ore_per_addetto(f"{anno}-01-01", f"{anno}-12-31")
+            except sqlite3.Error as e:
+                messagebox.showerror("Errore Archivio", f"Impossibile leggere l'archivio:\n{e}", parent=window)
+                return
+            for nome, (giorni, totale_ore) in ore.items():
+                tabella.insert('', tk.END, text=nome, values=(giorni, f"{totale_ore:.1f}"))
 
-        # Bottone per avviare la generazione
-        btn_genera = ttk.Button(window, text="Genera Pianificazione", command=genera)
-        btn_genera.pack(pady=20)
+        combo_anno.bind('<<ComboboxSelected>>', aggiorna_ore)
+        aggiorna_ore()
 
+        def esporta_json():
+            try:
+                self._scrivi_file_atomico(self.file_dati, self._testo_dati_json())
+            except Exception as e:
+                messagebox.showerror("Errore Salvataggio", f"Impossibile scrivere {self.file_dati}.\n{e}", parent=window)
+                return
+            messagebox.showinfo("Successo", f"Copia dei dati salvata in {self.file_dati}.", parent=window)
+
+        ttk.Button(window, text="Esporta copia JSON", command=esporta_json).pack(pady=(0, 10))
 
     def run(self):
         """Avvia l'applicazione Tkinter"""
         self.root.mainloop()
 
+# ==========================================================================
+#               SALVATAGGIO: GIORNALE DELLE MODIFICHE E SCRITTURA IN BACKGROUND
+# ==========================================================================
+class GiornaleModifiche:
+    """
+    Giornale append-only delle modifiche ai dati (dati_turni.giornale): una voce JSON per
+    riga con i valori prima/dopo degli elementi cambiati. Aggiungere una voce costa quanto
+    la modifica; all'avvio le voci successive all'istantanea dati_turni.json vengono riapplicate.
+    """
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self.righe_scartate = 0
+
+    def leggi(self):
+        """Tutte le voci valide, in ordine. Le righe illeggibili (scrittura interrotta) vengono scartate."""
+        voci = []
+        self.righe_scartate = 0
+        if not os.path.exists(self.percorso):
+            return voci
+        with open(self.percorso, 'r', encoding='utf-8') as f:
+            for riga in f:
+                try:
+                    voci.append(json.loads(riga))
+                except json.JSONDecodeError:
+                    self.righe_scartate += 1
+        return voci
+
+    def aggiungi(self, voce):
+        """Aggiunge una voce in fondo al giornale e la rende persistente (fsync)."""
+        with open(self.percorso, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(voce) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compatta(self, prima_da_tenere):
+        """Riscrive il giornale tenendo solo le voci con seq >= prima_da_tenere."""
+        voci = [voce for voce in self.leggi() if voce['seq'] >= prima_da_tenere]
+        GestioneTurni._scrivi_file_atomico(self.percorso, ''.join(json.dumps(voce) + '\n' for voce in voci))
+
+
+class ScrittoreDifferito:
+    """
+    Thread che scrive un file in background con la funzione `scrivi_file(percorso, testo)`.
+    Se arrivano più contenuti mentre una scrittura è in corso, si scrive solo l'ultimo.
+    Gli errori finiscono nella coda `errori`, letta dal thread della GUI.
+    """
+
+    def __init__(self, percorso, scrivi_file):
+        self.percorso = percorso
+        self.errori = queue.Queue()
+        self._scrivi_file = scrivi_file
+        self._condizione = threading.Condition()
+        self._testo = None # Contenuto in attesa di essere scritto
+        self._in_scrittura = False
+        threading.Thread(target=self._esegui, name="ScrittoreDifferito", daemon=True).start()
+
+    def scrivi(self, testo):
+        """Accoda il nuovo contenuto del file (sostituisce quello non ancora scritto)."""
+        with self._condizione:
+            self._testo = testo
+            self._condizione.notify_all()
+
+    def attendi(self, timeout=None):
+        """Attende che non ci siano scritture in corso o in attesa; False se scade il timeout."""
+        with self._condizione:
+            return self._condizione.wait_for(lambda: self._testo is None and not self._in_scrittura, timeout)
+
+    def _esegui(self):
+        while True:
+            with self._condizione:
+                self._condizione.wait_for(lambda: self._testo is not None)
+                testo, self._testo = self._testo, None
+                self._in_scrittura = True
+            try:
+                self._scrivi_file(self.percorso, testo)
+            except Exception as e:
+                self.errori.put(e)
+            finally:
+                with self._condizione:
+                    self._in_scrittura = False
+                    self._condizione.notify_all()
+
+
+# ==========================================================================
+#               ARCHIVIO DATI SU SQLITE
+# ==========================================================================
+class ArchivioSQLite:
+    """
+    Archivio dei dati su SQLite (dati_turni.db), alternativo a dati_turni.json.
+    Ogni salvataggio scrive solo ciò che è cambiato dall'ultima sincronizzazione, in
+    un'unica transazione; con il journal WAL più istanze dell'applicazione possono
+    lavorare sullo stesso file. Ogni salvataggio incrementa la revisione dei dati
+    anagrafici: se un'altra istanza ha salvato dopo l'ultima lettura, la differenza
+    calcolata non è più valida e sincronizza solleva ConflittoArchivio (chi la riceve
+    deve ricaricare con carica). Contiene anche le pianificazioni generate, una riga
+    per addetto e giorno, indicizzate per data.
+    La connessione è condivisa tra i thread e protetta da un lock.
+    """
+    VERSIONE_SCHEMA = 3
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS addetti (
+            nome TEXT PRIMARY KEY,
+            ore_contratto REAL,
+            ore_max REAL,
+            straordinario INTEGER,
+            giorni_riposo TEXT NOT NULL DEFAULT '[]',  -- JSON: indici dei giorni della settimana
+            altri TEXT NOT NULL DEFAULT '{}'           -- JSON: eventuali altri campi dell'addetto
+        );
+        CREATE TABLE IF NOT EXISTS ferie (
+            addetto TEXT NOT NULL REFERENCES addetti(nome) ON DELETE CASCADE,
+            data TEXT NOT NULL,                        -- YYYY-MM-DD
+            PRIMARY KEY (addetto, data)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ferie_data ON ferie(data);
+        CREATE TABLE IF NOT EXISTS turni (
+            posizione INTEGER PRIMARY KEY,
+            inizio TEXT NOT NULL,
+            fine TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS negozi (
+            nome TEXT PRIMARY KEY,
+            configurazione TEXT NOT NULL               -- JSON: orari, turni, addetti del negozio
+        );
+        CREATE TABLE IF NOT EXISTS pianificazioni (
+            negozio TEXT NOT NULL DEFAULT '',          -- '' = negozio unico
+            data TEXT NOT NULL,                        -- YYYY-MM-DD
+            addetto TEXT NOT NULL,
+            stato TEXT NOT NULL,                       -- TURNO oppure FERIE/RIPOSO/FESTIVO/ERRORE.../'-'
+            inizio TEXT,
+            fine TEXT,
+            ore REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (negozio, data, addetto)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS pianificazioni_data ON pianificazioni(data, addetto);
+        CREATE TABLE IF NOT EXISTS giornale (                -- dalla versione 2
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            voce TEXT NOT NULL                         -- JSON: voce del giornale delle modifiche (senza 'seq')
+        );
+        CREATE TABLE IF NOT EXISTS revisione (               -- dalla versione 3
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            valore INTEGER NOT NULL                    -- incrementato a ogni sincronizzazione
+        );
+        INSERT OR IGNORE INTO revisione (id, valore) VALUES (0, 0);
+    """
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+        self._lock = threading.Lock()
+        self._connessione = sqlite3.connect(percorso, timeout=10, check_same_thread=False)
+        try:
+            self._connessione.execute('PRAGMA journal_mode=WAL')
+            self._connessione.execute('PRAGMA synchronous=NORMAL')
+            self._connessione.execute('PRAGMA foreign_keys=ON')
+            versione = self._connessione.execute('PRAGMA user_version').fetchone()[0]
+            if versione > self.VERSIONE_SCHEMA:
+                raise ValueError(f"L'archivio '{os.path.basename(percorso)}' è stato creato da una versione più recente.")
+            with self._connessione:
+                self._connessione.executescript(self.SCHEMA)
+                self._connessione.execute(f'PRAGMA user_version = {self.VERSIONE_SCHEMA}')
+        except Exception:
+            self._connessione.close()
+            raise
+        # Dati all'ultima sincronizzazione: base per calcolare cosa scrivere al salvataggio successivo,
+        # valida finché la revisione nell'archivio è ancora quella letta o scritta da questa istanza
+        self._ultimo = self._istantanea({}, [], {})
+        self._revisione = self._connessione.execute('SELECT valore FROM revisione').fetchone()[0]
+
+    def chiudi(self):
+        with self._lock:
+            self._connessione.close()
+
+    @staticmethod
+    def _riga_addetto(nome, info):
+        """Riga della tabella addetti per un addetto."""
+        altri = {chiave: valore for chiave, valore in info.items()
+                 if chiave not in ('ore_contratto', 'ore_max', 'straordinario', 'ferie', 'giorni_riposo')}
+        return (nome, info.get('ore_contratto'), info.get('ore_max'),
+                int(bool(info.get('straordinario'))), json.dumps(info.get('giorni_riposo', [])),
+                json.dumps(altri, sort_keys=True))
+
+    @staticmethod
+    def _istantanea(addetti, turni, negozi):
+        """
+        Forma confrontabile dei dati: righe delle tabelle per addetto, intervalli di ferie (espansi
+        in giorni, una riga per giorno, solo quando cambiano), turni, negozi in JSON.
+        """
+        return {'addetti': {nome: ArchivioSQLite._riga_addetto(nome, info) for nome, info in addetti.items()},
+                'ferie': {nome: tuple(map(tuple, info.get('ferie', []))) for nome, info in addetti.items()},
+                'turni': [tuple(turno) for turno in turni],
+                'negozi': {nome: json.dumps(negozio, sort_keys=True) for nome, negozio in negozi.items()}}
+
+    def carica(self):
+        """Legge tutti i dati anagrafici. Restituisce (addetti, turni, negozi) nel formato del file JSON."""
+        with self._lock, self._connessione as c:
+            c.execute('BEGIN') # Lettura coerente: nessun salvataggio altrui a metà
+            revisione = c.execute('SELECT valore FROM revisione').fetchone()[0]
+            addetti = {}
+            for nome, ore_contratto, ore_max, straordinario, giorni_riposo, altri in c.execute(
+                    'SELECT nome, ore_contratto, ore_max, straordinario, giorni_riposo, altri FROM addetti ORDER BY nome'):
+                addetti[nome] = {'ore_contratto': ore_contratto, 'ore_max': ore_max,
+                                 'straordinario': bool(straordinario), 'ferie': [],
+                                 'giorni_riposo': json.loads(giorni_riposo)}
+                addetti[nome].update(json.loads(altri))
+            for nome, data in c.execute('SELECT addetto, data FROM ferie ORDER BY addetto, data'):
+                addetti[nome]['ferie'].append(data)
+            for info in addetti.values():
+                info['ferie'] = GestioneTurni._intervalli_ferie(info['ferie'])
+            turni = [[inizio, fine] for inizio, fine in c.execute('SELECT inizio, fine FROM turni ORDER BY posizione')]
+            negozi = {nome: json.loads(configurazione)
+                      for nome, configurazione in c.execute('SELECT nome, configurazione FROM negozi ORDER BY nome')}
+        self._ultimo = self._istantanea(addetti, turni, negozi)
+        self._revisione = revisione
+        return addetti, turni, negozi
+
+    def sincronizza(self, addetti, turni, negozi, voce_giornale=None, cambiati=None):
+        """
+        Porta l'archivio allo stato dei dati passati scrivendo solo le differenze rispetto
+        all'ultima sincronizzazione, in un'unica transazione insieme all'eventuale voce del
+        giornale delle modifiche (a cui viene assegnato il numero 'seq').
+        `cambiati` (coppie ('addetto', nome), ('negozio', nome), ('turni', None)) limita il
+        confronto agli elementi indicati; senza, si confrontano tutti.
+        Solleva ConflittoArchivio (senza scrivere nulla) se un'altra istanza ha salvato
+        dopo l'ultima lettura o sincronizzazione di questa.
+        Restituisce il numero di righe scritte.
+        """
+        vecchio = self._ultimo
+        if cambiati is None:
+            nomi_addetti = vecchio['addetti'].keys() | addetti.keys()
+            nomi_negozi = vecchio['negozi'].keys() | negozi.keys()
+            confronta_turni = True
+        else:
+            nomi_addetti = {nome for tipo, nome in cambiati if tipo == 'addetto'}
+            nomi_negozi = {nome for tipo, nome in cambiati if tipo == 'negozio'}
+            confronta_turni = any(tipo == 'turni' for tipo, nome in cambiati)
+        # Voci di self._ultimo da aggiornare dopo il commit (None = elemento eliminato)
+        aggiornamenti = {'addetti': {}, 'ferie': {}, 'negozi': {}}
+        addetti_eliminati, righe_addetti, ferie_rimosse, ferie_aggiunte = [], [], [], []
+        for nome in sorted(nomi_addetti):
+            info = addetti.get(nome)
+            if info is None:
+                if nome in vecchio['addetti']:
+                    addetti_eliminati.append((nome,)) # Le ferie seguono (ON DELETE CASCADE)
+                aggiornamenti['addetti'][nome] = aggiornamenti['ferie'][nome] = None
+                continue
+            riga = self._riga_addetto(nome, info)
+            if vecchio['addetti'].get(nome) != riga:
+                righe_addetti.append(riga)
+                aggiornamenti['addetti'][nome] = riga
+            ferie = tuple(map(tuple, info.get('ferie', [])))
+            precedenti = vecchio['ferie'].get(nome, ())
+            if ferie != precedenti: # Solo qui gli intervalli vengono espansi in giorni
+                giorni, giorni_precedenti = set(GestioneTurni._date_ferie(ferie)), set(GestioneTurni._date_ferie(precedenti))
+                ferie_rimosse.extend((nome, data) for data in sorted(giorni_precedenti - giorni))
+                ferie_aggiunte.extend((nome, data) for data in sorted(giorni - giorni_precedenti))
+            if ferie != precedenti or nome not in vecchio['ferie']:
+                aggiornamenti['ferie'][nome] = ferie
+        righe_negozi, negozi_eliminati = [], []
+        for nome in sorted(nomi_negozi):
+            if nome not in negozi:
+                if nome in vecchio['negozi']:
+                    negozi_eliminati.append((nome,))
+                aggiornamenti['negozi'][nome] = None
+                continue
+            configurazione = json.dumps(negozi[nome], sort_keys=True)
+            if vecchio['negozi'].get(nome) != configurazione:
+                righe_negozi.append((nome, configurazione))
+                aggiornamenti['negozi'][nome] = configurazione
+        nuovi_turni = [tuple(turno) for turno in turni] if confronta_turni else vecchio['turni']
+
+        scritture = [
+            ('DELETE FROM addetti WHERE nome = ?', addetti_eliminati),
+            ('INSERT INTO addetti (nome, ore_contratto, ore_max, straordinario, giorni_riposo, altri) '
+             'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(nome) DO UPDATE SET '
+             'ore_contratto = excluded.ore_contratto, ore_max = excluded.ore_max, '
+             'straordinario = excluded.straordinario, giorni_riposo = excluded.giorni_riposo, '
+             'altri = excluded.altri', righe_addetti),
+            ('DELETE FROM ferie WHERE addetto = ? AND data = ?', ferie_rimosse),
+            ('INSERT OR IGNORE INTO ferie (addetto, data) VALUES (?, ?)', ferie_aggiunte),
+        ]
+        # Turni: pochi e ordinati, si riscrivono solo se la lista è cambiata
+        if nuovi_turni != vecchio['turni']:
+            scritture.append(('DELETE FROM turni', [()]))
+            scritture.append(('INSERT INTO turni (posizione, inizio, fine) VALUES (?, ?, ?)',
+                              [(posizione, inizio, fine) for posizione, (inizio, fine) in enumerate(nuovi_turni)]))
+        scritture.append(('DELETE FROM negozi WHERE nome = ?', negozi_eliminati))
+        scritture.append(('INSERT OR REPLACE INTO negozi (nome, configurazione) VALUES (?, ?)', righe_negozi))
+
+        righe_scritte = 0
+        with self._lock:
+            try:
+                with self._connessione as c:
+                    c.execute('BEGIN IMMEDIATE') # Blocca i salvataggi delle altre istanze fino al commit
+                    revisione = c.execute('SELECT valore FROM revisione').fetchone()[0]
+                    if revisione != self._revisione:
+                        raise ConflittoArchivio("I dati sono stati modificati da un'altra istanza dell'applicazione.")
+                    for istruzione, parametri in scritture:
+                        if parametri:
+                            c.executemany(istruzione, parametri)
+                            righe_scritte += len(parametri)
+                    if voce_giornale is not None:
+                        testo_voce = json.dumps({chiave: valore for chiave, valore in voce_giornale.items() if chiave != 'seq'})
+                        voce_giornale['seq'] = c.execute('INSERT INTO giornale (voce) VALUES (?)', (testo_voce,)).lastrowid
+                    c.execute('UPDATE revisione SET valore = ?', (revisione + 1,))
+            except sqlite3.IntegrityError as e: # Riferimento a righe eliminate altrove: stessa situazione
+                raise ConflittoArchivio(f"I dati sono stati modificati da un'altra istanza dell'applicazione ({e}).") from e
+        for tabella, valori in aggiornamenti.items():
+            for nome, valore in valori.items():
+                if valore is None:
+                    self._ultimo[tabella].pop(nome, None)
+                else:
+                    self._ultimo[tabella][nome] = valore
+        self._ultimo['turni'] = nuovi_turni
+        self._revisione = revisione + 1
+        return righe_scritte
+
+    def leggi_giornale(self, limite):
+        """Le ultime `limite` voci del giornale delle modifiche, dalla più vecchia."""
+        with self._lock:
+            righe = self._connessione.execute(
+                'SELECT seq, voce FROM giornale ORDER BY seq DESC LIMIT ?', (limite,)).fetchall()
+        return [dict(json.loads(voce), seq=seq) for seq, voce in reversed(righe)]
+
+    def compatta_giornale(self, mantieni):
+        """Elimina le voci del giornale tranne le ultime `mantieni`."""
+        with self._lock, self._connessione as c:
+            c.execute('DELETE FROM giornale WHERE seq <= (SELECT MAX(seq) FROM giornale) - ?', (mantieni,))
+
+    @staticmethod
+    def _limiti_mese(anno, mese):
+        return f"{anno:04d}-{mese:02d}-01", f"{anno:04d}-{mese:02d}-{calendar.monthrange(anno, mese)[1]:02d}"
+
+    def salva_pianificazione(self, anno, mese, negozio, righe):
+        """
+        Sostituisce la pianificazione di un mese (di un negozio) in un'unica transazione.
+        `righe`: (data, addetto, stato, inizio, fine, ore) come in EsportatoreSQLite.
+        """
+        primo, ultimo = self._limiti_mese(anno, mese)
+        with self._lock, self._connessione as c:
+            c.execute('DELETE FROM pianificazioni WHERE negozio = ? AND data BETWEEN ? AND ?', (negozio or '', primo, ultimo))
+            c.executemany('INSERT INTO pianificazioni (negozio, data, addetto, stato, inizio, fine, ore) '
+                          'VALUES (?, ?, ?, ?, ?, ?, ?)', [(negozio or '',) + tuple(riga) for riga in righe])
+
+    def carica_pianificazione(self, anno, mese, negozio=None):
+        """Calendario di un mese archiviato nel formato del motore ({giorno: {addetto: (inizio, fine) | stato}}); {} se assente."""
+        primo, ultimo = self._limiti_mese(anno, mese)
+        calendario = {}
+        with self._lock:
+            for data, addetto, stato, inizio, fine in self._connessione.execute(
+                    'SELECT data, addetto, stato, inizio, fine FROM pianificazioni '
+                    'WHERE negozio = ? AND data BETWEEN ? AND ?', (negozio or '', primo, ultimo)):
+                calendario.setdefault(int(data[8:10]), {})[addetto] = (inizio, fine) if stato == 'TURNO' else stato
+        return calendario
+
+    def mesi_salvati(self):
+        """Elenco (negozio, anno, mese) delle pianificazioni archiviate; negozio None per il negozio unico."""
+        with self._lock:
+            righe = self._connessione.execute(
+                "SELECT DISTINCT negozio, substr(data, 1, 7) FROM pianificazioni ORDER BY 2, 1").fetchall()
+        return [(negozio or None, int(anno_mese[:4]), int(anno_mese[5:7])) for negozio, anno_mese in righe]
+
+    def ore_per_addetto(self, data_inizio, data_fine):
+        """{addetto: (giorni lavorati, ore)} tra due date 'YYYY-MM-DD' incluse, su tutti i negozi."""
+        with self._lock:
+            righe = self._connessione.execute(
+                "SELECT addetto, COUNT(*), SUM(ore) FROM pianificazioni "
+                "WHERE data BETWEEN ? AND ? AND stato = 'TURNO' GROUP BY addetto ORDER BY addetto",
+                (data_inizio, data_fine)).fetchall()
+        return {addetto: (giorni, ore or 0.0) for addetto, giorni, ore in righe}
+
+
+# ==========================================================================
+#               PIPELINE DI ESPORTAZIONE: DESTINAZIONI
+# ==========================================================================
+class DestinazioneEsportazione:
+    """
+    Destinazione della pipeline generazione -> esportazione.
+    Riceve i giorni man mano che vengono generati, in un'unica passata:
+    inizia_mese -> scrivi_giorno (per ogni giorno) -> termina_mese, e infine chiudi.
+    `motore` è l'istanza GestioneTurni che ha generato il mese (addetti, festività...).
+    """
+
+    def inizia_mese(self, motore, anno, mese):
+        pass
+
+    def scrivi_giorno(self, data, turni_giorno):
+        pass
+
+    def termina_mese(self, anno, mese):
+        pass
+
+    def chiudi(self, completato=True):
+        """Chiamata sempre alla fine; `completato` è False se la pipeline è stata interrotta."""
+        pass
+
+
+class EsportatoreExcel(DestinazioneEsportazione):
+    """
+    Scrive un file Excel per mese, riga per riga, con un workbook write-only.
+    Con `modello` (predefinito) stili, larghezze e colori degli stati vengono dal modello
+    Excel (_leggi_modello_excel): le celle ricevono uno stile base e la colorazione per stato
+    è affidata alle regole di formattazione condizionale di Excel. Con modello=False ogni
+    cella riceve lo stile del proprio stato, calcolato in Python.
+    Con `copertura` aggiunge dopo il foglio dei turni una heatmap della copertura
+    (addetti presenti per giorno e fascia di 15 minuti), calcolata durante la scrittura.
+    """
+
+    def __init__(self, percorso=None, negozio=None, copertura=True, modello=True):
+        # percorso: None = Desktop (Turni_<Mese>_<Anno>.xlsx), stringa fissa, o funzione (anno, mese) -> percorso
+        self.percorso = percorso
+        self.negozio = negozio
+        self.file_salvati = []
+        self._wb = None
+        self._copertura = AccumulatoreCopertura() if copertura else None
+        self._usa_modello = modello
+        self._modello = None
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        self._wb = openpyxl.Workbook(write_only=True)
+        self._registra_stili(motore)
+        try:
+            nome_mese = calendar.month_name[mese]
+        except IndexError:
+            nome_mese = f"Mese {mese}" # Fallback
+        self._crea_foglio_mese(anno, mese, f"Turni {nome_mese} {anno}")
+
+    def _registra_stili(self, motore):
+        """Registra nel workbook corrente gli stili con nome: quelli del modello o quelli per stato."""
+        if self._usa_modello:
+            self._modello = motore._leggi_modello_excel()
+            self._stili = {}
+            for chiave, stile in self._modello['stili'].items():
+                self._wb.add_named_style(copy.copy(stile))
+                self._stili[chiave] = stile.name
+        else:
+            self._stili = motore._registro_stili_excel(self._wb)
+
+    def _crea_foglio_mese(self, anno, mese, titolo):
+        """Crea nel workbook corrente il foglio di un mese, con intestazione e larghezze colonne."""
+        motore = self._motore
+        self._festivi = motore._get_festivi_mese(anno, mese)
+        modello = self._modello or {'zoom': 85, 'blocca': 'A2', 'larghezza_data': 15, 'larghezza_addetti': 18}
+
+        # Impostazioni di base del foglio
+        self._ws = self._wb.create_sheet(title=titolo)
+        self._ws.sheet_view.zoomScale = modello['zoom']
+        self._ws.freeze_panes = modello['blocca'] # Congela la prima riga (header)
+
+        # Larghezze colonne (da impostare prima di scrivere le righe)
+        self._nomi_addetti = sorted(motore.addetti.keys())
+        self._ws.column_dimensions['A'].width = modello['larghezza_data']
+        for col in range(2, len(self._nomi_addetti) + 2):
+            self._ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = modello['larghezza_addetti'] # Larghezza colonne addetti
+        self._righe_per_tipo = {'weekend': [], 'festivo': []} # Righe da colorare con le regole del modello
+        self._riga_corrente = 1
+
+        # Intestazione: Data + nomi addetti
+        self._ws.append([self._cella("Data", 'header')] +
+                        [self._cella(addetto, 'header') for addetto in self._nomi_addetti])
+
+        if self._copertura is not None:
+            self._copertura.inizia_mese(motore, anno, mese)
+
+    def _cella(self, valore, chiave_stile):
+        cella = openpyxl.cell.WriteOnlyCell(self._ws, value=valore)
+        cella.style = self._stili[chiave_stile]
+        return cella
+
+    def scrivi_giorno(self, data, turni_giorno):
+        # Colore di sfondo della riga: festivo ha priorità sul weekend
+        if data.strftime('%d-%m') in self._festivi:
+            tipo_giorno = 'festivo'
+        elif data.weekday() >= 5: # Sabato=5, Domenica=6
+            tipo_giorno = 'weekend'
+        else:
+            tipo_giorno = ''
+
+        riga = [self._cella(f"{data.day:02d}/{data.month:02d}/{data.year} ({data.strftime('%a')})",
+                            f"data_{tipo_giorno}" if tipo_giorno else 'data')]
+        self._riga_corrente += 1
+        if self._modello is not None:
+            # Solo testo + stile base della riga: i colori per stato li applica Excel
+            if tipo_giorno:
+                self._righe_per_tipo[tipo_giorno].append(self._riga_corrente)
+            testo_cella = self._motore._testo_cella
+            riga += [self._cella(testo_cella(turni_giorno.get(addetto, '-')), 'cella') for addetto in self._nomi_addetti]
+        else:
+            for addetto in self._nomi_addetti:
+                # Default a '-' se manca l'addetto quel giorno
+                testo_cella, chiave_stile = self._motore._testo_e_stile_cella(turni_giorno.get(addetto, '-'), tipo_giorno)
+                riga.append(self._cella(testo_cella, chiave_stile))
+        self._ws.append(riga)
+        if self._copertura is not None:
+            self._copertura.scrivi_giorno(data, turni_giorno)
+
+    def _scrivi_foglio_copertura(self, anno, mese, titolo):
+        """
+        Scrive la heatmap di copertura del mese: una riga per giorno, una colonna per fascia
+        di 15 minuti, più minimo e massimo del giorno e una riga con la media per fascia.
+        I colori sono una scala di Excel (rosso = nessuno, giallo = mediana, verde = massimo).
+        """
+        matrice = self._copertura.per_mese[(anno, mese)]
+        etichette = self._copertura.etichette_fasce
+        if not etichette:
+            return # Orari negozio non validi: nessuna fascia
+        ws = self._wb.create_sheet(title=titolo)
+        ws.sheet_view.zoomScale = 85
+        ws.freeze_panes = 'B2'
+        ws.column_dimensions['A'].width = 15
+        for col in range(2, len(etichette) + 2):
+            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 6
+        ws.column_dimensions[openpyxl.utils.get_column_letter(len(etichette) + 2)].width = 9
+        ws.column_dimensions[openpyxl.utils.get_column_letter(len(etichette) + 3)].width = 9
+
+        def cella(valore, chiave_stile):
+            c = openpyxl.cell.WriteOnlyCell(ws, value=valore)
+            c.style = self._stili[chiave_stile]
+            return c
+
+        ws.append([cella("Giorno", 'header')] + [cella(etichetta, 'header') for etichetta in etichette] +
+                  [cella("Minimo", 'header'), cella("Massimo", 'header')])
+        minimi, massimi = matrice.min(axis=1), matrice.max(axis=1)
+        for indice, conteggi in enumerate(matrice.tolist()):
+            data = datetime(anno, mese, indice + 1)
+            ws.append([cella(f"{data.day:02d}/{data.month:02d}/{data.year} ({data.strftime('%a')})", 'data')] +
+                      [cella(valore, 'cella') for valore in conteggi] +
+                      [cella(int(minimi[indice]), 'cella'),
+                       cella(int(massimi[indice]), 'cella')])
+        ws.append([cella("Media", 'header')] +
+                  [cella(round(float(media), 1), 'cella') for media in matrice.mean(axis=0)])
+
+        area = f"B2:{openpyxl.utils.get_column_letter(len(etichette) + 1)}{len(matrice) + 1}"
+        ws.conditional_formatting.add(area, openpyxl.formatting.rule.ColorScaleRule(
+            start_type='num', start_value=0, start_color='F8696B',
+            mid_type='percentile', mid_value=50, mid_color='FFEB84',
+            end_type='max', end_color='63BE7B'))
+        # Minimo del giorno a zero = almeno una fascia scoperta
+        colonna_minimo = openpyxl.utils.get_column_letter(len(etichette) + 2)
+        ws.conditional_formatting.add(f"{colonna_minimo}2:{colonna_minimo}{len(matrice) + 1}", openpyxl.formatting.rule.CellIsRule(
+            operator='equal', formula=['0'], fill=openpyxl.styles.PatternFill(start_color=self._motore.colori['errore'],
+                                                              end_color=self._motore.colori['errore'], fill_type='solid'),
+            font=openpyxl.styles.Font(color='FFFFFF', bold=True)))
+
+    def _applica_regole_modello(self):
+        """
+        Aggiunge al foglio del mese le regole del modello: prima quelle per stato (sull'intera
+        area dei turni), poi il colore delle righe di weekend e festivi (dallo stile delle
+        celle di esempio del modello), che vale per le celle senza un colore di stato.
+        """
+        if self._modello is None or not self._nomi_addetti or self._riga_corrente < 2:
+            return
+        ultima_colonna = openpyxl.utils.get_column_letter(len(self._nomi_addetti) + 1)
+        area = f"B2:{ultima_colonna}{self._riga_corrente}"
+        for regola in self._modello['regole']:
+            self._ws.conditional_formatting.add(area, copy.deepcopy(regola))
+        for tipo_giorno, righe in self._righe_per_tipo.items():
+            riempimento = self._modello['stili'][f"cella_{tipo_giorno}"].fill
+            if righe and riempimento is not None and riempimento.fill_type:
+                area_righe = " ".join(f"B{riga}:{ultima_colonna}{riga}" for riga in righe)
+                self._ws.conditional_formatting.add(area_righe, openpyxl.formatting.rule.FormulaRule(formula=['TRUE'], fill=copy.copy(riempimento)))
+
+    def termina_mese(self, anno, mese):
+        self._applica_regole_modello()
+        if self._copertura is not None:
+            self._scrivi_foglio_copertura(anno, mese, "Copertura")
+        if callable(self.percorso):
+            nome_file = self.percorso(anno, mese)
+        else:
+            nome_file = self.percorso or self._motore._percorso_file_turni(anno, mese, self.negozio)
+        self._wb.save(nome_file)
+        self.file_salvati.append(nome_file)
+        self._wb = None
+
+    def chiudi(self, completato=True):
+        self._scarta_workbook() # Un mese interrotto non viene salvato
+
+    def _scarta_workbook(self):
+        """Abbandona il workbook non salvato, chiudendo i file temporanei dei fogli write-only."""
+        if self._wb is not None:
+            for ws in self._wb.worksheets:
+                if not ws.closed:
+                    ws.close()
+            self._wb = None
+
+
+class EsportatoreExcelAnnuale(EsportatoreExcel):
+    """
+    Scrive tutti i mesi della pipeline in un unico file Excel: un foglio per mese
+    più un foglio "Riepilogo" (il primo) con i totali per addetto calcolati dal motore.
+    I fogli sono write-only e vengono scritti in streaming, un mese alla volta;
+    il file viene salvato in chiudi(), solo se la pipeline è stata completata.
+    """
+    VOCI_RIEPILOGO = (('ore', "Ore Totali"), ('turni', "Turni"), ('giorni_lavorati', "Giorni Lavorati"),
+                      ('ferie', "Ferie"), ('riposi', "Riposi"), ('domeniche_lavorate', "Domeniche Lavorate"),
+                      ('festivi_lavorati', "Festivi Lavorati"), ('errori', "Errori"))
+
+    def __init__(self, percorso, negozio=None, copertura=True, modello=True):
+        super().__init__(percorso, negozio, copertura, modello)
+        self._statistiche = AccumulatoreStatistiche()
+        self._mesi = []
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        if self._wb is None:
+            self._wb = openpyxl.Workbook(write_only=True)
+            self._registra_stili(motore)
+            # Creato per primo (primo foglio del file), riempito alla fine
+            self._ws_riepilogo = self._wb.create_sheet(title="Riepilogo")
+        try:
+            nome_mese = calendar.month_name[mese]
+        except IndexError:
+            nome_mese = f"Mese {mese}" # Fallback
+        self._crea_foglio_mese(anno, mese, f"{nome_mese} {anno}")
+        self._statistiche.inizia_mese(motore, anno, mese)
+        self._mesi.append((anno, mese, nome_mese))
+
+    def scrivi_giorno(self, data, turni_giorno):
+        super().scrivi_giorno(data, turni_giorno)
+        self._statistiche.scrivi_giorno(data, turni_giorno)
+
+    def termina_mese(self, anno, mese):
+        # Il file viene salvato in chiudi(), dopo l'ultimo mese
+        self._applica_regole_modello()
+        if self._copertura is not None:
+            _, _, nome_mese = self._mesi[-1]
+            self._scrivi_foglio_copertura(anno, mese, f"Copertura {nome_mese[:3]} {anno}")
+
+    def _scrivi_riepilogo(self):
+        """Scrive il foglio Riepilogo: ore per mese e totali del periodo per ogni addetto."""
+        ws = self._ws_riepilogo
+        ws.freeze_panes = 'B2'
+        ws.column_dimensions['A'].width = 18
+        num_colonne = len(self._mesi) + len(self.VOCI_RIEPILOGO)
+        for col in range(2, num_colonne + 2):
+            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 14
+
+        def cella(valore, chiave_stile):
+            c = openpyxl.cell.WriteOnlyCell(ws, value=valore)
+            c.style = self._stili[chiave_stile]
+            return c
+
+        intestazione = ["Addetto"] + [f"Ore {nome_mese[:3]} {anno}" for anno, _, nome_mese in self._mesi]
+        ws.append([cella(testo, 'header') for testo in intestazione + [titolo for _, titolo in self.VOCI_RIEPILOGO]])
+
+        per_mese = self._statistiche.per_mese
+        nomi_addetti = sorted({nome for statistiche_mese in per_mese.values() for nome in statistiche_mese})
+        for nome in nomi_addetti:
+            totali = self._motore._nuove_statistiche_addetto()
+            riga = [cella(nome, 'data')]
+            for anno, mese, _ in self._mesi:
+                statistiche = per_mese[(anno, mese)].get(nome)
+                riga.append(cella(round(statistiche['ore'], 2) if statistiche else None, 'cella'))
+                for voce in totali:
+                    if statistiche:
+                        totali[voce] += statistiche[voce]
+            totali['ore'] = round(totali['ore'], 2)
+            riga += [cella(totali[voce], 'cella') for voce, _ in self.VOCI_RIEPILOGO]
+            ws.append(riga)
+
+        # Errori evidenziati da una regola di Excel (l'ultima colonna è "Errori")
+        colonna_errori = openpyxl.utils.get_column_letter(num_colonne + 1)
+        colore_errore = self._motore.colori['errore']
+        ws.conditional_formatting.add(f"{colonna_errori}2:{colonna_errori}{len(nomi_addetti) + 1}", openpyxl.formatting.rule.CellIsRule(
+            operator='greaterThan', formula=['0'], fill=openpyxl.styles.PatternFill(start_color=colore_errore, end_color=colore_errore,
+                                                                    fill_type='solid'),
+            font=openpyxl.styles.Font(color='FFFFFF', bold=True)))
+
+    def chiudi(self, completato=True):
+        if completato and self._wb is not None and self._mesi:
+            self._scrivi_riepilogo()
+            anno, mese, _ = self._mesi[0]
+            nome_file = self.percorso(anno, mese) if callable(self.percorso) else self.percorso
+            self._wb.save(nome_file)
+            self.file_salvati.append(nome_file)
+            self._wb = None
+        self._scarta_workbook()
+
+
+class EsportatoreFileMensile(DestinazioneEsportazione):
+    """
+    Base per gli esportatori che scrivono un file per mese (CSV, JSON...).
+    Il file viene scritto in <nome>.tmp e rinominato solo a mese completato:
+    un mese interrotto non lascia file parziali.
+    """
+    ESTENSIONE = ''
+
+    def __init__(self, percorso=None, negozio=None):
+        # percorso: None = accanto all'Excel (Turni_<Mese>_<Anno><ESTENSIONE>) o funzione (anno, mese) -> percorso
+        self.percorso = percorso
+        self.negozio = negozio
+        self.file_salvati = []
+        self._file = None
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        if callable(self.percorso):
+            self._nome_file = self.percorso(anno, mese)
+        else:
+            self._nome_file = motore._percorso_base_turni(anno, mese, self.negozio) + self.ESTENSIONE
+        self._file = self._apri(self._nome_file + '.tmp', motore, anno, mese)
+
+    def _apri(self, nome_tmp, motore, anno, mese):
+        """Apre il file temporaneo del mese e ne scrive l'intestazione; restituisce l'oggetto file."""
+        raise NotImplementedError
+
+    def _completa(self):
+        """Scrive la coda del file prima della chiusura (se il formato la prevede)."""
+        pass
+
+    def termina_mese(self, anno, mese):
+        self._completa()
+        self._file.close()
+        self._file = None
+        os.replace(self._nome_file + '.tmp', self._nome_file)
+        self.file_salvati.append(self._nome_file)
+
+    def chiudi(self, completato=True):
+        if self._file is not None: # Mese interrotto: elimina il file parziale
+            self._file.close()
+            self._file = None
+            os.remove(self._nome_file + '.tmp')
+
+
+class EsportatoreCSV(EsportatoreFileMensile):
+    """
+    Scrive un CSV per mese in formato "lungo": una riga per addetto e giorno,
+    colonne data, addetto, stato, inizio_min, fine_min, ore.
+    """
+    ESTENSIONE = '.csv'
+
+    def _apri(self, nome_tmp, motore, anno, mese):
+        file = open(nome_tmp, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(file)
+        self._writer.writerow(COLONNE_FORMATO_LUNGO)
+        return file
+
+    def scrivi_giorno(self, data, turni_giorno):
+        self._writer.writerows(self._motore._righe_formato_lungo(data, turni_giorno))
+
+
+class EsportatoreJSONL(EsportatoreFileMensile):
+    """
+    Scrive un file JSON Lines per mese nel formato "lungo": un oggetto per riga
+    con le chiavi data, addetto, stato, inizio_min, fine_min, ore (null se assenti).
+    """
+    ESTENSIONE = '.jsonl'
+
+    def _apri(self, nome_tmp, motore, anno, mese):
+        return open(nome_tmp, 'w', encoding='utf-8')
+
+    def scrivi_giorno(self, data, turni_giorno):
+        for riga in self._motore._righe_formato_lungo(data, turni_giorno):
+            self._file.write(json.dumps(dict(zip(COLONNE_FORMATO_LUNGO, riga)), ensure_ascii=False) + '\n')
+
+
+class EsportatoreParquet(EsportatoreFileMensile):
+    """
+    Scrive un file Parquet per mese nel formato "lungo" (richiede pyarrow, opzionale).
+    Tipi: data date32, addetto/stato string, inizio_min/fine_min int16 (null se assenti),
+    ore float64. Le righe del mese vengono raccolte e scritte come un unico row group.
+    """
+    ESTENSIONE = '.parquet'
+
+    def __init__(self, percorso=None, negozio=None):
+        if not PYARROW_DISPONIBILE:
+            raise RuntimeError("Esportazione Parquet non disponibile: installare il pacchetto 'pyarrow'.")
+        super().__init__(percorso, negozio)
+
+    def _apri(self, nome_tmp, motore, anno, mese):
+        self._colonne = {nome: [] for nome in COLONNE_FORMATO_LUNGO}
+        self._schema = _schema_parquet_formato_lungo()
+        return pq.ParquetWriter(nome_tmp, self._schema)
+
+    def scrivi_giorno(self, data, turni_giorno):
+        righe = self._motore._righe_formato_lungo(data, turni_giorno)
+        for nome, valori in zip(COLONNE_FORMATO_LUNGO, zip(*righe)):
+            self._colonne[nome].extend(valori)
+
+    def _completa(self):
+        self._colonne['data'] = [datetime.strptime(d, '%Y-%m-%d').date() for d in self._colonne['data']]
+        self._file.write_table(pa.table(self._colonne, schema=self._schema))
+
+
+class EsportatoreJSON(EsportatoreFileMensile):
+    """
+    Scrive, accanto all'Excel, un file JSON "sidecar" per mese con il calendario
+    completo (Turni_<Mese>_<Anno>.json): rileggerlo è molto più rapido che
+    interpretare il file Excel. I giorni vengono scritti man mano che arrivano.
+    """
+    ESTENSIONE = '.json'
+    FORMATO = 'turni-v1'
+
+    def _apri(self, nome_tmp, motore, anno, mese):
+        file = open(nome_tmp, 'w', encoding='utf-8')
+        intestazione = {'formato': self.FORMATO, 'anno': anno, 'mese': mese,
+                        'negozio': self.negozio, 'addetti': sorted(motore.addetti)}
+        # Scrive l'intestazione lasciando aperto l'oggetto "giorni"
+        file.write(json.dumps(intestazione)[:-1] + ', "giorni": {')
+        self._primo_giorno = True
+        return file
+
+    def scrivi_giorno(self, data, turni_giorno):
+        separatore = '' if self._primo_giorno else ', '
+        self._file.write(f'{separatore}"{data.day}": {json.dumps(turni_giorno)}')
+        self._primo_giorno = False
+
+    def _completa(self):
+        self._file.write('}}')
+
+
+class EsportatoreSQLite(DestinazioneEsportazione):
+    """
+    Archivia le pianificazioni generate nell'archivio SQLite, una riga per addetto e giorno.
+    Ogni mese viene scritto in un'unica transazione a mese completato (sostituendo
+    l'eventuale versione precedente): un mese interrotto non viene archiviato.
+    """
+
+    def __init__(self, archivio, negozio=None):
+        self.archivio = archivio
+        self.negozio = negozio
+        self._righe = None
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        self._righe = []
+
+    def scrivi_giorno(self, data, turni_giorno):
+        data_str = data.strftime('%Y-%m-%d')
+        for nome, stato_turno in turni_giorno.items():
+            if nome.startswith('ERRORE'): # Chiavi di servizio (errori di copertura), non addetti
+                continue
+            if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+                inizio_min = self._motore._get_orario_in_minuti(stato_turno[0])
+                fine_min = self._motore._get_orario_in_minuti(stato_turno[1])
+                if inizio_min is not None and fine_min is not None:
+                    durata_min = fine_min - inizio_min
+                    if durata_min < 0: durata_min += 24 * 60 # Mezzanotte
+                    self._righe.append((data_str, nome, 'TURNO', stato_turno[0], stato_turno[1],
+                                        round(durata_min / 60.0, 2)))
+                    continue
+                stato_turno = 'ERRORE'
+            self._righe.append((data_str, nome, str(stato_turno), None, None, 0.0))
+
+    def termina_mese(self, anno, mese):
+        self.archivio.salva_pianificazione(anno, mese, self.negozio, self._righe)
+        self._righe = None
+
+    def chiudi(self, completato=True):
+        self._righe = None
+
+
+# Formati aggiuntivi selezionabili nella finestra di generazione (oltre a Excel e JSON)
+FORMATI_ESPORTAZIONE = {'CSV': EsportatoreCSV, 'JSON Lines': EsportatoreJSONL}
+if PYARROW_DISPONIBILE:
+    FORMATI_ESPORTAZIONE['Parquet'] = EsportatoreParquet
+
+
+class EsportatoreICS(DestinazioneEsportazione):
+    """
+    Mantiene un calendario iCalendar (.ics) per addetto, da importare o sottoscrivere
+    nelle app calendario: un evento per turno, eventi di un giorno intero per FERIE/RIPOSO.
+    Ogni file contiene tutti i giorni esportati finora (anche in esecuzioni precedenti):
+    il contenuto compatto è conservato in un indice JSON nella cartella e alla fine
+    vengono riscritti solo i file degli addetti le cui assegnazioni sono cambiate.
+    """
+    NOME_INDICE = 'indice_calendari.json'
+    STATI_GIORNATA_INTERA = {'FERIE': "Ferie", 'RIPOSO': "Riposo"}
+
+    def __init__(self, cartella=None, negozio=None):
+        if cartella is None:
+            cartella = os.path.join(os.path.expanduser("~"), "Desktop", "Calendari_Turni")
+            if negozio:
+                cartella = os.path.join(cartella, negozio)
+        self.cartella = cartella
+        self.negozio = negozio
+        self.file_salvati = [] # Solo i file effettivamente riscritti
+        self._giorni = {}      # {addetto: {'YYYY-MM-DD': ['HH:MM', 'HH:MM'] | 'FERIE' | 'RIPOSO' | None}}
+
+    def inizia_mese(self, motore, anno, mese):
+        for nome in motore.addetti:
+            self._giorni.setdefault(nome, {})
+
+    def scrivi_giorno(self, data, turni_giorno):
+        data_str = data.strftime('%Y-%m-%d')
+        for nome, giorni in self._giorni.items():
+            stato_turno = turni_giorno.get(nome)
+            if isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2:
+                giorni[data_str] = list(stato_turno)
+            elif stato_turno in self.STATI_GIORNATA_INTERA:
+                giorni[data_str] = stato_turno
+            else:
+                giorni[data_str] = None # Nessun evento (rimuove quello di un'esportazione precedente)
+
+    def chiudi(self, completato=True):
+        if not completato or not self._giorni:
+            return
+        os.makedirs(self.cartella, exist_ok=True)
+        percorso_indice = os.path.join(self.cartella, self.NOME_INDICE)
+        try:
+            with open(percorso_indice, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            indice = {}
+
+        for nome, giorni in self._giorni.items():
+            precedenti = indice.get(nome, {})
+            aggiornati = dict(precedenti)
+            for data_str, valore in giorni.items():
+                if valore is None:
+                    aggiornati.pop(data_str, None)
+                else:
+                    aggiornati[data_str] = valore
+            nome_file = os.path.join(self.cartella, self._nome_file_addetto(nome))
+            if aggiornati == precedenti and os.path.exists(nome_file):
+                continue # Nessuna modifica: il file resta com'è
+            GestioneTurni._scrivi_file_atomico(nome_file, self._calendario_ics(nome, aggiornati), newline='')
+            self.file_salvati.append(nome_file)
+            indice[nome] = aggiornati
+
+        GestioneTurni._scrivi_file_atomico(percorso_indice, json.dumps(indice, ensure_ascii=False, sort_keys=True))
+        self._giorni = {}
+
+    def _nome_file_addetto(self, nome):
+        """Nome del file .ics dell'addetto, senza caratteri non validi nei nomi di file."""
+        nome_pulito = ''.join(c if c.isalnum() or c in ' -.' else '_' for c in nome).strip()
+        return f"Turni_{nome_pulito or 'addetto'}.ics"
+
+    @staticmethod
+    def _testo_ics(testo):
+        """Applica l'escape dei caratteri speciali nei valori di testo iCalendar."""
+        return testo.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+    @staticmethod
+    def _piega_riga(riga):
+        """Spezza le righe oltre 75 ottetti come richiesto da RFC 5545 (continuazione con spazio)."""
+        parti = []
+        corrente = ''
+        for carattere in riga:
+            if len((corrente + carattere).encode('utf-8')) > 75:
+                parti.append(corrente)
+                corrente = ' '
+            corrente += carattere
+        parti.append(corrente)
+        return '\r\n'.join(parti)
+
+    def _calendario_ics(self, nome, giorni):
+        """Costruisce il testo del calendario iCalendar di un addetto da {data: turno/stato}."""
+        dtstamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        titolo = f"Turni {nome}" + (f" - {self.negozio}" if self.negozio else "")
+        uid_base = ''.join(c for c in f"{self.negozio or ''}{nome}" if c.isalnum()).lower() or 'addetto'
+        righe = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Gestione Turni//IT', 'CALSCALE:GREGORIAN',
+                 'METHOD:PUBLISH', f"X-WR-CALNAME:{self._testo_ics(titolo)}"]
+        for data_str in sorted(giorni):
+            valore = giorni[data_str]
+            data = datetime.strptime(data_str, '%Y-%m-%d')
+            righe += ['BEGIN:VEVENT', f"UID:{data:%Y%m%d}-{uid_base}@gestione-turni", f"DTSTAMP:{dtstamp}"]
+            if isinstance(valore, list):
+                ora_inizio = datetime.strptime(valore[0], '%H:%M')
+                ora_fine = datetime.strptime(valore[1], '%H:%M')
+                inizio = data.replace(hour=ora_inizio.hour, minute=ora_inizio.minute)
+                fine = data.replace(hour=ora_fine.hour, minute=ora_fine.minute)
+                if fine <= inizio: fine += timedelta(days=1) # Turno oltre la mezzanotte
+                riepilogo = f"Turno {valore[0]}-{valore[1]}"
+                righe += [f"DTSTART:{inizio:%Y%m%dT%H%M%S}", f"DTEND:{fine:%Y%m%dT%H%M%S}"]
+            else:
+                riepilogo = self.STATI_GIORNATA_INTERA[valore]
+                righe += [f"DTSTART;VALUE=DATE:{data:%Y%m%d}",
+                          f"DTEND;VALUE=DATE:{data + timedelta(days=1):%Y%m%d}", 'TRANSP:TRANSPARENT']
+            if self.negozio:
+                righe.append(f"LOCATION:{self._testo_ics(self.negozio)}")
+            righe += [f"SUMMARY:{self._testo_ics(riepilogo)}", 'END:VEVENT']
+        righe.append('END:VCALENDAR')
+        return '\r\n'.join(self._piega_riga(riga) for riga in righe) + '\r\n'
+
+
+class AccumulatoreCopertura(DestinazioneEsportazione):
+    """
+    Calcola durante la generazione la matrice di copertura di ogni mese: giorni x fasce
+    di 15 minuti (dall'apertura alla chiusura), con il numero di addetti presenti.
+    Risultato in `per_mese`: {(anno, mese): array NumPy int16 (num_giorni, num_fasce)};
+    `etichette_fasce`: orari di inizio delle fasce ('HH:MM').
+    """
+
+    def __init__(self):
+        self.per_mese = {}
+        self.etichette_fasce = []
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        self._apertura_min, self._num_fasce = motore._fasce_copertura()
+        self.etichette_fasce = [motore._get_orario_da_minuti(self._apertura_min + i * MINUTI_FASCIA_COPERTURA)
+                                for i in range(self._num_fasce)]
+        self._matrice = np.zeros((calendar.monthrange(anno, mese)[1], self._num_fasce), dtype=np.int16)
+        self.per_mese[(anno, mese)] = self._matrice
+
+    def scrivi_giorno(self, data, turni_giorno):
+        self._matrice[data.day - 1] = self._motore._copertura_giorno(turni_giorno, self._apertura_min, self._num_fasce)
+
+
+class AccumulatoreStatistiche(DestinazioneEsportazione):
+    """
+    Calcola le statistiche per addetto durante la generazione, con le stesse voci
+    della finestra Statistiche, senza rileggere i file prodotti.
+    Risultato in `per_mese`: {(anno, mese): {addetto: {voce: valore}}};
+    `giorni_con_errori`: {(anno, mese): [giorni con errori, anche di copertura]}.
+    """
+
+    def __init__(self):
+        self.per_mese = {}
+        self.giorni_con_errori = {}
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        self._festivi = motore._get_festivi_mese(anno, mese)
+        self._correnti = {nome: motore._nuove_statistiche_addetto() for nome in sorted(motore.addetti)}
+        self.per_mese[(anno, mese)] = self._correnti
+        self._giorni_errore = self.giorni_con_errori[(anno, mese)] = []
+
+    def scrivi_giorno(self, data, turni_giorno):
+        if self._motore._giorno_con_errori(turni_giorno):
+            self._giorni_errore.append(data.day)
+        is_festivo = data.strftime('%d-%m') in self._festivi
+        for nome, statistiche in self._correnti.items():
+            self._motore._aggiorna_statistiche_addetto(statistiche, turni_giorno.get(nome, '-'), data, is_festivo)
+
+
+class AccumulatoreAnteprima(DestinazioneEsportazione):
+    """
+    Raccoglie i giorni generati in forma compatta per l'anteprima a video (mostra_anteprima):
+    `righe` = [(data, tipo_giorno, codici)] con tipo_giorno '', 'weekend' o 'festivo'
+    e codici un array di indici nella tabella `voci` [(testo, chiave_stile)], uno per addetto
+    nell'ordine di `addetti` (gli addetti comparsi in mesi successivi si aggiungono in fondo).
+    `giorni_errore`: indici delle righe con errori (es. copertura incompleta).
+    Conserva anche i calendari ricevuti, per salvarli su file dopo l'anteprima (esporta).
+    """
+
+    def __init__(self):
+        self.addetti = []
+        self.righe = []
+        self.voci = []
+        self.giorni_errore = set()
+        self.calendari = [] # [(motore, anno, mese, calendario)]
+        self._colonne = {}
+        self._indici_voci = {}
+
+    def inizia_mese(self, motore, anno, mese):
+        self._motore = motore
+        self._festivi = motore._get_festivi_mese(anno, mese)
+        self._calendario = {}
+        self.calendari.append((motore, anno, mese, self._calendario))
+        for nome in sorted(motore.addetti):
+            if nome not in self._colonne:
+                self._colonne[nome] = len(self.addetti)
+                self.addetti.append(nome)
+
+    def scrivi_giorno(self, data, turni_giorno):
+        self._calendario[data.day] = turni_giorno
+        if data.strftime('%d-%m') in self._festivi:
+            tipo_giorno = 'festivo'
+        elif data.weekday() >= 5:
+            tipo_giorno = 'weekend'
+        else:
+            tipo_giorno = ''
+        codici = array('H', bytes(2 * len(self.addetti)))
+        for nome, colonna in self._colonne.items():
+            codici[colonna] = self._indice_voce(turni_giorno.get(nome, '-'), tipo_giorno)
+        if self._motore._giorno_con_errori(turni_giorno):
+            self.giorni_errore.add(len(self.righe)) # La data viene evidenziata come in Excel le celle ERR!
+        self.righe.append((data, tipo_giorno, codici))
+
+    def _indice_voce(self, stato_turno, tipo_giorno):
+        """Indice in `voci` della cella (testo, chiave_stile) di uno stato turno in un tipo di giorno."""
+        chiave = (tuple(stato_turno) if isinstance(stato_turno, list) else stato_turno, tipo_giorno)
+        indice = self._indici_voci.get(chiave)
+        if indice is None:
+            indice = self._indici_voci[chiave] = len(self.voci)
+            self.voci.append(self._motore._testo_e_stile_cella(stato_turno, tipo_giorno))
+        return indice
+
+    def modifica_cella(self, indice_riga, colonna, stato_turno, errore_giorno):
+        """Aggiorna una cella dopo una modifica a mano (il calendario lo aggiorna il chiamante)."""
+        _, tipo_giorno, codici = self.righe[indice_riga]
+        codici[colonna] = self._indice_voce(stato_turno, tipo_giorno)
+        if errore_giorno:
+            self.giorni_errore.add(indice_riga)
+        else:
+            self.giorni_errore.discard(indice_riga)
+
+    def esporta(self, destinazioni, annulla=None):
+        """Invia i mesi raccolti alle destinazioni (file), chiudendole alla fine."""
+        completato = False
+        try:
+            for motore, anno, mese, calendario in self.calendari:
+                motore._esporta_calendario(calendario, anno, mese, destinazioni, annulla=annulla, chiudi=False)
+            completato = True
+        finally:
+            for destinazione in destinazioni:
+                destinazione.chiudi(completato)
+
+
+class ValidatoreIncrementale:
+    """
+    Vincoli di una pianificazione modificata a mano (anteprima), aggiornati a ogni modifica
+    senza rieseguire il generatore. Mantiene:
+      - il registro delle ore per (addetto, anno, mese), confrontato con ore_max come nel
+        generatore (chi ha lo straordinario non ha limite);
+      - la copertura di ogni giorno non festivo: addetti presenti per minuto dell'orario di
+        apertura e numero di minuti scoperti;
+      - i problemi di ogni cella: turno in ferie, nel giorno di riposo settimanale o a meno di
+        riposo_minimo_ore dal turno del giorno prima.
+    Una modifica aggiorna solo la cella, la cella del giorno dopo, il mese dell'addetto e la
+    copertura del giorno: il costo non dipende dal numero di addetti e di giorni. Tiene anche
+    aggiornata la chiave ERRORE_COPERTURA del giorno, così i file salvati restano coerenti.
+    `calendari`: [(motore, anno, mese, calendario)] (vedi AccumulatoreAnteprima).
+    """
+
+    def __init__(self, calendari):
+        self._giorni = {}      # {data: (motore, turni_giorno)}
+        self._ore = {}         # {(addetto, anno, mese): ore}
+        self._copertura = {}   # {data: [conteggi per minuto, minuti scoperti, apertura in minuti]}
+        self._problemi = {}    # {(data, addetto): [descrizioni]}
+        self.oltre_max = set() # {(addetto, anno, mese)}
+        for motore, anno, mese, calendario in calendari:
+            festivi = motore._get_festivi_mese(anno, mese)
+            apertura = motore._get_orario_in_minuti(motore.orario_apertura)
+            chiusura = motore._get_orario_in_minuti(motore.orario_chiusura)
+            for giorno in range(1, calendar.monthrange(anno, mese)[1] + 1):
+                data = datetime(anno, mese, giorno)
+                self._giorni[data] = (motore, calendario.setdefault(giorno, {}))
+                if (data.strftime('%d-%m') not in festivi and apertura is not None
+                        and chiusura is not None and chiusura > apertura):
+                    self._copertura[data] = [array('H', bytes(2 * (chiusura - apertura))), chiusura - apertura, apertura]
+        for data, (_, turni_giorno) in self._giorni.items():
+            for nome, stato_turno in turni_giorno.items():
+                if not nome.startswith('ERRORE'):
+                    self._aggiungi(data, nome, stato_turno, +1)
+        for data, (motore, turni_giorno) in self._giorni.items():
+            for nome in turni_giorno:
+                if not nome.startswith('ERRORE'):
+                    self._verifica_cella(data, nome)
+        for (nome, anno, mese) in list(self._ore):
+            self._verifica_ore(nome, anno, mese)
+
+    @staticmethod
+    def _intervallo(motore, stato_turno):
+        """(inizio, fine) in minuti di un turno, con fine > inizio; None se non è un turno."""
+        if not (isinstance(stato_turno, (list, tuple)) and len(stato_turno) == 2):
+            return None
+        inizio_min = motore._get_orario_in_minuti(stato_turno[0])
+        fine_min = motore._get_orario_in_minuti(stato_turno[1])
+        if inizio_min is None or fine_min is None:
+            return None
+        if fine_min < inizio_min: fine_min += 24 * 60 # Mezzanotte
+        return inizio_min, fine_min
+
+    def _aggiungi(self, data, nome, stato_turno, segno):
+        """Aggiunge (segno +1) o toglie (-1) il contributo di un turno a registro ore e copertura."""
+        intervallo = self._intervallo(self._giorni[data][0], stato_turno)
+        if intervallo is None:
+            return
+        inizio_min, fine_min = intervallo
+        chiave = (nome, data.year, data.month)
+        self._ore[chiave] = self._ore.get(chiave, 0.0) + segno * (fine_min - inizio_min) / 60.0
+        copertura = self._copertura.get(data)
+        if copertura is None:
+            return
+        conteggi, _, apertura = copertura
+        for minuto in range(max(inizio_min - apertura, 0), min(fine_min - apertura, len(conteggi))):
+            if segno > 0:
+                if conteggi[minuto] == 0:
+                    copertura[1] -= 1
+                conteggi[minuto] += 1
+            else:
+                conteggi[minuto] -= 1
+                if conteggi[minuto] == 0:
+                    copertura[1] += 1
+
+    def _verifica_cella(self, data, nome):
+        """Ricalcola i problemi della cella (ferie, riposo settimanale, riposo minimo dal giorno prima)."""
+        giorno = self._giorni.get(data)
+        if giorno is None:
+            return
+        motore, turni_giorno = giorno
+        problemi = []
+        info = motore.addetti.get(nome) or {}
+        intervallo = self._intervallo(motore, turni_giorno.get(nome))
+        if intervallo is not None:
+            if motore._in_ferie(motore._ferie_addetto(nome, data.year), data.strftime('%Y-%m-%d')):
+                problemi.append("turno in un giorno di ferie")
+            if data.weekday() in info.get('giorni_riposo', []):
+                problemi.append("turno nel giorno di riposo settimanale")
+            precedente = self._giorni.get(data - timedelta(days=1))
+            if precedente is not None:
+                intervallo_prima = self._intervallo(precedente[0], precedente[1].get(nome))
+                if intervallo_prima is not None:
+                    riposo_ore = (intervallo[0] + 24 * 60 - intervallo_prima[1]) / 60.0
+                    if riposo_ore < motore.riposo_minimo_ore:
+                        problemi.append(f"solo {riposo_ore:g} ore di riposo dal turno del giorno prima "
+                                        f"(minimo {motore.riposo_minimo_ore})")
+        if problemi:
+            self._problemi[(data, nome)] = problemi
+        else:
+            self._problemi.pop((data, nome), None)
+
+    def _verifica_ore(self, nome, anno, mese):
+        """Aggiorna lo stato 'oltre ore_max' dell'addetto nel mese."""
+        motore = self._giorni[datetime(anno, mese, 1)][0]
+        info = motore.addetti.get(nome) or {}
+        chiave = (nome, anno, mese)
+        if not info.get('straordinario', False) and self._ore.get(chiave, 0.0) > info.get('ore_max', 48) + 0.01:
+            self.oltre_max.add(chiave)
+        else:
+            self.oltre_max.discard(chiave)
+
+    def _aggiorna_errore_copertura(self, data):
+        """Imposta o toglie ERRORE_COPERTURA del giorno in base ai minuti scoperti."""
+        turni_giorno = self._giorni[data][1]
+        if not self.giorno_scoperto(data):
+            turni_giorno.pop('ERRORE_COPERTURA', None)
+            return
+        conteggi, _, apertura = self._copertura[data]
+        primo_scoperto = conteggi.index(0)
+        turni_giorno['ERRORE_COPERTURA'] = f"Buco dalle {self._giorni[data][0]._get_orario_da_minuti(apertura + primo_scoperto)}"
+
+    def imposta(self, data, nome, stato_turno):
+        """Assegna `stato_turno` (turno ('HH:MM', 'HH:MM'), 'RIPOSO', 'FERIE', '-') all'addetto nel giorno."""
+        motore, turni_giorno = self._giorni[data]
+        self._aggiungi(data, nome, turni_giorno.get(nome, '-'), -1)
+        turni_giorno[nome] = stato_turno
+        self._aggiungi(data, nome, stato_turno, +1)
+        self._verifica_cella(data, nome)
+        self._verifica_cella(data + timedelta(days=1), nome) # Riposo minimo del turno del giorno dopo
+        self._verifica_ore(nome, data.year, data.month)
+        if data in self._copertura:
+            self._aggiorna_errore_copertura(data)
+
+    def errore_giorno(self, data):
+        """Indica se il giorno contiene errori (copertura incompleta o stati ERRORE)."""
+        motore, turni_giorno = self._giorni[data]
+        return motore._giorno_con_errori(turni_giorno)
+
+    def giorno_scoperto(self, data):
+        copertura = self._copertura.get(data)
+        return copertura is not None and copertura[1] > 0
+
+    def problemi(self, data, nome):
+        """Descrizioni dei vincoli violati dalla cella (inclusa l'eccedenza di ore del mese)."""
+        problemi = list(self._problemi.get((data, nome), []))
+        chiave = (nome, data.year, data.month)
+        if chiave in self.oltre_max and self._intervallo(self._giorni[data][0], self._giorni[data][1].get(nome)) is not None:
+            motore = self._giorni[data][0]
+            problemi.append(f"{self._ore[chiave]:g} ore nel mese oltre il massimo di "
+                            f"{(motore.addetti.get(nome) or {}).get('ore_max', 48)}")
+        return problemi
+
+    def riepilogo(self):
+        """Conteggi per la barra di stato: celle con problemi, addetti/mesi oltre ore_max, giorni scoperti."""
+        return {'celle': len(self._problemi), 'oltre_max': len(self.oltre_max),
+                'giorni_scoperti': sum(1 for copertura in self._copertura.values() if copertura[1] > 0)}
+
+
+# ==========================================================================
+# Funzioni eseguite nei processi di lavoro
+# ==========================================================================
+def _genera_negozio_in_processo(configurazione):
+    """
+    Genera il calendario mensile di un negozio in un processo separato.
+    Riceve e restituisce solo dati semplici (serializzabili con pickle):
+    (negozio, calendario, stato).
+    """
+    motore = GestioneTurni.motore_senza_interfaccia(configurazione)
+    stato = configurazione.get('stato') or motore._nuovo_stato_pianificazione()
+    # Il log dettagliato di più processi si mescolerebbe: lo scartiamo
+    with open(os.devnull, 'w') as nulla, contextlib.redirect_stdout(nulla):
+        calendario = motore._genera_calendario_mensile_refactored(
+            configurazione['anno'], configurazione['mese'], stato=stato)
+    return configurazione['negozio'], calendario, stato
+
+
+def _valuta_scenario_in_processo(configurazione):
+    """
+    Valuta uno scenario What-If in un processo separato.
+    Restituisce la riga della tabella di confronto (dizionario).
+    """
+    motore = GestioneTurni.motore_senza_interfaccia(configurazione)
+    with open(os.devnull, 'w') as nulla, contextlib.redirect_stdout(nulla):
+        metriche = motore._metriche_scenario(
+            configurazione['anno'], configurazione['mese'], configurazione['num_mesi'])
+    metriche['scenario'] = configurazione['scenario']
+    return metriche
+
+
+def _riepilogo_file_in_processo(configurazione):
+    """
+    Analizza un file turni in un processo separato (statistiche aggregate).
+    Restituisce (percorso, voce dell'indice, None) oppure (percorso, None, messaggio di errore).
+    """
+    motore = GestioneTurni.motore_senza_interfaccia(configurazione)
+    try:
+        with open(os.devnull, 'w') as nulla, contextlib.redirect_stdout(nulla):
+            return configurazione['percorso'], motore._analizza_file_turni(configurazione['percorso']), None
+    except Exception as e: # Un file illeggibile non deve fermare gli altri
+        return configurazione['percorso'], None, str(e)
+
+
 # ==========================================================================
 # Avvio dell'applicazione
 # ==========================================================================
-if __name__ == "__main__":
-    # Import aggiuntivi per l'apertura file cross-platform in _salva_calendario_excel
-    import sys
-    import subprocess
+# ==========================================================================
+#               DIAGNOSTICA DEI TEMPI DI AVVIO
+# ==========================================================================
+def _misura_avvio():
+    """
+    Eseguita nel processo figlio di diagnostica_avvio: crea la finestra principale, attende che
+    sia disegnata e stampa su stdout (JSON) i tempi delle fasi e l'istante in cui era pronta.
+    """
+    tempi = {'moduli': time.perf_counter() - INIZIO_AVVIO}
+    try:
+        app = GestioneTurni()
+        app.root.update()
+        tempi = dict(app.tempi_avvio, pronta=time.time())
+        app.root.destroy()
+    except tk.TclError as e: # Nessun display: la finestra non c'è, quindi l'avvio non è misurabile
+        tempi['errore_finestra'] = str(e)
+    tempi['moduli_pesanti_caricati'] = sorted(nome for nome in ('pandas', 'numpy', 'openpyxl', 'pyarrow')
+                                              if nome in sys.modules)
+    print(json.dumps(tempi))
+
+
+def _importazioni_piu_lente(righe_importtime, quante=15):
+    """
+    Dall'output di `python -X importtime` restituisce i moduli importati direttamente (primo livello)
+    con il tempo cumulativo più alto: [(modulo, secondi)].
+    """
+    voci = []
+    for riga in righe_importtime:
+        if not riga.startswith('import time:') or '|' not in riga:
+            continue
+        _, cumulativo, nome = riga[len('import time:'):].split('|')
+        if not cumulativo.strip().isdigit():
+            continue # Riga di intestazione
+        livello = (len(nome) - len(nome.lstrip(' ')) - 1) // 2
+        if livello == 0:
+            voci.append((nome.strip(), int(cumulativo) / 1e6))
+    return sorted(voci, key=lambda voce: voce[1], reverse=True)[:quante]
+
+
+def diagnostica_avvio():
+    """
+    Misura l'avvio a freddo in un processo separato (come all'apertura del programma) e stampa
+    i tempi per fase, le importazioni più lente (come `python -X importtime`) e il confronto con
+    BUDGET_AVVIO_S. Restituisce il codice d'uscita: 0 se il budget è rispettato, 1 se è superato
+    o l'avvio fallisce, 2 se la finestra non si può creare (es. nessun display) e quindi l'avvio
+    non è stato misurato.
+    """
+    comando = [sys.executable, os.path.abspath(__file__), '--misura-avvio']
+    inizio = time.time()
+    esito = subprocess.run(comando, capture_output=True, text=True)
+    if esito.returncode != 0:
+        print(f"Avvio fallito (codice {esito.returncode}):\n{esito.stderr}")
+        return 1
+    tempi = json.loads(esito.stdout.strip().splitlines()[-1])
+    avvio = tempi['pronta'] - inizio if 'pronta' in tempi else None
+
+    # Seconda esecuzione con -X importtime per il dettaglio delle importazioni
+    esito_importazioni = subprocess.run([sys.executable, '-X', 'importtime'] + comando[1:], capture_output=True, text=True)
+
+    print("--- Diagnostica avvio ---")
+    if avvio is not None:
+        print(f"Avvio a freddo fino alla finestra pronta: {avvio:.2f} s (budget {BUDGET_AVVIO_S:.2f} s)")
+    for fase, descrizione in (('moduli', "Interprete e moduli"), ('dati', "Caricamento dati"),
+                              ('finestra', "Finestra principale")):
+        if fase in tempi:
+            print(f"  {descrizione:<24}{tempi[fase]:.3f} s")
+    print(f"Moduli pesanti caricati all'avvio: {', '.join(tempi['moduli_pesanti_caricati']) or 'nessuno'}")
+    print("Importazioni più lente (tempo cumulativo):")
+    for modulo, secondi in _importazioni_piu_lente(esito_importazioni.stderr.splitlines()):
+        print(f"  {modulo:<32}{secondi * 1000:8.1f} ms")
+    if avvio is None:
+        print(f"ATTENZIONE: avvio non misurato, la finestra principale non è stata creata "
+              f"(nessun display?): {tempi['errore_finestra']}")
+        return 2
+    rispettato = avvio <= BUDGET_AVVIO_S
+    print("Budget rispettato." if rispettato else "ATTENZIONE: budget di avvio superato.")
+    return 0 if rispettato else 1
 
+
+if __name__ == "__main__":
+    if '--diagnostica-avvio' in sys.argv[1:]:
+        sys.exit(diagnostica_avvio())
+    if '--misura-avvio' in sys.argv[1:]:
+        _misura_avvio()
+        sys.exit(0)
     app = GestioneTurni()
     app.run()
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Test del file dei dati (dati_turni.json + giornale delle modifiche dati_turni.giornale):
+riapplicazione del giornale al riavvio, righe troncate, annulla/ripristina tra due avvii,
+compattazione e caricamento del vecchio formato con le ferie a date singole.
+Girano senza finestra, su una cartella dati temporanea.
+"""
+import importlib.util
+import json
+import os
+
+import pytest
+
+PERCORSO_MODULO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'gestione-turni-modificato.py')
+_specifica = importlib.util.spec_from_file_location('gestione_turni_modificato', PERCORSO_MODULO)
+gt = importlib.util.module_from_spec(_specifica)
+_specifica.loader.exec_module(gt)
+
+
+@pytest.fixture
+def cartella(tmp_path, monkeypatch):
+    """Cartella dati temporanea (anche come cartella di lavoro, per la compatibilità con dati_turni.json)."""
+    monkeypatch.setattr(gt, 'CARTELLA_DATI', str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gt.messagebox, 'showerror', lambda *args, **kwargs: pytest.fail(f"Errore mostrato: {args}"))
+    return tmp_path
+
+
+def avvia():
+    """Applicazione senza finestra che carica i dati come all'avvio."""
+    app = gt.GestioneTurni.__new__(gt.GestioneTurni)
+    app._inizializza_parametri()
+    app.root = None
+    app.carica_dati()
+    return app
+
+
+def nuovo_addetto(app, nome, **campi):
+    app.addetti[nome] = dict({'ore_contratto': 40, 'ore_max': 48, 'straordinario': False,
+                              'ferie': [], 'giorni_riposo': []}, **campi)
+    app.salva_dati([('addetto', nome)])
+
+
+def righe_giornale(cartella):
+    with open(cartella / 'dati_turni.giornale', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_giornale_riapplicato_al_riavvio(cartella):
+    app = avvia()
+    nuovo_addetto(app, 'Anna')
+    nuovo_addetto(app, 'Bruno', ore_max=30)
+    app.turni_disponibili.append(('08:00', '14:00'))
+    app.salva_dati([('turni', None)])
+
+    assert not (cartella / 'dati_turni.json').exists() # Nessuna istantanea: tutto nel giornale
+    riavviata = avvia()
+    assert riavviata.addetti == app.addetti
+    assert riavviata.turni_disponibili == [['08:00', '14:00']]
+
+
+def test_riga_troncata_scartata(cartella):
+    app = avvia()
+    nuovo_addetto(app, 'Anna')
+    nuovo_addetto(app, 'Bruno')
+    with open(cartella / 'dati_turni.giornale', 'a', encoding='utf-8') as f:
+        f.write('{"seq": 3, "azione": "modif') # Scrittura interrotta a metà riga
+
+    riavviata = avvia()
+    assert sorted(riavviata.addetti) == ['Anna', 'Bruno']
+    righe = righe_giornale(cartella)
+    assert [json.loads(riga)['seq'] for riga in righe] == [1, 2] # Giornale riscritto senza la riga troncata
+
+    nuovo_addetto(riavviata, 'Carla')
+    assert sorted(avvia().addetti) == ['Anna', 'Bruno', 'Carla']
+
+
+def test_annulla_e_ripristina_dopo_riavvio(cartella):
+    app = avvia()
+    nuovo_addetto(app, 'Anna')
+    app.addetti['Anna']['ore_max'] = 30
+    app.salva_dati([('addetto', 'Anna')])
+    app.annulla_modifica()
+    assert app.addetti['Anna']['ore_max'] == 48
+
+    riavviata = avvia()
+    assert riavviata.addetti['Anna']['ore_max'] == 48
+    assert len(riavviata._pila_annulla) == 1 and len(riavviata._pila_ripristina) == 1
+    riavviata.ripristina_modifica()
+    assert riavviata.addetti['Anna']['ore_max'] == 30
+
+    ancora = avvia()
+    assert ancora.addetti['Anna']['ore_max'] == 30
+    ancora.annulla_modifica() # Ore massime
+    ancora.annulla_modifica() # Inserimento dell'addetto
+    assert ancora.addetti == {}
+    assert avvia().addetti == {}
+
+
+def test_compattazione(cartella, monkeypatch):
+    monkeypatch.setattr(gt, 'SOGLIA_COMPATTAZIONE_GIORNALE', 3)
+    monkeypatch.setattr(gt, 'MAX_ANNULLAMENTI', 1) # Il giornale tiene le ultime 4 voci
+    app = avvia()
+    for numero in range(6):
+        nuovo_addetto(app, f"Addetto {numero}")
+
+    with open(cartella / 'dati_turni.json', encoding='utf-8') as f:
+        istantanea = json.load(f)
+    assert istantanea['formato'] == gt.FORMATO_DATI
+    assert istantanea['sequenza_giornale'] == 6
+    assert sorted(istantanea['addetti']) == [f"Addetto {numero}" for numero in range(6)]
+    assert [json.loads(riga)['seq'] for riga in righe_giornale(cartella)] == [3, 4, 5, 6]
+
+    riavviata = avvia() # Le voci già nell'istantanea non vengono riapplicate
+    assert riavviata.addetti == app.addetti
+    riavviata.annulla_modifica()
+    assert 'Addetto 5' not in riavviata.addetti
+    assert 'Addetto 5' not in avvia().addetti
+
+
+def test_vecchio_formato_ferie_a_date_singole(cartella):
+    with open(cartella / 'dati_turni.json', 'w', encoding='utf-8') as f:
+        json.dump({'addetti': {'Anna': {'ore_contratto': 40, 'ore_max': 48, 'straordinario': False,
+                                        'ferie': ['2025-03-05', '2025-03-01', '2025-03-02'],
+                                        'giorni_riposo': [6]}},
+                   'turni': [['08:00', '14:00']]}, f)
+
+    app = avvia()
+    assert app.addetti['Anna']['ferie'] == [['2025-03-01', '2025-03-02'], ['2025-03-05', '2025-03-05']]
+    assert app._in_ferie(app.addetti['Anna']['ferie'], '2025-03-02')
+    assert not app._in_ferie(app.addetti['Anna']['ferie'], '2025-03-03')
+
+    app.addetti['Anna']['giorni_riposo'] = [0]
+    app.salva_dati([('addetto', 'Anna')])
+    voce = json.loads(righe_giornale(cartella)[-1])
+    assert [modifica['nome'] for modifica in voce['modifiche']] == ['Anna']
+    app.compatta_giornale(attendi=True) # Alla prima istantanea il file passa al nuovo formato
+    with open(cartella / 'dati_turni.json', encoding='utf-8') as f:
+        istantanea = json.load(f)
+    assert istantanea['formato'] == gt.FORMATO_DATI
+    assert istantanea['addetti']['Anna']['ferie'] == [['2025-03-01', '2025-03-02'], ['2025-03-05', '2025-03-05']]